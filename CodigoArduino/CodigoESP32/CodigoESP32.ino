@@ -4,8 +4,11 @@
 #include <Adafruit_PN532.h>
 #include <ESP32Servo.h>
 #include <ArduinoJson.h>
+#include <WebSocketsClient.h>
 #include <mbedtls/md.h>
 #include <vector>
+#include <algorithm>
+#include <time.h>
 
 /********** WiFi **********/
 const char* WIFI_SSID     = "ALVAREZ";
@@ -16,6 +19,26 @@ const char* SERVER_HOST = "192.168.1.7";
 const uint16_t SERVER_PORT = 8000;
 const char* URL_NONCE  = "/api/nonce";
 const char* URL_VERIFY = "/api/verify";
+const char* URL_CHALLENGES = "/api/challenges";
+const char* URL_READER_WS = "/ws/reader";   // canal persistente; si no conecta se usa HTTP
+
+/********** Modo offline: allowlist firmada + eventos guardados **********/
+const char* URL_ALLOWLIST = "/api/allowlist";
+const char* URL_ALLOWLIST_DELTA = "/api/allowlist/delta";
+const char* URL_INGEST = "/api/logs/ingest";
+const uint32_t ALLOWLIST_SYNC_MS = 60000;  // deltas (y subida de eventos) cada minuto
+#define OFFLINE_BUFFER 64                  // eventos offline en RAM; se pierde el más viejo
+
+/********** Formato binario (nonce/verify con bytes crudos en vez de JSON hex) **********/
+#define USE_BIN_WIRE 1
+const char* WIRE_MEDIA_TYPE = "application/x-rfid-bin";
+const uint8_t WIRE_VERSION = 1;
+
+/********** Desafíos pre-emitidos (tap = solo /api/verify) **********/
+const char* READER_ID = "PUERTA-1";        // único por lector
+#define CHALLENGE_POOL 4
+const uint32_t CHALLENGE_MARGIN_MS = 5000; // se descartan antes de que venzan en el servidor
+const uint32_t CHALLENGE_REFILL_MS = 2000; // intervalo mínimo entre recargas
 
 /********** Seguridad **********/
 const char* SECRET_KEY = "MiEjemplo";
@@ -41,6 +64,13 @@ int SERVO_CLOSE = 0;
 /********** HTTP **********/
 HTTPClient http;
 
+/********** WebSocket **********/
+WebSocketsClient ws;
+bool wsConnected = false;
+uint32_t wsNextId = 0;
+uint32_t wsWaitingId = 0;   // id del pedido en curso (0 = ninguno)
+String wsReply;
+
 /********** Estados **********/
 enum State { WIFI_CONNECT, NFC_INIT, IDLE, REQUEST_NONCE, POST_VERIFY, ACTUATE, WAIT_BACKOFF };
 State state = WIFI_CONNECT;
@@ -49,9 +79,26 @@ State state = WIFI_CONNECT;
 String lastUIDHex;
 String sessionId;
 String nonceHex;
+bool usingChallenge = false;   // el sessionId actual es un desafío del lector
 uint32_t stateDeadline = 0;
 uint32_t backoffMs = 500;
 
+std::vector<String> allowlist;     // UIDs activos ordenados (hex mayúscula)
+uint32_t allowlistVersion = 0;
+bool allowlistLoaded = false;      // hay una lista usable para decidir offline
+bool allowlistNeedsFull = true;    // sin lista o delta fuera del historial (410)
+uint32_t lastAllowlistSync = 0;
+
+struct OfflineEvent { String eventId; String uid; bool ok; uint64_t fechaMs; };
+std::vector<OfflineEvent> offlineEvents;
+uint32_t bootId = 0;               // prefijo de eventId: único entre reinicios
+uint32_t offlineSeq = 0;
+
+struct Challenge { String sessionId; String nonceHex; uint32_t expiresAt; };
+Challenge challenges[CHALLENGE_POOL];
+int challengeCount = 0;
+uint32_t lastRefill = 0;
+
 /********** Utils **********/
 String toHexUpper(const uint8_t* buf, size_t len) {
   static const char* hex = "0123456789ABCDEF";
@@ -78,9 +125,8 @@ bool hexToBytes(const String& hex, std::vector<uint8_t>& out) {
   return true;
 }
 
-String hmacSha256HexBytes(const uint8_t* data, size_t len) {
+void hmacSha256Bytes(const uint8_t* data, size_t len, unsigned char out[32]) {
   const mbedtls_md_info_t* info = mbedtls_md_info_from_type(MBEDTLS_MD_SHA256);
-  unsigned char out[32];
   mbedtls_md_context_t ctx;
   mbedtls_md_init(&ctx);
   mbedtls_md_setup(&ctx, info, 1);
@@ -88,18 +134,323 @@ String hmacSha256HexBytes(const uint8_t* data, size_t len) {
   mbedtls_md_hmac_update(&ctx, data, len);
   mbedtls_md_hmac_finish(&ctx, out);
   mbedtls_md_free(&ctx);
+}
 
+String hmacSha256HexBytes(const uint8_t* data, size_t len) {
+  unsigned char out[32];
+  hmacSha256Bytes(data, len, out);
   static const char* hex = "0123456789abcdef";
   String h; h.reserve(64);
   for (int i=0;i<32;i++){ h += hex[(out[i]>>4)&0xF]; h += hex[out[i]&0xF]; }
   return h;
 }
 
+// Lee el cuerpo binario completo (Content-Length conocido); -1 si no entra en buf
+int readBody(uint8_t* buf, int cap) {
+  int len = http.getSize();
+  if (len <= 0 || len > cap) return -1;
+  WiFiClient* stream = http.getStreamPtr();
+  return (int)stream->readBytes(buf, len) == len ? len : -1;
+}
+
 String buildURL(const char* path) {
   String url = String("http://") + SERVER_HOST + ":" + String(SERVER_PORT) + path;
   return url;
 }
 
+/********** Nonce / verify por HTTP (una conexión por pedido) **********/
+bool httpRequestNonce() {
+  String url = buildURL(URL_NONCE);
+  url += "?uid=" + lastUIDHex;
+
+  http.setTimeout(1500);
+  if (!http.begin(url)) return false;
+#if USE_BIN_WIRE
+  http.addHeader("Accept", WIRE_MEDIA_TYPE);
+#endif
+
+  bool ok = false;
+  int code = http.GET();
+#if USE_BIN_WIRE
+  // ver(1) | len(1) | sessionId | nonce(16)
+  uint8_t buf[96];
+  int n = code == 200 ? readBody(buf, sizeof(buf)) : -1;
+  if (n >= 2 && buf[0] == WIRE_VERSION && n == 2 + buf[1] + 16) {
+    sessionId = "";
+    for (int i = 0; i < buf[1]; i++) sessionId += (char)buf[2 + i];
+    nonceHex = toHexUpper(buf + 2 + buf[1], 16);
+    ok = true;
+  }
+#else
+  if (code == 200) {
+    StaticJsonDocument<256> doc;
+    if (deserializeJson(doc, http.getString()) == DeserializationError::Ok) {
+      sessionId = (const char*)doc["sessionId"];
+      nonceHex  = (const char*)doc["nonce"];
+      ok = true;
+    }
+  }
+#endif
+  http.end();
+  return ok;
+}
+
+// 1 = OK, 0 = denegado, -1 = sin respuesta válida
+int httpVerify(const std::vector<uint8_t>& uidBytes, const std::vector<uint8_t>& msg) {
+  String url = buildURL(URL_VERIFY);
+  if (!http.begin(url)) return -1;
+
+  int verdict = -1;
+#if USE_BIN_WIRE
+  // ver(1) | len(1) | uid | len(1) | sessionId | hmac(32) | len(1) | readerId
+  http.addHeader("Content-Type", WIRE_MEDIA_TYPE);
+  std::vector<uint8_t> body;
+  body.push_back(WIRE_VERSION);
+  body.push_back((uint8_t)uidBytes.size());
+  body.insert(body.end(), uidBytes.begin(), uidBytes.end());
+  body.push_back((uint8_t)sessionId.length());
+  body.insert(body.end(), sessionId.c_str(), sessionId.c_str() + sessionId.length());
+  unsigned char mac[32];
+  hmacSha256Bytes(msg.data(), msg.size(), mac);
+  body.insert(body.end(), mac, mac + 32);
+  size_t readerLen = usingChallenge ? strlen(READER_ID) : 0;
+  body.push_back((uint8_t)readerLen);
+  body.insert(body.end(), READER_ID, READER_ID + readerLen);
+  int code = http.POST(body.data(), body.size());
+
+  // ver(1) | result(1: 0 OK, 1 DENIED, 2 ERROR) | reason(1) | alias(8 si OK)
+  uint8_t res[16];
+  int n = code > 0 ? readBody(res, sizeof(res)) : -1;
+  if (n >= 3 && res[0] == WIRE_VERSION) verdict = res[1] == 0 ? 1 : 0;
+#else
+  http.addHeader("Content-Type", "application/json");
+  StaticJsonDocument<256> req;
+  req["uid"] = lastUIDHex;
+  req["sessionId"] = sessionId;
+  req["hmac"] = hmacSha256HexBytes(msg.data(), msg.size());
+  if (usingChallenge) req["readerId"] = READER_ID;
+
+  String body; serializeJson(req, body);
+  int code = http.POST(body);
+  if (code > 0) {
+    StaticJsonDocument<256> res;
+    if (deserializeJson(res, http.getString()) == DeserializationError::Ok) {
+      String result = res["result"] | "";
+      verdict = result == "OK" ? 1 : 0;
+    }
+  }
+#endif
+  http.end();
+  return verdict;
+}
+
+/********** Canal WebSocket (/ws/reader): una conexión para todos los taps **********/
+void onWsEvent(WStype_t type, uint8_t* payload, size_t length) {
+  switch (type) {
+    case WStype_CONNECTED:    wsConnected = true;  Serial.println(" Canal WS conectado"); break;
+    case WStype_DISCONNECTED: wsConnected = false; break;
+    case WStype_TEXT: {
+      StaticJsonDocument<64> head;
+      StaticJsonDocument<16> filter; filter["id"] = true;
+      if (deserializeJson(head, payload, length, DeserializationOption::Filter(filter)) != DeserializationError::Ok) break;
+      if ((uint32_t)(head["id"] | 0) == wsWaitingId) {
+        wsReply = String((const char*)payload, length);
+        wsWaitingId = 0;
+      }
+      break;
+    }
+    default: break;
+  }
+}
+
+// Manda el pedido con un id nuevo y espera la respuesta con ese id (o timeout)
+bool wsRequest(JsonDocument& req, JsonDocument& res, uint32_t timeoutMs) {
+  req["id"] = ++wsNextId;
+  wsWaitingId = wsNextId;
+  String text; serializeJson(req, text);
+  if (!ws.sendTXT(text)) { wsWaitingId = 0; return false; }
+  uint32_t t0 = millis();
+  while (wsWaitingId != 0 && millis() - t0 < timeoutMs && wsConnected) {
+    ws.loop();
+    delay(1);
+  }
+  if (wsWaitingId != 0) { wsWaitingId = 0; return false; }
+  return deserializeJson(res, wsReply) == DeserializationError::Ok && !res.containsKey("error");
+}
+
+bool wsRequestNonce() {
+  StaticJsonDocument<128> req; StaticJsonDocument<256> res;
+  req["op"] = "nonce";
+  req["uid"] = lastUIDHex;
+  if (!wsRequest(req, res, 1500)) return false;
+  sessionId = (const char*)res["sessionId"];
+  nonceHex  = (const char*)res["nonce"];
+  return true;
+}
+
+int wsVerify(const std::vector<uint8_t>& msg) {
+  StaticJsonDocument<256> req; StaticJsonDocument<256> res;
+  req["op"] = "verify";
+  req["uid"] = lastUIDHex;
+  req["sessionId"] = sessionId;
+  req["hmac"] = hmacSha256HexBytes(msg.data(), msg.size());
+  if (usingChallenge) req["readerId"] = READER_ID;
+  if (!wsRequest(req, res, 1500)) return -1;
+  return String(res["result"] | "") == "OK" ? 1 : 0;
+}
+
+/********** Allowlist offline **********/
+bool allowlistSignatureOk(const String& body, const String& sigHex) {
+  String msg = "allowlist:" + body;
+  return sigHex.length() == 64 && hmacSha256HexBytes((const uint8_t*)msg.c_str(), msg.length()) == sigHex;
+}
+
+void allowlistSet(const String& uid, bool active) {
+  auto it = std::lower_bound(allowlist.begin(), allowlist.end(), uid);
+  bool present = it != allowlist.end() && *it == uid;
+  if (active && !present) allowlist.insert(it, uid);
+  else if (!active && present) allowlist.erase(it);
+}
+
+// Snapshot completo o delta desde allowlistVersion; solo se aplica si la firma es válida
+bool syncAllowlist() {
+  lastAllowlistSync = millis();
+  if (WiFi.status() != WL_CONNECTED) return false;
+  bool full = allowlistNeedsFull;
+  String url = buildURL(full ? URL_ALLOWLIST : URL_ALLOWLIST_DELTA);
+  if (!full) url += "?since=" + String(allowlistVersion);
+  http.setTimeout(1500);
+  if (!http.begin(url)) return false;
+  const char* keys[] = {"X-Allowlist-Signature"};
+  http.collectHeaders(keys, 1);
+
+  bool ok = false;
+  int code = http.GET();
+  if (code == 200) {
+    String body = http.getString();
+    if (allowlistSignatureOk(body, http.header("X-Allowlist-Signature"))) {
+      DynamicJsonDocument doc(body.length() * 2 + 512);
+      if (deserializeJson(doc, body) == DeserializationError::Ok) {
+        if (full) {
+          allowlist.clear();
+          for (JsonVariant u : doc["uids"].as<JsonArray>()) allowlist.push_back(u.as<String>());
+        } else {
+          for (JsonVariant u : doc["add"].as<JsonArray>()) allowlistSet(u.as<String>(), true);
+          for (JsonVariant u : doc["remove"].as<JsonArray>()) allowlistSet(u.as<String>(), false);
+        }
+        allowlistVersion = doc["version"] | 0;
+        allowlistLoaded = true;
+        allowlistNeedsFull = false;
+        ok = true;
+      }
+    } else Serial.println(" Firma de allowlist inválida");
+  } else if (code == 410) {
+    allowlistNeedsFull = true;   // la lista actual sigue sirviendo hasta bajar la nueva
+    ok = true;
+  }
+  http.end();
+  return ok;
+}
+
+uint64_t nowEpochMs() {
+  time_t t = time(nullptr);
+  return t > 1600000000 ? (uint64_t)t * 1000 : 0;   // 0 = sin hora NTP (el servidor usa la suya)
+}
+
+// -1 sin allowlist; si no, decide con ella y guarda el evento para subirlo después
+int decideOffline() {
+  if (!allowlistLoaded) return -1;
+  bool ok = std::binary_search(allowlist.begin(), allowlist.end(), lastUIDHex);
+  if (offlineEvents.size() >= OFFLINE_BUFFER) offlineEvents.erase(offlineEvents.begin());
+  offlineEvents.push_back({String(bootId, HEX) + "-" + String(++offlineSeq), lastUIDHex, ok, nowEpochMs()});
+  Serial.println(ok ? " Decisión offline: permitido" : " Decisión offline: denegado");
+  return ok ? 1 : 0;
+}
+
+// NDJSON a /api/logs/ingest; el servidor descarta los eventId ya recibidos
+void uploadOfflineEvents() {
+  if (offlineEvents.empty() || WiFi.status() != WL_CONNECTED) return;
+  String body;
+  for (auto& ev : offlineEvents) {
+    StaticJsonDocument<192> d;
+    d["eventId"] = ev.eventId;
+    d["uid"] = ev.uid;
+    d["resultado"] = ev.ok ? "OK" : "DENIED";
+    d["details"] = "OFFLINE";
+    if (ev.fechaMs) d["fecha"] = ev.fechaMs;
+    serializeJson(d, body);
+    body += "\n";
+  }
+  String url = buildURL(URL_INGEST) + "?readerId=" + READER_ID;
+  http.setTimeout(3000);
+  if (!http.begin(url)) return;
+  http.addHeader("Content-Type", "application/x-ndjson");
+  if (http.POST(body) == 200) offlineEvents.clear();
+  http.end();
+}
+
+/********** Pool de desafíos **********/
+void dropExpiredChallenges() {
+  int j = 0;
+  for (int i = 0; i < challengeCount; i++) {
+    if ((int32_t)(challenges[i].expiresAt - millis()) > 0) challenges[j++] = challenges[i];
+  }
+  challengeCount = j;
+}
+
+// Pide desafíos hasta llenar el pool (fuera del tap: no suma latencia)
+void refillChallenges() {
+  lastRefill = millis();
+  dropExpiredChallenges();
+  int missing = CHALLENGE_POOL - challengeCount;
+  if (missing <= 0 || WiFi.status() != WL_CONNECTED) return;
+
+  String url = buildURL(URL_CHALLENGES);
+  url += "?readerId=" + String(READER_ID) + "&n=" + String(missing);
+  http.setTimeout(1500);
+  if (!http.begin(url)) return;
+  if (http.GET() == 200) {
+    DynamicJsonDocument doc(1536);
+    if (deserializeJson(doc, http.getString()) == DeserializationError::Ok) {
+      uint32_t ttlMs = (uint32_t)(doc["ttlSeconds"] | 0) * 1000;
+      uint32_t life = ttlMs > CHALLENGE_MARGIN_MS ? ttlMs - CHALLENGE_MARGIN_MS : 0;
+      for (JsonObject it : doc["items"].as<JsonArray>()) {
+        if (challengeCount >= CHALLENGE_POOL || life == 0) break;
+        challenges[challengeCount].sessionId = (const char*)it["sessionId"];
+        challenges[challengeCount].nonceHex  = (const char*)it["nonce"];
+        challenges[challengeCount].expiresAt = lastRefill + life;
+        challengeCount++;
+      }
+    }
+  }
+  http.end();
+}
+
+// Toma un desafío vigente; false si el pool está vacío
+bool takeChallenge() {
+  dropExpiredChallenges();
+  if (challengeCount == 0) return false;
+  challengeCount--;
+  sessionId = challenges[challengeCount].sessionId;
+  nonceHex  = challenges[challengeCount].nonceHex;
+  return true;
+}
+
+void showDenied() {
+  Serial.println(" ACCESO DENEGADO");
+  digitalWrite(LED_ROJO, HIGH);
+  delay(2000);
+  digitalWrite(LED_ROJO, LOW);
+}
+
+// El servidor no respondió a tiempo: se decide con la allowlist en vez de solo reintentar
+void decideOfflineOrBackoff() {
+  int verdict = decideOffline();
+  if (verdict == 1) { state = ACTUATE; return; }
+  if (verdict == 0) showDenied();
+  state = WAIT_BACKOFF;
+}
+
 /********** WiFi robusto **********/
 void ensureWiFi() {
   if (WiFi.status() == WL_CONNECTED) return;
@@ -133,10 +484,19 @@ void setup() {
   pinMode(LED_ROJO, OUTPUT);
   digitalWrite(LED_VERDE, LOW);
   digitalWrite(LED_ROJO, LOW);
+
+  bootId = esp_random();
+  configTime(0, 0, "pool.ntp.org");   // hora UTC para los eventos offline
+
+  String wsPath = String(URL_READER_WS) + "?readerId=" + READER_ID;
+  ws.begin(SERVER_HOST, SERVER_PORT, wsPath.c_str());
+  ws.onEvent(onWsEvent);
+  ws.setReconnectInterval(3000);
 }
 
 /********** Loop **********/
 void loop() {
+  ws.loop();
   switch (state) {
 
     case NFC_INIT: {
@@ -155,74 +515,52 @@ void loop() {
       if (nfc.readPassiveTargetID(PN532_MIFARE_ISO14443A, uid, &uidLen)) {
         lastUIDHex = toHexUpper(uid, uidLen);
         Serial.println("UID detectado: " + lastUIDHex);
-        state = REQUEST_NONCE;
         stateDeadline = millis() + NONCE_TTL_MS;
+        // con desafío pre-emitido se salta GET /api/nonce
+        usingChallenge = takeChallenge();
+        state = usingChallenge ? POST_VERIFY : REQUEST_NONCE;
+        break;
+      }
+      if (challengeCount < CHALLENGE_POOL && millis() - lastRefill > CHALLENGE_REFILL_MS) {
+        refillChallenges();
+      }
+      if (millis() - lastAllowlistSync > ALLOWLIST_SYNC_MS || (allowlistNeedsFull && millis() - lastAllowlistSync > 5000)) {
+        if (syncAllowlist()) uploadOfflineEvents();
       }
       delay(50);
       break;
     }
 
     case REQUEST_NONCE: {
-      if ((int32_t)(millis() - stateDeadline) > 0) { state = WAIT_BACKOFF; break; }
-      String url = buildURL(URL_NONCE);
-      url += "?uid=" + lastUIDHex;
-
-      http.setTimeout(1500);
-      if (!http.begin(url)) { state = WAIT_BACKOFF; break; }
-
-      int code = http.GET();
-      if (code == 200) {
-        StaticJsonDocument<256> doc;
-        if (deserializeJson(doc, http.getString()) == DeserializationError::Ok) {
-          sessionId = (const char*)doc["sessionId"];
-          nonceHex  = (const char*)doc["nonce"];
-          state = POST_VERIFY;
-        } else state = WAIT_BACKOFF;
-      } else state = WAIT_BACKOFF;
-      http.end();
+      if ((int32_t)(millis() - stateDeadline) > 0) { decideOfflineOrBackoff(); break; }
+      bool ok = wsConnected ? wsRequestNonce() : httpRequestNonce();
+      if (ok) state = POST_VERIFY;
+      else decideOfflineOrBackoff();
       break;
     }
 
     case POST_VERIFY: {
-      if ((int32_t)(millis() - stateDeadline) > 0) { state = WAIT_BACKOFF; break; }
-
-      String url = buildURL(URL_VERIFY);
-      if (!http.begin(url)) { state = WAIT_BACKOFF; break; }
-      http.addHeader("Content-Type", "application/json");
+      if ((int32_t)(millis() - stateDeadline) > 0) { decideOfflineOrBackoff(); break; }
 
       std::vector<uint8_t> uidBytes, nonceBytes, msg;
-      if (!hexToBytes(lastUIDHex, uidBytes) || !hexToBytes(nonceHex, nonceBytes)) { state = WAIT_BACKOFF; http.end(); break; }
+      if (!hexToBytes(lastUIDHex, uidBytes) || !hexToBytes(nonceHex, nonceBytes)) { state = WAIT_BACKOFF; break; }
       msg.insert(msg.end(), uidBytes.begin(), uidBytes.end());
       msg.insert(msg.end(), nonceBytes.begin(), nonceBytes.end());
-      String hmacHex = hmacSha256HexBytes(msg.data(), msg.size());
-
-      StaticJsonDocument<256> req;
-      req["uid"] = lastUIDHex;
-      req["sessionId"] = sessionId;
-      req["hmac"] = hmacHex;
-
-      String body; serializeJson(req, body);
-      int code = http.POST(body);
-
-      if (code > 0) {
-        StaticJsonDocument<256> res;
-        if (deserializeJson(res, http.getString()) == DeserializationError::Ok) {
-          String result = res["result"] | "";
-          String reason = res["reason"] | "";
-
-          if (result == "OK") {
-            Serial.println(" ACCESO PERMITIDO");
-            state = ACTUATE;
-          } else {
-            Serial.println(" ACCESO DENEGADO");
-            digitalWrite(LED_ROJO, HIGH);
-            delay(2000);
-            digitalWrite(LED_ROJO, LOW);
-            state = WAIT_BACKOFF;
-          }
-        }
+      if (usingChallenge) {
+        // el desafío está ligado al lector: el readerId entra en el HMAC
+        msg.insert(msg.end(), READER_ID, READER_ID + strlen(READER_ID));
+      }
+
+      int verdict = wsConnected ? wsVerify(msg) : httpVerify(uidBytes, msg);
+      if (verdict == 1) {
+        Serial.println(" ACCESO PERMITIDO");
+        state = ACTUATE;
+      } else if (verdict == 0) {
+        showDenied();
+        state = WAIT_BACKOFF;
+      } else {
+        decideOfflineOrBackoff();
       }
-      http.end();
       break;
     }
 
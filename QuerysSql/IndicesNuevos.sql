@@ -37,3 +37,62 @@ CREATE INDEX IX_LogAccesos_Fecha ON dbo.LogAccesos(Fecha DESC, IdLog DESC);
 
 IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_RFID_Sessions_CreatedAt' AND object_id=OBJECT_ID('dbo.RFID_Sessions'))
 CREATE INDEX IX_RFID_Sessions_CreatedAt ON dbo.RFID_Sessions (CreatedAt DESC);
+
+
+-- Barrido de sesiones vencidas (DELETE TOP (n) ... WHERE ExpireAt < ahora)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_RFID_Sessions_ExpireAt' AND object_id=OBJECT_ID('dbo.RFID_Sessions'))
+CREATE INDEX IX_RFID_Sessions_ExpireAt ON dbo.RFID_Sessions (ExpireAt);
+
+
+-- /api/logs paginado por cursor (keyset) con filtros por UID y por Resultado
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_LogAccesos_UID_Fecha' AND object_id=OBJECT_ID('dbo.LogAccesos'))
+CREATE INDEX IX_LogAccesos_UID_Fecha ON dbo.LogAccesos (UID, Fecha DESC, IdLog DESC) INCLUDE (Resultado, Details);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_LogAccesos_Resultado_Fecha' AND object_id=OBJECT_ID('dbo.LogAccesos'))
+CREATE INDEX IX_LogAccesos_Resultado_Fecha ON dbo.LogAccesos (Resultado, Fecha DESC, IdLog DESC) INCLUDE (UID, Details);
+
+
+-- Allowlist offline para lectores (/api/allowlist): historial de altas/bajas de UIDs activos.
+-- Version (IDENTITY) es la version que ven los lectores; los deltas son WHERE Version > ?.
+IF OBJECT_ID('dbo.AllowlistChanges') IS NULL
+CREATE TABLE dbo.AllowlistChanges (
+    Version BIGINT IDENTITY(1,1) PRIMARY KEY,
+    UID NVARCHAR(64) NOT NULL,
+    Activa BIT NOT NULL,                 -- 1 = entra a la lista, 0 = sale
+    ChangedAt DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+);
+GO
+
+-- Solo registra cambios de pertenencia (alta, baja, activar/desactivar, cambio de UID);
+-- la rotacion de alias en cada acceso no genera filas.
+CREATE OR ALTER TRIGGER dbo.TR_AuthorizedTags_Allowlist ON dbo.AuthorizedTags
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.AllowlistChanges (UID, Activa)
+    SELECT d.UID, 0 FROM deleted d
+    WHERE d.Activa = 1
+      AND NOT EXISTS (SELECT 1 FROM inserted i WHERE i.UID = d.UID AND i.Activa = 1);
+
+    INSERT INTO dbo.AllowlistChanges (UID, Activa)
+    SELECT i.UID, 1 FROM inserted i
+    WHERE i.Activa = 1
+      AND NOT EXISTS (SELECT 1 FROM deleted d WHERE d.UID = i.UID AND d.Activa = 1);
+END
+GO
+
+
+-- /api/logs/ingest: eventos ya ingeridos (dedupe por id del cliente; "<readerId>:<eventId>"
+-- para lectores, "spill:<sha1>" para lineas del spill del audit_writer)
+IF OBJECT_ID('dbo.IngestedEvents') IS NULL
+CREATE TABLE dbo.IngestedEvents (
+    EventId NVARCHAR(100) NOT NULL PRIMARY KEY,
+    IngestedAt DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+);
+GO
+
+-- Purga de IngestedEvents (IngestSweeper): DELETE TOP (n) por antiguedad
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_IngestedEvents_IngestedAt' AND object_id=OBJECT_ID('dbo.IngestedEvents'))
+CREATE INDEX IX_IngestedEvents_IngestedAt ON dbo.IngestedEvents (IngestedAt);
+GO
@@ -0,0 +1,126 @@
+import binascii, os, threading
+from collections import deque
+
+# UID con el que quedan las filas reservadas en UsedAliases hasta que se asignan
+RESERVED_UID = ""
+
+
+class AliasPool(threading.Thread):
+    """
+    Pool de alias ya reservados en UsedAliases (únicos garantizados por UQ_UsedAliases_Alias).
+    Un hilo en segundo plano inserta lotes de 'batch_size' alias cuando quedan 'low'
+    o menos y rellena hasta 'high'; /api/verify toma uno con take() y la rotación queda en
+    un UPDATE, sin reintentos por colisión en el camino de la request.
+    - take() devuelve None si el pool está vacío (verify genera el alias como antes);
+      con high = 0 el pool queda desactivado
+    - give_back() devuelve un alias no usado (p. ej. el UID resultó no autorizado)
+    - los alias reservados que no se usan antes de apagar se pierden (no se reutilizan)
+    'run_db' es la función sync que ejecuta fn(conn, ...) con una conexión del pool.
+    """
+
+    def __init__(self, run_db, low: int = 200, high: int = 1000, batch_size: int = 200,
+                 interval: float = 5.0):
+        if low < 0 or high < 0 or low > high or not 1 <= batch_size <= 1000:
+            raise ValueError("Tamaños de pool de alias inválidos")
+        super().__init__(name="alias-pool", daemon=True)
+        self._run_db = run_db
+        self.low = low
+        self.high = high
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._aliases = deque()
+        self._wake = threading.Event()
+        self._stop_evt = threading.Event()
+        self._taken = 0
+        self._empty = 0
+        self._reserved = 0
+        self._collisions = 0
+        self._errors = 0
+
+    # ---------- camino de la request ----------
+    def take(self):
+        with self._lock:
+            alias = self._aliases.popleft() if self._aliases else None
+            if alias is None:
+                self._empty += 1
+            else:
+                self._taken += 1
+            low = len(self._aliases) <= self.low
+        if low:
+            self._wake.set()
+        return alias
+
+    def give_back(self, alias: str):
+        with self._lock:
+            self._aliases.append(alias)
+            self._taken -= 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._aliases)
+
+    # ---------- reserva en BD ----------
+    @staticmethod
+    def _reserve_db(conn, candidates):
+        """Inserta los candidatos que no existen; devuelve los que quedaron reservados"""
+        values = ", ".join(["(?)"] * len(candidates))
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                INSERT INTO dbo.UsedAliases (UID, Alias)
+                OUTPUT INSERTED.Alias
+                SELECT ?, v.Alias FROM (VALUES {values}) AS v(Alias)
+                WHERE NOT EXISTS (SELECT 1 FROM dbo.UsedAliases u WHERE u.Alias = v.Alias)
+            """, (RESERVED_UID, *candidates))
+            return [r[0] for r in cur.fetchall()]
+        finally:
+            cur.close()
+
+    def refill(self) -> int:
+        """Reserva lotes hasta 'high'. Devuelve cuántos alias agregó"""
+        added = 0
+        while not self._stop_evt.is_set():
+            missing = self.high - len(self)
+            if missing <= 0:
+                break
+            n = min(self.batch_size, missing)
+            candidates = list({binascii.hexlify(os.urandom(8)).decode().upper() for _ in range(n)})
+            try:
+                reserved = self._run_db(self._reserve_db, candidates)
+            except Exception as e:
+                # carrera en UNIQUE con otro nodo o BD caída: se reintenta en la próxima vuelta
+                print("[alias-pool] no se pudo reservar lote:", e)
+                with self._lock:
+                    self._errors += 1
+                break
+            with self._lock:
+                self._aliases.extend(reserved)
+                self._reserved += len(reserved)
+                self._collisions += len(candidates) - len(reserved)
+            added += len(reserved)
+        return added
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            if len(self) <= self.low:
+                self.refill()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop_evt.set()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "available": len(self._aliases),
+                "low": self.low,
+                "high": self.high,
+                "taken": self._taken,
+                "empty": self._empty,
+                "reserved": self._reserved,
+                "collisions": self._collisions,
+                "errors": self._errors,
+            }
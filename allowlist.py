@@ -0,0 +1,170 @@
+import threading, time
+from collections import deque
+
+# Versión = dbo.AllowlistChanges.Version (IDENTITY). La tabla la llena un trigger en
+# AuthorizedTags solo cuando un UID entra o sale de la lista de activos (la rotación de
+# alias no genera cambios). READCOMMITTEDLOCK: la lectura espera a los INSERT sin commit
+# del rango en lugar de saltearlos, así una versión menor no aparece después.
+VERSION_SQL = "SELECT ISNULL(MAX(Version), 0) FROM dbo.AllowlistChanges WITH (READCOMMITTEDLOCK)"
+ACTIVE_SQL = "SELECT UID FROM dbo.AuthorizedTags WHERE Activa = 1"
+CHANGES_SQL = """
+SELECT Version, UID, Activa FROM dbo.AllowlistChanges WITH (READCOMMITTEDLOCK)
+WHERE Version > ? ORDER BY Version
+"""
+
+
+def _is_hex(uid: str) -> bool:
+    try:
+        bytes.fromhex(uid)
+        return True
+    except ValueError:
+        return False
+
+
+class Allowlist:
+    """
+    Copia en memoria de los UIDs activos de AuthorizedTags, para servir a los lectores
+    un snapshot (modo offline) y deltas desde una versión.
+    - la primera vez se lee la tabla completa; después solo AllowlistChanges desde la
+      última versión vista (refresh_if_stale, como mucho cada 'min_interval' segundos)
+    - se guardan los últimos 'history' cambios: un delta desde una versión más vieja
+      devuelve None (el lector tiene que bajar el snapshot de nuevo)
+    - on_change() se llama cuando cambia la versión (p. ej. para invalidar respuestas)
+    'run_db' es la función sync que ejecuta fn(conn, ...) con una conexión del pool.
+    """
+
+    def __init__(self, run_db, min_interval: float = 5.0, history: int = 10000, on_change=None):
+        self._run_db = run_db
+        self.min_interval = min_interval
+        self.history = history
+        self._on_change = on_change
+        self._lock = threading.Lock()          # estado
+        self._refresh_lock = threading.Lock()  # una sola lectura de BD a la vez
+        self._active = set()
+        self._sorted = None
+        self._changes = deque()                # (versión, uid, activa)
+        self._floor = 0                        # deltas servibles desde esta versión
+        self._version = 0
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._full_loads = 0
+        self._refreshes = 0
+        self._errors = 0
+
+    # ---------- lectura de BD ----------
+    @staticmethod
+    def _load_full_db(conn):
+        cur = conn.cursor()
+        try:
+            cur.execute(VERSION_SQL)
+            version = int(cur.fetchone()[0])
+            cur.execute(ACTIVE_SQL)
+            uids = (str(r[0]).upper() for r in cur.fetchall())
+            return version, {u for u in uids if _is_hex(u)}
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _load_changes_db(conn, since):
+        cur = conn.cursor()
+        try:
+            cur.execute(CHANGES_SQL, (since,))
+            rows = [(int(r[0]), str(r[1]).upper(), bool(r[2])) for r in cur.fetchall()]
+            return [r for r in rows if _is_hex(r[1])]
+        finally:
+            cur.close()
+
+    def refresh(self):
+        """Trae lo nuevo de la BD (completo la primera vez, cambios después)"""
+        with self._refresh_lock:
+            if not self._loaded:
+                version, active = self._run_db(self._load_full_db)
+                with self._lock:
+                    self._active = active
+                    self._sorted = None
+                    self._version = self._floor = version
+                    self._loaded = True
+                    self._full_loads += 1
+                changed = True
+            else:
+                rows = self._run_db(self._load_changes_db, self._version)
+                changed = self._apply(rows)
+            self._last_refresh = time.monotonic()
+            self._refreshes += 1
+        if changed and self._on_change:
+            self._on_change()
+
+    def refresh_if_stale(self):
+        """
+        Refresca si pasaron 'min_interval' segundos. Si otra request ya está leyendo,
+        se sirve la versión actual (salvo que nunca se haya cargado).
+        """
+        if self._loaded and time.monotonic() - self._last_refresh < self.min_interval:
+            return
+        if self._loaded and self._refresh_lock.locked():
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            self._errors += 1
+            if not self._loaded:
+                raise
+            print("[allowlist] no se pudo refrescar:", e)
+
+    def _apply(self, rows) -> bool:
+        rows = [r for r in rows if r[0] > self._version]
+        if not rows:
+            return False
+        with self._lock:
+            for version, uid, activa in rows:
+                if activa:
+                    self._active.add(uid)
+                else:
+                    self._active.discard(uid)
+                self._changes.append((version, uid, activa))
+            while len(self._changes) > self.history:
+                self._floor = self._changes.popleft()[0]
+            self._version = rows[-1][0]
+            self._sorted = None
+        return True
+
+    # ---------- consultas ----------
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self):
+        """(versión, UIDs activos ordenados); el orden se calcula una vez por versión"""
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._active)
+            return self._version, self._sorted
+
+    def delta(self, since: int):
+        """
+        (versión, altas, bajas) desde 'since' con el estado final de cada UID;
+        None si 'since' es más vieja que el historial o no corresponde a este servidor.
+        """
+        with self._lock:
+            if since < self._floor or since > self._version:
+                return None
+            last = {}
+            for version, uid, activa in reversed(self._changes):
+                if version <= since:
+                    break
+                last.setdefault(uid, activa)
+            added = sorted(u for u, a in last.items() if a)
+            removed = sorted(u for u, a in last.items() if not a)
+            return self._version, added, removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "version": self._version,
+                "active": len(self._active),
+                "historyFrom": self._floor,
+                "history": len(self._changes),
+                "fullLoads": self._full_loads,
+                "refreshes": self._refreshes,
+                "errors": self._errors,
+            }
@@ -0,0 +1,249 @@
+import json, os, queue, threading, time
+from datetime import datetime
+
+LOG_INSERT = "INSERT INTO dbo.LogAccesos (UID, Resultado, Details, Fecha) VALUES (?, ?, ?, ?)"
+USED_INSERT = "INSERT INTO dbo.UsedTags (UID, IdUsuario, Motivo, FechaUsado) VALUES (?, ?, ?, ?)"
+
+
+class AuditWriter(threading.Thread):
+    """
+    Write-behind para LogAccesos y UsedTags.
+    Los endpoints encolan (log/used) y responden; este hilo vacía la cola con
+    executemany (fast_executemany) cuando junta 'batch_size' filas o pasan
+    'flush_interval' segundos. La fecha se toma al encolar, no al insertar.
+    Durabilidad:
+    - stop() vacía la cola antes de salir (flush al apagar la API)
+    - si la BD no responde y hay 'spill_path', el lote se agrega a un archivo
+      NDJSON append-only que se re-inserta solo cuando la BD vuelve
+    - cola llena: el evento va al spill (o se descarta y se cuenta si no hay spill)
+    - cada lote es una transacción: si falla, no queda nada escrito a medias
+    - en el replay, un lote que falla por un error que no es de conexión
+      ('is_transient' devuelve False) se reintenta evento por evento; los que vuelven a
+      fallar van a '<spill_path>.quarantine' (se revisan a mano) y no se reintentan más
+    'run_db' es la función sync que ejecuta fn(conn, ...) con una conexión del pool.
+    'on_write' (opcional) se llama tras escribir filas de LogAccesos (invalidar caches).
+    """
+
+    def __init__(self, run_db, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_queue: int = 10000, spill_path: str = "", on_write=None,
+                 is_transient=None):
+        super().__init__(name="audit-writer", daemon=True)
+        self._run_db = run_db
+        self._on_write = on_write
+        self._is_transient = is_transient or (lambda e: True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._q = queue.Queue(maxsize=max_queue)
+        self._stop_evt = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._written = 0
+        self._batches = 0
+        self._spilled = 0
+        self._dropped = 0
+        self._replayed = 0
+        self._quarantined = 0
+        self._errors = 0
+
+    # ---------- productores (endpoints) ----------
+    def log(self, uid: str, resultado: str, details: str = None):
+        self._put(("log", uid, resultado, details, datetime.utcnow()))
+
+    def used(self, uid: str, id_usuario: int, motivo: str = "Post-OK"):
+        self._put(("used", uid, id_usuario, motivo, datetime.utcnow()))
+
+    def _put(self, ev):
+        try:
+            self._q.put_nowait(ev)
+        except queue.Full:
+            if self.spill_path:
+                self._spill([ev])
+            else:
+                with self._stats_lock:
+                    self._dropped += 1
+
+    # ---------- escritura ----------
+    @staticmethod
+    def _insert_db(conn, events):
+        logs = [ev[1:] for ev in events if ev[0] == "log"]
+        used = [ev[1:] for ev in events if ev[0] == "used"]
+        cur = conn.cursor()
+        # las conexiones del pool están en autocommit: sin esto cada executemany
+        # confirmaría por su cuenta y un lote fallido quedaría a medias
+        conn.autocommit = False
+        try:
+            cur.fast_executemany = True
+            if logs:
+                cur.executemany(LOG_INSERT, logs)
+            if used:
+                cur.executemany(USED_INSERT, used)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.autocommit = True
+
+    def flush(self, events) -> bool:
+        """Inserta un lote; si falla lo manda al spill. True si llegó a la BD"""
+        if not events:
+            return True
+        try:
+            self._run_db(self._insert_db, events)
+        except Exception as e:
+            print("[audit-writer] no se pudo escribir lote:", e)
+            with self._stats_lock:
+                self._errors += 1
+            if self.spill_path:
+                self._spill(events)
+            else:
+                with self._stats_lock:
+                    self._dropped += len(events)
+            return False
+        with self._stats_lock:
+            self._written += len(events)
+            self._batches += 1
+        self._notify(events)
+        return True
+
+    def _notify(self, events):
+        if self._on_write and any(ev[0] == "log" for ev in events):
+            try:
+                self._on_write()
+            except Exception as e:
+                print("[audit-writer] on_write falló:", e)
+
+    def _drain(self, limit: int):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_evt.is_set():
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            if batch and self.flush(batch):
+                self.replay_spill()
+        # apagado: lo que quede en cola
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self.flush(batch)
+
+    def stop(self, timeout: float = 10.0):
+        self._stop_evt.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    # ---------- spill a disco ----------
+    @staticmethod
+    def _spill_line(ev) -> str:
+        return json.dumps({"t": ev[0], "uid": ev[1], "a": ev[2], "b": ev[3], "fecha": ev[4].isoformat()})
+
+    def _spill(self, events):
+        lines = [self._spill_line(ev) for ev in events]
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        with self._stats_lock:
+            self._spilled += len(events)
+
+    def _quarantine(self, ev, error):
+        print("[audit-writer] evento a cuarentena:", error)
+        with self._spill_lock:
+            with open(self.spill_path + ".quarantine", "a", encoding="utf-8") as f:
+                f.write(self._spill_line(ev) + "\n")
+        with self._stats_lock:
+            self._quarantined += 1
+
+    @staticmethod
+    def read_spill(path):
+        """Eventos de un archivo spill, con el mismo formato que encola log()/used()"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    d = json.loads(line)
+                    yield (d["t"], d["uid"], d["a"], d["b"], datetime.fromisoformat(d["fecha"]))
+
+    def replay_spill(self) -> int:
+        """Re-inserta el spill pendiente (la BD ya respondió). Devuelve filas re-insertadas"""
+        if not self.spill_path:
+            return 0
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path) or os.path.getsize(self.spill_path) == 0:
+                return 0
+            replay = self.spill_path + ".replay"
+            if os.path.exists(replay):
+                return 0   # un replay anterior quedó a medias: se revisa a mano
+            os.replace(self.spill_path, replay)
+        events = list(self.read_spill(replay))
+        done = 0
+        for i in range(0, len(events), self.batch_size):
+            chunk = events[i:i + self.batch_size]
+            pending = None
+            try:
+                self._run_db(self._insert_db, chunk)
+                n = len(chunk)
+            except Exception as e:
+                if self._is_transient(e):
+                    print("[audit-writer] replay interrumpido:", e)
+                    self._spill(events[i:])
+                    break
+                n, pending = self._replay_one_by_one(chunk)
+                if pending:
+                    print("[audit-writer] replay interrumpido")
+                    self._spill(pending + events[i + self.batch_size:])
+            done += n
+            if n:
+                self._notify(chunk)
+            if pending:
+                break
+        os.remove(replay)
+        with self._stats_lock:
+            self._replayed += done
+        return done
+
+    def _replay_one_by_one(self, chunk):
+        """
+        Lote con algún evento que la BD rechaza: cada evento en su transacción y los
+        rechazados a cuarentena. -> (insertados, pendientes si la BD se cayó a mitad)
+        """
+        done = 0
+        for j, ev in enumerate(chunk):
+            try:
+                self._run_db(self._insert_db, [ev])
+                done += 1
+            except Exception as e:
+                if self._is_transient(e):
+                    return done, chunk[j:]
+                self._quarantine(ev, e)
+        return done, None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queued": self._q.qsize(),
+                "written": self._written,
+                "batches": self._batches,
+                "spilled": self._spilled,
+                "replayed": self._replayed,
+                "quarantined": self._quarantined,
+                "dropped": self._dropped,
+                "errors": self._errors,
+            }
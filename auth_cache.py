@@ -0,0 +1,79 @@
+import threading, time
+from collections import OrderedDict
+
+
+class AuthCache:
+    """
+    Cache en proceso de AuthorizedTags: UID -> (IdUsuario, Activa).
+    - tamaño acotado con desalojo LRU ('max_size'; 0 = desactivado)
+    - entradas negativas (UID desconocido = None) para que una ráfaga de UIDs no
+      autorizados no llegue a la BD; duran 'negative_ttl', las positivas 'ttl'
+    - agregar_tarjeta invalida el UID; los cambios manuales en la BD se ven al vencer
+      el TTL o con flush() (endpoint de admin)
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0, negative_ttl: float = 10.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # uid -> (valor, vence)
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, uid: str):
+        """(True, valor) si está en cache y vigente; (False, None) si hay que ir a la BD"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(uid)
+            if item is None or item[1] < now:
+                if item is not None:
+                    del self._data[uid]
+                self._misses += 1
+                return False, None
+            self._data.move_to_end(uid)
+            self._hits += 1
+            if item[0] is None:
+                self._negative_hits += 1
+            return True, item[0]
+
+    def put(self, uid: str, value):
+        """value = (IdUsuario, Activa) o None si el UID no existe"""
+        if self.max_size <= 0:
+            return
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._data[uid] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(uid)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, uid: str):
+        with self._lock:
+            if self._data.pop(uid, None) is not None:
+                self._invalidations += 1
+
+    def flush(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            self._invalidations += n
+            return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxSize": self.max_size,
+                "hits": self._hits,
+                "negativeHits": self._negative_hits,
+                "misses": self._misses,
+                "hitRatio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
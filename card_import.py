@@ -0,0 +1,151 @@
+import csv, io
+
+# Staging de una tanda: (Fila, UID, Nombre, Correo). Fila = número de fila del archivo,
+# para devolver los errores por fila.
+STAGE_CREATE = """
+IF OBJECT_ID('tempdb..#import') IS NOT NULL DROP TABLE #import;
+CREATE TABLE #import (
+    Fila INT NOT NULL, UID NVARCHAR(64) NOT NULL PRIMARY KEY,
+    Nombre NVARCHAR(150) NOT NULL, Correo NVARCHAR(250) NOT NULL
+);
+"""
+STAGE_INSERT = "INSERT INTO #import (Fila, UID, Nombre, Correo) VALUES (?, ?, ?, ?)"
+
+# Una transacción por tanda: usuarios nuevos (por Nombre, igual que agregar_tarjeta) y
+# MERGE de AuthorizedTags. Un UID existente del mismo usuario se re-activa; si es de
+# otro usuario es conflicto (CONFLICT, no se toca) salvo @relink = 1, que lo re-vincula.
+# Devuelve (UID, acción) por cada fila que cambió algo o quedó en conflicto.
+# Los SET quedan en la conexión del pool: se restauran al final (RESET_SQL si el batch
+# se cortó); con NOCOUNT ON rowcount da -1 (SessionSweeper).
+MERGE_SQL = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @relink BIT = ?;
+DECLARE @out TABLE (Accion NVARCHAR(10), UID NVARCHAR(64));
+BEGIN TRAN;
+    INSERT INTO @out (Accion, UID)
+    SELECT 'CONFLICT', s.UID FROM #import s
+    JOIN dbo.AuthorizedTags t WITH (UPDLOCK, HOLDLOCK) ON t.UID = s.UID
+    OUTER APPLY (SELECT TOP 1 IdUsuario FROM dbo.Usuarios WHERE Nombre = s.Nombre ORDER BY IdUsuario) u
+    WHERE @relink = 0 AND (u.IdUsuario IS NULL OR u.IdUsuario <> t.IdUsuario);
+    DELETE s FROM #import s JOIN @out o ON o.UID = s.UID;
+
+    INSERT INTO dbo.Usuarios (Nombre, Correo)
+    SELECT s.Nombre, MIN(s.Correo) FROM #import s
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.Usuarios u WITH (UPDLOCK, HOLDLOCK) WHERE u.Nombre = s.Nombre)
+    GROUP BY s.Nombre;
+
+    MERGE dbo.AuthorizedTags WITH (HOLDLOCK) AS t
+    USING (
+        SELECT s.UID, u.IdUsuario FROM #import s
+        CROSS APPLY (SELECT TOP 1 IdUsuario FROM dbo.Usuarios WHERE Nombre = s.Nombre ORDER BY IdUsuario) u
+    ) AS src
+    ON t.UID = src.UID
+    WHEN MATCHED AND (t.IdUsuario <> src.IdUsuario OR t.Activa = 0) THEN
+        UPDATE SET IdUsuario = src.IdUsuario, Activa = 1
+    WHEN NOT MATCHED THEN
+        INSERT (UID, IdUsuario, Activa) VALUES (src.UID, src.IdUsuario, 1)
+    OUTPUT $action, INSERTED.UID INTO @out;
+COMMIT;
+DROP TABLE #import;
+SET NOCOUNT OFF;
+SET XACT_ABORT OFF;
+SELECT UID, Accion FROM @out;
+"""
+RESET_SQL = "SET NOCOUNT OFF; SET XACT_ABORT OFF;"
+
+FIELDS = ("uid", "nombre", "correo")
+_LIMITS = {"nombre": 150, "correo": 250}
+
+
+class CardImportError(ValueError):
+    """Archivo de importación ilegible (se responde 400)"""
+
+
+def _row(fila, d):
+    """dict con uid/nombre/correo -> (Fila, UID, Nombre, Correo) o ValueError"""
+    uid = str(d.get("uid") or "").strip().replace(" ", "").upper()
+    if uid.startswith("0X"):
+        uid = uid[2:]
+    if not uid or len(uid) > 64:
+        raise ValueError("uid vacío o demasiado largo")
+    try:
+        bytes.fromhex(uid)
+    except ValueError:
+        raise ValueError("uid no es hex")
+    values = {}
+    for key, limit in _LIMITS.items():
+        value = str(d.get(key) or "").strip()
+        if not value:
+            raise ValueError(f"falta {key}")
+        if len(value) > limit:
+            raise ValueError(f"{key} supera {limit} caracteres")
+        values[key] = value
+    return fila, uid, values["nombre"], values["correo"]
+
+
+def parse_rows(records):
+    """
+    records = [(fila, dict)] -> (filas válidas, errores por fila).
+    Un UID repetido en el archivo vale la primera vez; las siguientes son error.
+    """
+    rows, errors, seen = [], [], {}
+    for fila, d in records:
+        try:
+            row = _row(fila, d)
+        except ValueError as e:
+            errors.append({"row": fila, "uid": d.get("uid"), "error": str(e)})
+            continue
+        if row[1] in seen:
+            errors.append({"row": fila, "uid": row[1], "error": f"UID repetido (fila {seen[row[1]]})"})
+            continue
+        seen[row[1]] = fila
+        rows.append(row)
+    return rows, errors
+
+
+def read_csv(data: bytes):
+    """CSV con encabezado uid,nombre,correo (',' o ';'; con o sin BOM) -> [(fila, dict)]"""
+    text = data.decode("utf-8-sig")
+    try:
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    if reader.fieldnames is None:
+        raise CardImportError("CSV vacío")
+    reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+    missing = [f for f in FIELDS if f not in reader.fieldnames]
+    if missing:
+        raise CardImportError(f"faltan columnas: {', '.join(missing)}")
+    # fila 1 = encabezado
+    return [(n, d) for n, d in enumerate(reader, 2)]
+
+
+def read_json(items):
+    """Lista de objetos {uid, nombre, correo} -> [(fila, dict)] (fila desde 1)"""
+    if not isinstance(items, list):
+        raise CardImportError("se esperaba una lista")
+    return [(n, d if isinstance(d, dict) else {}) for n, d in enumerate(items, 1)]
+
+
+def import_chunk_db(conn, rows, relink: bool = False):
+    """Staging con fast_executemany + un batch (MERGE_SQL) -> {UID: INSERT/UPDATE/CONFLICT}"""
+    cur = conn.cursor()
+    try:
+        cur.execute(STAGE_CREATE)
+        cur.fast_executemany = True
+        cur.executemany(STAGE_INSERT, rows)
+        cur.execute(MERGE_SQL, (1 if relink else 0,))
+        actions = {str(r[0]).upper(): r[1] for r in cur.fetchall()}
+        conn.commit()
+        return actions
+    except Exception:
+        # XACT_ABORT cortó el batch antes de restaurar las opciones de la conexión
+        try:
+            cur.execute(RESET_SQL)
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
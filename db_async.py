@@ -0,0 +1,65 @@
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DBBusy(Exception):
+    """La cola del executor de BD está llena (se responde 503)"""
+
+
+class DBExecutor:
+    """
+    Executor dedicado para el trabajo bloqueante de pyodbc.
+    Los endpoints son async y hacen 'await executor.run(fn, ...)': mientras esperan
+    no ocupan hilos, así miles de requests en vuelo no agotan el threadpool de Starlette.
+    - workers: hilos de BD (conviene = DB_POOL_MAX, así nunca esperan conexión)
+    - max_queue: trabajos esperando hilo; por encima se rechaza con DBBusy
+    """
+
+    def __init__(self, workers: int = 16, max_queue: int = 2000, name: str = "db"):
+        if workers < 1 or max_queue < 0:
+            raise ValueError("Tamaños de executor inválidos")
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0     # en cola + ejecutándose
+        self._running = 0
+        self._done = 0
+        self._rejected = 0
+
+    def _call(self, fn, args):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise DBBusy(f"Cola de BD llena ({self.max_queue} en espera)")
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._call, fn, args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._done += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "maxQueue": self.max_queue,
+                "running": self._running,
+                "queued": max(0, self._pending - self._running),
+                "done": self._done,
+                "rejected": self._rejected,
+            }
@@ -0,0 +1,284 @@
+import time, threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """No se consiguió conexión libre dentro del timeout de checkout"""
+
+
+def is_disconnect(exc) -> bool:
+    """
+    True si el error (o su causa, en 'raise ... from e') indica conexión caída.
+    SQLSTATE clase 08 (connection exception) y 01002 (disconnect error).
+    """
+    while exc is not None:
+        args = getattr(exc, "args", None)
+        state = str(args[0]) if args else ""
+        if state.startswith("08") or state == "01002":
+            return True
+        exc = exc.__cause__
+    return False
+
+
+def is_unique_violation(exc) -> bool:
+    """SQLSTATE 23000 por clave duplicada (errores nativos 2627 / 2601), no FK ni NOT NULL"""
+    args = getattr(exc, "args", None) or ("",)
+    msg = " ".join(str(a) for a in args)
+    return str(args[0]) == "23000" and ("(2627)" in msg or "(2601)" in msg)
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones (thread-safe).
+    - min_size conexiones se abren en warm() y se mantienen abiertas
+    - max_size es el tope de conexiones abiertas (libres + en uso)
+    - acquire() espera hasta 'timeout' segundos; si no hay, lanza PoolTimeout
+    - las conexiones con más de 'max_lifetime' segundos se reciclan al volver al pool
+    - no hay ping en el checkout: la validación es perezosa (quien la usa reintenta
+      si la conexión resultó caída) y opcionalmente en segundo plano (Keepalive)
+    """
+
+    def __init__(self, connect, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0, max_lifetime: float = 1800.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaños de pool inválidos")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, created_at, last_used)
+        self._born = {}           # id(conn) -> created_at de conexiones en uso
+        self._size = 0            # conexiones abiertas (libres + en uso)
+        self._closed = False
+
+        # métricas para dimensionar el pool
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._validated = 0
+
+    # ---------- apertura / cierre ----------
+    def _open(self):
+        conn = self._connect()
+        return conn, time.monotonic()
+
+    @staticmethod
+    def _close_quiet(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    def warm(self):
+        """Abre conexiones hasta min_size (se llama al arrancar la app)"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn, born = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, born, time.monotonic()))
+                self._cond.notify()
+
+    def close(self):
+        """Cierra las conexiones libres; las que están en uso se cierran al devolverse"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quiet(conn)
+
+    # ---------- checkout / return ----------
+    def acquire(self):
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Pool cerrado")
+                    if self._idle:
+                        conn, born, _ = self._idle.pop()  # LIFO: la más caliente
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Sin conexiones libres tras {self.timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    conn, born = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif time.monotonic() - born > self.max_lifetime:
+                # conexión vieja: se recicla y se intenta otra
+                self._close_quiet(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._recycled += 1
+                    self._cond.notify()
+                continue
+
+            waited = time.monotonic() - t0
+            with self._cond:
+                self._born[id(conn)] = born
+                self._checkouts += 1
+                if waited > 0.001:
+                    self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return conn
+
+    def release(self, conn, discard: bool = False):
+        now = time.monotonic()
+        with self._cond:
+            born = self._born.pop(id(conn), None)
+            if born is None:
+                return  # no es de este pool (o ya fue devuelta)
+            stale = now - born > self.max_lifetime
+            if discard or stale or self._closed:
+                self._size -= 1
+                if stale:
+                    self._recycled += 1
+                elif discard:
+                    self._discarded += 1
+                self._cond.notify()
+            else:
+                self._idle.append((conn, born, now))
+                self._cond.notify()
+                return
+        self._close_quiet(conn)
+
+    @contextmanager
+    def connection(self):
+        """Checkout con devolución garantizada; si la conexión se cayó, se descarta"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = is_disconnect(e)
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    # ---------- validación en segundo plano ----------
+    def validate_idle(self, min_idle: float = 0.0) -> int:
+        """
+        Hace ping a las conexiones libres ociosas hace más de 'min_idle' segundos,
+        descarta las caídas y repone hasta min_size. Devuelve cuántas descartó.
+        Corre fuera del camino de las requests (lo llama Keepalive).
+        """
+        now = time.monotonic()
+        with self._cond:
+            keep, check = deque(), []
+            for item in self._idle:
+                (check if now - item[2] >= min_idle else keep).append(item)
+            self._idle = keep
+            # mientras se validan cuentan como "en uso" para no superar max_size
+            for conn, born, _ in check:
+                self._born[id(conn)] = born
+
+        dropped = 0
+        for conn, born, last_used in check:
+            ok = self._healthy(conn)
+            with self._cond:
+                self._born.pop(id(conn), None)
+                self._validated += 1
+                if ok and not self._closed:
+                    self._idle.appendleft((conn, born, last_used))
+                    self._cond.notify()
+                    continue
+                self._size -= 1
+                self._discarded += 1
+                self._cond.notify()
+            dropped += 1
+            self._close_quiet(conn)
+
+        try:
+            self.warm()
+        except Exception:
+            pass  # BD no disponible: se reintenta en la próxima vuelta
+        return dropped
+
+    # ---------- métricas ----------
+    def stats(self) -> dict:
+        with self._cond:
+            in_use = len(self._born)
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "inUse": in_use,
+                "minSize": self.min_size,
+                "maxSize": self.max_size,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "waitAvgMs": round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "waitMaxMs": round(self._wait_max * 1000, 3),
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "discarded": self._discarded,
+                "validated": self._validated,
+            }
+
+
+class Keepalive(threading.Thread):
+    """Hilo que cada 'interval' segundos valida las conexiones libres del pool"""
+
+    def __init__(self, pool: ConnectionPool, interval: float = 30.0):
+        super().__init__(name="db-keepalive", daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self._stop_evt = threading.Event()
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            try:
+                dropped = self.pool.validate_idle(self.interval)
+                if dropped:
+                    print(f"[db-keepalive] {dropped} conexiones caídas descartadas")
+            except Exception as e:
+                print("[db-keepalive] error:", e)
+
+    def stop(self):
+        self._stop_evt.set()
@@ -0,0 +1,64 @@
+import asyncio, itertools
+
+
+class Subscriber:
+    """Un suscriptor (p. ej. una pestaña con /api/events abierto)"""
+
+    def __init__(self, max_queue: int):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    async def get(self):
+        """Siguiente evento (id, tipo, datos); None si se lo desconectó por lento"""
+        return await self.queue.get()
+
+
+class EventBus:
+    """
+    Bus de eventos en proceso para empujar novedades a los dashboards (SSE).
+    - publish() no bloquea: cada suscriptor tiene una cola acotada ('max_queue')
+    - si la cola de un suscriptor está llena, se lo desconecta (slow consumer) en
+      lugar de frenar al publicador; el navegador se reconecta y recarga
+    Se usa desde el event loop (los endpoints async publican y los streams consumen).
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subs = set()
+        self._seq = itertools.count(1)
+        self._published = 0
+        self._dropped = 0
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.max_queue)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subs.discard(sub)
+
+    def publish(self, kind: str, data: dict):
+        ev = (next(self._seq), kind, data)
+        self._published += 1
+        for sub in list(self._subs):
+            try:
+                sub.queue.put_nowait(ev)
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: Subscriber):
+        self._subs.discard(sub)
+        sub.dropped = True
+        self._dropped += 1
+        # se vacía la cola y se deja el aviso de cierre
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subs),
+            "maxQueue": self.max_queue,
+            "published": self._published,
+            "dropped": self._dropped,
+        }
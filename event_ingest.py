@@ -0,0 +1,255 @@
+import hashlib, struct
+from datetime import datetime, timezone
+
+from fast_json import loads
+from session_store import SessionSweeper
+import wire
+
+# Fila de staging: (EventId, Kind, UID, Texto, Details, IdUsuario, Fecha)
+#   Kind 'L' -> LogAccesos (Texto = Resultado)   Kind 'U' -> UsedTags (Texto = Motivo)
+# Un evento OK de un lector genera una fila L y una U con el mismo EventId.
+STAGE_CREATE = """
+IF OBJECT_ID('tempdb..#ingest') IS NOT NULL DROP TABLE #ingest;
+CREATE TABLE #ingest (
+    EventId NVARCHAR(100) NOT NULL, Kind CHAR(1) NOT NULL, UID NVARCHAR(64) NOT NULL,
+    Texto NVARCHAR(200) NULL, Details NVARCHAR(400) NULL, IdUsuario INT NULL, Fecha DATETIME2 NOT NULL
+);
+"""
+STAGE_INSERT = "INSERT INTO #ingest (EventId, Kind, UID, Texto, Details, IdUsuario, Fecha) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Todo el lote en un batch: los EventId nuevos entran a IngestedEvents (dedupe) y solo
+# esos pasan a LogAccesos / UsedTags. UPDLOCK + HOLDLOCK: dos subidas del mismo lote en
+# paralelo no insertan dos veces. Devuelve cuántos eventos eran nuevos.
+# Sin parámetros, los SET quedarían en la conexión del pool: se restauran al final
+# (RESET_SQL si el batch se cortó).
+MERGE_SQL = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @new TABLE (EventId NVARCHAR(100) PRIMARY KEY);
+BEGIN TRAN;
+    INSERT INTO dbo.IngestedEvents (EventId)
+    OUTPUT INSERTED.EventId INTO @new
+    SELECT DISTINCT s.EventId FROM #ingest s
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.IngestedEvents e WITH (UPDLOCK, HOLDLOCK) WHERE e.EventId = s.EventId);
+
+    INSERT INTO dbo.LogAccesos (UID, Resultado, Details, Fecha)
+    SELECT s.UID, s.Texto, s.Details, s.Fecha
+    FROM #ingest s JOIN @new n ON n.EventId = s.EventId
+    WHERE s.Kind = 'L';
+
+    INSERT INTO dbo.UsedTags (UID, IdUsuario, Motivo, FechaUsado)
+    SELECT s.UID, COALESCE(s.IdUsuario, t.IdUsuario), s.Texto, s.Fecha
+    FROM #ingest s JOIN @new n ON n.EventId = s.EventId
+    LEFT JOIN dbo.AuthorizedTags t ON t.UID = s.UID
+    WHERE s.Kind = 'U';
+COMMIT;
+DROP TABLE #ingest;
+SET NOCOUNT OFF;
+SET XACT_ABORT OFF;
+SELECT COUNT(*) FROM @new;
+"""
+RESET_SQL = "SET NOCOUNT OFF; SET XACT_ABORT OFF;"
+
+RESULTADOS = {"OK", "DENIED", "ERROR"}
+MOTIVO_OFFLINE = "Offline"
+
+# Lote binario (wire.MEDIA_TYPE): ver(1) | count(4) | eventos
+#   evento: len(1) | eventId | len(1) | uid | result(1) | reason(1) | fecha(8, ms epoch UTC)
+_BATCH = struct.Struct(">BI")
+_EVENT_TAIL = struct.Struct(">BBQ")
+_RESULTS = {v: k for k, v in wire.RESULTS.items()}
+_REASONS = {v: k for k, v in wire.REASONS.items()}
+
+
+class IngestError(ValueError):
+    """Evento inválido (se rechaza solo ese evento)"""
+
+
+def _fecha(value) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, timezone.utc).replace(tzinfo=None)
+    dt = datetime.fromisoformat(str(value))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _uid(value) -> str:
+    uid = str(value or "").upper()
+    if not uid or len(uid) > 64:
+        raise IngestError("uid vacío o demasiado largo")
+    bytes.fromhex(uid)
+    return uid
+
+
+def _scoped(event_id, reader_id) -> str:
+    event_id = str(event_id or "")
+    if not event_id or len(event_id) > 64:
+        raise IngestError("eventId vacío o demasiado largo")
+    return f"{reader_id}:{event_id}" if reader_id else event_id
+
+
+def _reader_rows(event_id, uid, resultado, details, fecha):
+    if resultado not in RESULTADOS:
+        raise IngestError(f"resultado inválido: {resultado}")
+    rows = [(event_id, "L", uid, resultado, details, None, fecha)]
+    if resultado == "OK":
+        rows.append((event_id, "U", uid, MOTIVO_OFFLINE, None, None, fecha))
+    return rows
+
+
+def rows_from_json(d: dict, reader_id=None, raw: bytes = b""):
+    """
+    Un evento NDJSON -> filas de staging. Dos formas:
+    - lector: {"eventId", "uid", "resultado", "details"?, "fecha"? (ISO o ms epoch)}
+    - spill del audit_writer: {"t", "uid", "a", "b", "fecha"}; sin eventId propio,
+      se usa el hash de la línea (subir el mismo spill dos veces no duplica)
+    """
+    if not isinstance(d, dict):
+        raise IngestError("se esperaba un objeto")
+    if "t" in d:
+        event_id = "spill:" + hashlib.sha1(raw).hexdigest()
+        uid, fecha = str(d.get("uid") or ""), _fecha(d.get("fecha"))
+        if not uid or len(uid) > 64:
+            raise IngestError("uid vacío o demasiado largo")
+        if d["t"] == "log":
+            return [(event_id, "L", uid, d.get("a"), d.get("b"), None, fecha)]
+        if d["t"] == "used":
+            return [(event_id, "U", uid, d.get("b"), None, d.get("a"), fecha)]
+        raise IngestError(f"tipo de spill desconocido: {d['t']}")
+    details = d.get("details")
+    if details is not None:
+        details = str(details)[:400]
+    return _reader_rows(_scoped(d.get("eventId"), reader_id), _uid(d.get("uid")),
+                        d.get("resultado"), details, _fecha(d.get("fecha")))
+
+
+class ParsedBatch:
+    """Filas de staging de un lote + eventos recibidos/rechazados (primeros errores)"""
+
+    def __init__(self, max_errors: int = 20):
+        self.rows = []
+        self.received = 0
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self._seen = set()
+
+    def add(self, build, where):
+        self.received += 1
+        try:
+            rows = build()
+        except (IngestError, ValueError, TypeError, KeyError) as e:
+            self.rejected += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"at": where, "error": str(e)})
+            return
+        # mismo EventId repetido dentro del lote: cuenta como duplicado
+        if rows[0][0] in self._seen:
+            return
+        self._seen.add(rows[0][0])
+        self.rows.extend(rows)
+
+    @property
+    def unique(self) -> int:
+        return len(self._seen)
+
+
+def parse_ndjson(data: bytes, reader_id=None, max_errors: int = 20) -> ParsedBatch:
+    batch = ParsedBatch(max_errors)
+    for n, line in enumerate(data.splitlines(), 1):
+        line = line.strip()
+        if line:
+            batch.add(lambda: rows_from_json(loads(line), reader_id, line), n)
+    return batch
+
+
+def parse_binary(data: bytes, reader_id=None, max_errors: int = 20) -> ParsedBatch:
+    batch = ParsedBatch(max_errors)
+    try:
+        ver, count = _BATCH.unpack_from(data)
+    except struct.error:
+        raise IngestError("lote binario truncado")
+    if ver != wire.VERSION:
+        raise IngestError("versión desconocida")
+    pos = _BATCH.size
+    for n in range(1, count + 1):
+        try:
+            eid_len = data[pos]
+            event_id = data[pos + 1:pos + 1 + eid_len].decode("ascii")
+            pos += 1 + eid_len
+            uid_len = data[pos]
+            uid = data[pos + 1:pos + 1 + uid_len].hex().upper()
+            pos += 1 + uid_len
+            result, reason, ms = _EVENT_TAIL.unpack_from(data, pos)
+            pos += _EVENT_TAIL.size
+        except (IndexError, struct.error, UnicodeDecodeError):
+            raise IngestError(f"lote binario truncado en el evento {n}")
+        batch.add(lambda: _reader_rows(_scoped(event_id, reader_id), _uid(uid),
+                                       _RESULTS.get(result), _REASONS.get(reason), _fecha(ms)), n)
+    return batch
+
+
+def encode_binary(events) -> bytes:
+    """events = [(eventId, uid_bytes, resultado, reason, fecha_ms)] (lectores / pruebas)"""
+    out = [_BATCH.pack(wire.VERSION, len(events))]
+    for event_id, uid, resultado, reason, ms in events:
+        eid = event_id.encode("ascii")
+        out.append(bytes([len(eid)]) + eid + bytes([len(uid)]) + uid)
+        out.append(_EVENT_TAIL.pack(wire.RESULTS[resultado], wire.REASONS.get(reason, 0), ms))
+    return b"".join(out)
+
+
+def ingest_db(conn, rows, chunk: int = 5000) -> int:
+    """
+    Staging con fast_executemany en tandas de 'chunk' filas y un solo batch de
+    dedupe + inserts. Devuelve cuántos eventos eran nuevos.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(STAGE_CREATE)
+        cur.fast_executemany = True
+        for i in range(0, len(rows), chunk):
+            cur.executemany(STAGE_INSERT, rows[i:i + chunk])
+        cur.execute(MERGE_SQL)
+        accepted = int(cur.fetchone()[0])
+        conn.commit()
+        return accepted
+    except Exception:
+        # XACT_ABORT cortó el batch antes de restaurar las opciones de la conexión
+        try:
+            cur.execute(RESET_SQL)
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+
+
+class IngestSweeper(SessionSweeper):
+    """
+    Purga IngestedEvents: un EventId solo se recuerda 'retention_days' días desde que
+    entró. Pasada esa ventana, reenviar el mismo evento lo vuelve a insertar, así que
+    tiene que cubrir lo más que un lector o un spill pueden tardar en reintentar.
+    Mismos lotes DELETE TOP (n) con READPAST que el barrido de sesiones.
+    """
+
+    def __init__(self, run, retention_days: float, **kw):
+        super().__init__(run, name="ingest-sweeper", **kw)
+        self.retention_days = retention_days
+
+    def _delete_batch_db(self, conn, batch_size):
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                DELETE TOP ({int(batch_size)}) FROM dbo.IngestedEvents WITH (READPAST)
+                WHERE IngestedAt < DATEADD(second, -?, SYSUTCDATETIME())
+            """, (int(self.retention_days * 86400),))
+            return max(cur.rowcount, 0)
+        finally:
+            cur.close()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "retentionDays": self.retention_days}
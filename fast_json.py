@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson   # opcional: serializa datetime nativo y es mucho más rápido
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    raise TypeError(f"No serializable: {type(o).__name__}")
+
+
+def dumps(obj) -> bytes:
+    """JSON en bytes; datetime sale en ISO (igual que isoformat() para fechas naive)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def loads(data):
+    """bytes/str -> objeto (orjson si está instalado)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Respuesta JSON con orjson (si está instalado). Se usa devolviéndola directamente
+    desde el endpoint: FastAPI no pasa el contenido por jsonable_encoder.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def log_rows_page(rows, next_token=None) -> bytes:
+    """
+    Página de /api/logs directo desde las filas (IdLog, UID, Resultado, Details, Fecha)
+    en una sola llamada al serializador: sin isoformat() por fila ni jsonable_encoder.
+    (Medido: armar el JSON a mano campo por campo es más lento que esto con orjson.)
+    """
+    return dumps({
+        "count": len(rows),
+        "items": [
+            {"id": r[0], "uid": r[1], "resultado": r[2], "details": r[3], "fecha": r[4]}
+            for r in rows
+        ],
+        "next": next_token,
+    })
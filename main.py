@@ -1,44 +1,263 @@
-import os, binascii, uuid, hmac, hashlib, time, threading
-from datetime import datetime, timedelta
+import os, asyncio, base64, binascii, csv, io, json, re, hmac, hashlib, time, threading, zlib
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict
 
 import pyodbc
-from fastapi import FastAPI, HTTPException, Query, Form, Request, Response
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Form, Request, Response, WebSocket
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from connection import connection_string
+from alias_pool import AliasPool
+from allowlist import Allowlist
+from audit_writer import AuditWriter
+from card_import import CardImportError, import_chunk_db, parse_rows, read_csv, read_json
+from auth_cache import AuthCache
+from db_async import DBBusy, DBExecutor
+from db_pool import ConnectionPool, Keepalive, PoolTimeout, is_disconnect, is_unique_violation
+from event_bus import EventBus
+from event_ingest import IngestError, IngestSweeper, ingest_db, parse_binary, parse_ndjson
+from reader_hub import ReaderHub
+from fast_json import FastJSONResponse, dumps as fast_dumps, loads as fast_loads, log_rows_page
+from recent_events import RecentEvents
+from response_cache import ResponseCache, etag_matches
+from session_store import DBSessionStore, MemorySessionStore, SessionSweeper, SignedSessionStore
+from sql_trace import RequestTrace, SqlTracer, current_scope, current_trace
+import wire
 
 # ================== CONFIG ==================
 SECRET_KEY = b"MiEjemplo"
 NONCE_TTL_SECONDS = 3  # segundos
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # memory | db (RFID_Sessions) | signed (sin estado)
+# clave para firmar tokens de sesión (modo signed); igual en todos los nodos de API
+NONCE_SIGNING_KEY = (
+    os.getenv("NONCE_SIGNING_KEY", "").encode()
+    or hmac.new(SECRET_KEY, b"nonce-token", hashlib.sha256).digest()
+)
+# Barrido de RFID_Sessions vencidas (modo db)
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))  # 0 = desactivado
+SESSION_SWEEP_BATCH = int(os.getenv("SESSION_SWEEP_BATCH", "500"))       # filas por DELETE TOP (n)
+
+# Write-behind de LogAccesos / UsedTags
+AUDIT_BATCH = int(os.getenv("AUDIT_BATCH", "500"))                 # filas por executemany
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "0.5"))
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "")                # "" = sin archivo de respaldo
+
+# Alias pre-reservados en UsedAliases (la rotación de verify no espera colisiones)
+ALIAS_POOL_LOW = int(os.getenv("ALIAS_POOL_LOW", "200"))      # por debajo se rellena
+ALIAS_POOL_HIGH = int(os.getenv("ALIAS_POOL_HIGH", "1000"))   # 0 = sin pool
+ALIAS_POOL_BATCH = int(os.getenv("ALIAS_POOL_BATCH", "200"))  # alias por INSERT
+
+# Cache de AuthorizedTags (UID -> IdUsuario, Activa)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))             # 0 = sin cache
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))                # segundos
+AUTH_CACHE_NEG_TTL = float(os.getenv("AUTH_CACHE_NEG_TTL", "10"))        # UIDs desconocidos
+
+# Feed en vivo (SSE) para los dashboards
+SSE_QUEUE_MAX = int(os.getenv("SSE_QUEUE_MAX", "100"))          # eventos pendientes por suscriptor
+SSE_PING_SECONDS = float(os.getenv("SSE_PING_SECONDS", "15"))   # keepalive del stream
+
+# Últimos eventos en memoria (/api/ultimo-uid, /api/logs/last)
+RECENT_EVENTS_SIZE = int(os.getenv("RECENT_EVENTS_SIZE", "256"))
+
+# Cache de respuestas de /api/logs (se invalida al escribir logs)
+LOGS_CACHE_TTL = float(os.getenv("LOGS_CACHE_TTL", "2"))   # segundos; 0 = sin cache
+
+# /api/verify/batch: ítems por request (4 parámetros SQL por ítem; tope de SQL Server: 2100)
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "200"))
+
+# /api/nonce/batch: UIDs por request (4 parámetros SQL por sesión en modo db)
+NONCE_BATCH_MAX = int(os.getenv("NONCE_BATCH_MAX", "500"))
+
+# Desafíos pre-emitidos por lector (el lector los pide antes del tap)
+CHALLENGE_TTL_SECONDS = int(os.getenv("CHALLENGE_TTL_SECONDS", "60"))
+CHALLENGE_BATCH_MAX = int(os.getenv("CHALLENGE_BATCH_MAX", "16"))
+
+# Allowlist offline para lectores (/api/allowlist)
+ALLOWLIST_REFRESH_SECONDS = float(os.getenv("ALLOWLIST_REFRESH_SECONDS", "5"))  # cambios como mucho cada N s
+ALLOWLIST_HISTORY = int(os.getenv("ALLOWLIST_HISTORY", "10000"))  # cambios guardados para deltas
+
+# /api/tarjetas/import: alta masiva de tarjetas
+CARD_IMPORT_MAX_BYTES = int(os.getenv("CARD_IMPORT_MAX_BYTES", str(16 * 1024 * 1024)))
+CARD_IMPORT_CHUNK = int(os.getenv("CARD_IMPORT_CHUNK", "1000"))   # filas por transacción
+
+# /api/logs/ingest: eventos guardados offline por los lectores o del spill
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(64 * 1024 * 1024)))   # cuerpo ya descomprimido
+INGEST_CHUNK = int(os.getenv("INGEST_CHUNK", "5000"))   # filas por executemany al staging
+INGEST_DEDUPE_DAYS = float(os.getenv("INGEST_DEDUPE_DAYS", "30"))    # cuánto se recuerda un EventId
+INGEST_SWEEP_SECONDS = float(os.getenv("INGEST_SWEEP_SECONDS", "3600"))  # 0 = desactivado
+
+# Canal WebSocket de lectores (/ws/reader)
+READER_WS_INFLIGHT = int(os.getenv("READER_WS_INFLIGHT", "4"))   # pedidos en paralelo por conexión
+READER_WS_MAX_FRAME = int(os.getenv("READER_WS_MAX_FRAME", "4096"))
+
+# /api/logs/export: filas por fetchmany
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "1000"))
+EXPORT_IDLE_SECONDS = float(os.getenv("EXPORT_IDLE_SECONDS", "60"))   # cliente sin leer: se corta
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))   # exports a la vez (más: 503)
+
+# Trazas SQL por request (Server-Timing + /api/admin/sql); apagado no mide nada
+SQL_TRACE = os.getenv("SQL_TRACE", "0") == "1"
+SQL_TRACE_LOG = os.getenv("SQL_TRACE_LOG", "")   # NDJSON con las sentencias de cada request; "" = no
+
+# Pool de conexiones (dimensionar con /api/admin/pool)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "16"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))              # segundos esperando conexión
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # segundos
+DB_KEEPALIVE_SECONDS = float(os.getenv("DB_KEEPALIVE_SECONDS", "30"))    # 0 = sin hilo de validación
+DB_QUEUE_MAX = int(os.getenv("DB_QUEUE_MAX", "2000"))  # trabajos de BD en espera antes de responder 503
 
 # ================== DB POOL ==================
-_pool_lock = threading.Lock()
-_conn_pool = None
+db_pool = ConnectionPool(
+    lambda: pyodbc.connect(connection_string, autocommit=True),
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+)
+
+tracer = SqlTracer(enabled=SQL_TRACE, log_path=SQL_TRACE_LOG)
 
 def get_db():
-    """Reutiliza una única conexión reconecta"""
-    global _conn_pool
-    with _pool_lock:
-        if _conn_pool is None:
-            _conn_pool = pyodbc.connect(connection_string, autocommit=True)
-            return _conn_pool
+    """Saca una conexión del pool (se devuelve con release_db)"""
+    return db_pool.acquire()
+
+def release_db(conn, discard: bool = False):
+    db_pool.release(conn, discard=discard)
+
+@contextmanager
+def db_conn():
+    """db_pool.connection() (devolución garantizada, descarte si se cayó) + traza SQL"""
+    t0 = time.perf_counter()
+    with db_pool.connection() as conn:
+        if tracer.enabled:
+            tracer.record(current_trace.get(), "db.pool", (time.perf_counter() - t0) * 1000)
+        yield tracer.wrap(conn)
+
+def run_db(fn, *args, idempotent: bool = False):
+    """
+    Ejecuta fn(conn, *args). No se hace ping previo: si la conexión resultó caída
+    (error de desconexión) se descarta. Solo con idempotent=True se reintenta una vez
+    con otra: una escritura pudo quedar confirmada en el servidor antes del corte
+    (p. ej. el DELETE ... OUTPUT de una sesión) y repetirla cambia el resultado.
+    """
+    if tracer.enabled:
+        # las sentencias quedan etiquetadas con el nombre de fn (p. ej. "_pop_db:DELETE")
+        token = current_scope.set(getattr(fn, "__name__", "sql"))
         try:
-            cur = _conn_pool.cursor()
-            cur.execute("SELECT 1")
-            cur.close()
-            return _conn_pool
-        except Exception:
-            try:
-                _conn_pool.close()
-            except Exception:
-                pass
-            _conn_pool = pyodbc.connect(connection_string, autocommit=True)
-            return _conn_pool
+            return _run_db(fn, args, idempotent)
+        finally:
+            current_scope.reset(token)
+    return _run_db(fn, args, idempotent)
+
+def _run_db(fn, args, idempotent):
+    try:
+        with db_conn() as conn:
+            return fn(conn, *args)
+    except Exception as e:
+        if not (idempotent and is_disconnect(e)):
+            raise
+    with db_conn() as conn:
+        return fn(conn, *args)
+
+# Hilos propios para pyodbc: un hilo por conexión del pool
+db_executor = DBExecutor(workers=DB_POOL_MAX, max_queue=DB_QUEUE_MAX)
+# /api/logs/export tiene hilos aparte: un export ocupa su hilo mientras el cliente lee y
+# no puede dejar sin hilos a /api/verify. Sin cola (lleno = 503) y siempre por debajo del
+# pool, así las conexiones que toman los exports nunca son todas.
+export_executor = DBExecutor(workers=max(1, min(EXPORT_MAX_CONCURRENT, DB_POOL_MAX - 1)),
+                             max_queue=0, name="db-export")
+open_exports = set()            # (créditos, stop) de los exports en curso: se cortan al apagar
+open_exports_lock = threading.Lock()
+
+async def db_run(fn, *args, idempotent: bool = False):
+    """Versión async de run_db: el endpoint espera sin bloquear el event loop ni el threadpool"""
+    if tracer.enabled:
+        return await db_executor.run(_run_db_traced, current_trace.get(), time.perf_counter(),
+                                     idempotent, fn, *args)
+    return await db_executor.run(_run_db_plain, idempotent, fn, *args)
+
+def _run_db_plain(idempotent, fn, *args):
+    return run_db(fn, *args, idempotent=idempotent)
+
+def _run_db_traced(trace, queued_at, idempotent, fn, *args):
+    """En el hilo de BD: la traza de la request no viaja sola al executor; se mide la cola"""
+    tracer.record(trace, "db.queue", (time.perf_counter() - queued_at) * 1000)
+    token = current_trace.set(trace)
+    try:
+        return run_db(fn, *args, idempotent=idempotent)
+    finally:
+        current_trace.reset(token)
+
+# ================== SESIONES (nonce) ==================
+if SESSION_STORE == "db":
+    session_store = DBSessionStore(db_run)
+elif SESSION_STORE == "signed":
+    # el anti-replay tiene que cubrir el token que más dura (los desafíos, no el nonce)
+    session_store = SignedSessionStore(NONCE_SIGNING_KEY,
+                                       ttl_seconds=max(NONCE_TTL_SECONDS, CHALLENGE_TTL_SECONDS))
+else:
+    session_store = MemorySessionStore(ttl_seconds=NONCE_TTL_SECONDS)
+
+session_sweeper = SessionSweeper(run_db, interval=SESSION_SWEEP_SECONDS, batch_size=SESSION_SWEEP_BATCH)
+ingest_sweeper = IngestSweeper(run_db, INGEST_DEDUPE_DAYS, interval=INGEST_SWEEP_SECONDS,
+                               batch_size=SESSION_SWEEP_BATCH)
+
+# ================== AUDITORÍA (write-behind) ==================
+logs_cache = ResponseCache(ttl=LOGS_CACHE_TTL)
+
+def is_transient_db_error(e) -> bool:
+    """Conexión caída, pool agotado, deadlock (40001) o timeout (HYT00/HYT01): reintentable"""
+    if isinstance(e, PoolTimeout) or is_disconnect(e):
+        return True
+    args = getattr(e, "args", None)
+    return bool(args) and str(args[0]) in ("40001", "HYT00", "HYT01")
+
+audit = AuditWriter(
+    run_db,
+    on_write=logs_cache.invalidate,  # hay filas nuevas en LogAccesos
+    is_transient=is_transient_db_error,  # lo demás (FK, datos) termina en cuarentena
+    batch_size=AUDIT_BATCH,
+    flush_interval=AUDIT_FLUSH_SECONDS,
+    max_queue=AUDIT_QUEUE_MAX,
+    spill_path=AUDIT_SPILL_PATH,
+)
+
+# ================== ALIAS PRE-RESERVADOS ==================
+alias_pool = AliasPool(
+    run_db,
+    low=min(ALIAS_POOL_LOW, ALIAS_POOL_HIGH),
+    high=ALIAS_POOL_HIGH,
+    batch_size=ALIAS_POOL_BATCH,
+)
+
+# ================== EVENTOS EN VIVO ==================
+events = EventBus(max_queue=SSE_QUEUE_MAX)
+recent = RecentEvents(size=RECENT_EVENTS_SIZE)
+
+def publish_event(kind: str, event: dict):
+    """Guarda el evento en 'recent' y lo empuja al feed en vivo (fechas en ISO)"""
+    recent.add(kind, event)
+    events.publish(kind, {k: v.isoformat() if isinstance(v, datetime) else v for k, v in event.items()})
+
+def record_access(uid: str, resultado: str, details: Optional[str] = None):
+    """Registra la decisión de acceso: LogAccesos (write-behind) + memoria + feed en vivo"""
+    audit.log(uid, resultado, details)
+    publish_event("access", {
+        # IdLog lo asigna la BD al escribir el lote: aún no se conoce
+        "id": None, "uid": uid, "resultado": resultado, "details": details or "",
+        "fecha": datetime.utcnow(),
+    })
+
+# ================== CACHE DE AUTORIZACIÓN ==================
+auth_cache = AuthCache(max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, negative_ttl=AUTH_CACHE_NEG_TTL)
 
 # ================== UTILS ==================
 def hex_to_bytes(s: str) -> bytes:
@@ -55,41 +274,155 @@ def gen_alias_hex(nbytes: int = 8) -> str:
     """Genera alias aleatorio en hex (16 caracteres, 8 bytes)"""
     return binascii.hexlify(os.urandom(nbytes)).decode().upper()
 
-def rotate_alias(conn, uid_text: str) -> str:
-    """
-    Crea alias nuevo y actualiza tabla AuthorizedTags.
-    Evita colisión por UNIQUE en UsedAliases.Alias (si choca, reintenta)
-    """
-    cur = conn.cursor()
-    while True:
-        alias = gen_alias_hex(8)
-        try:
-            cur.execute("""
-                INSERT INTO dbo.UsedAliases (UID, Alias)
-                VALUES (?, ?)
-            """, (uid_text, alias))
+# Camino OK de /api/verify en UN round trip: autorización y rotación de alias.
+# Los registros (LogAccesos / UsedTags) van por el write-behind (audit_writer).
+# Con @reservado = 1 el alias viene del alias_pool (ya está en UsedAliases) y la
+# rotación es un UPDATE; si no, es un candidato y si ya existe se genera otro en el servidor.
+# XACT_ABORT: cualquier error revierte todo (se puede reintentar).
+VERIFY_OK_BATCH = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @uid NVARCHAR(64) = ?, @alias NVARCHAR(16) = ?, @reservado BIT = ?, @idUsuario INT = ?;
+DECLARE @activa BIT = 1, @asignado INT = 0;
 
-            cur.execute("""
-                UPDATE dbo.AuthorizedTags
-                SET CurrentAlias = ?, LastRotated = SYSUTCDATETIME()
-                WHERE UID = ? AND Activa = 1
-            """, (alias, uid_text))
-
-            if cur.rowcount == 0:
-                # revertir si no existe tag activo
-                cur.execute("DELETE FROM dbo.UsedAliases WHERE Alias = ?", (alias,))
-                conn.commit()
-                raise HTTPException(status_code=400, detail="UID no autorizado o inactivo")
-
-            conn.commit()
-            return alias
-
-        except pyodbc.Error:
-            # colisiona, vuelve a intentar con otro alias
-            continue
+-- @idUsuario viene del auth_cache; si es NULL se busca aquí
+IF @idUsuario IS NULL
+    SELECT @idUsuario = IdUsuario, @activa = Activa FROM dbo.AuthorizedTags WHERE UID = @uid;
+
+IF @idUsuario IS NULL OR @activa = 0
+BEGIN
+    SELECT 'DENIED' AS Result, 'NO_AUTORIZADO' AS Reason, CAST(NULL AS NVARCHAR(16)) AS Alias,
+           @idUsuario AS IdUsuario, @activa AS Activa;
+    RETURN;
+END
+
+BEGIN TRAN;
+    IF @reservado = 1
+    BEGIN
+        UPDATE dbo.UsedAliases SET UID = @uid WHERE Alias = @alias AND UID = N'';
+        SET @asignado = @@ROWCOUNT;
+    END
+
+    IF @asignado = 0
+    BEGIN
+        WHILE EXISTS (SELECT 1 FROM dbo.UsedAliases WHERE Alias = @alias)
+            SET @alias = CONVERT(NVARCHAR(16), CRYPT_GEN_RANDOM(8), 2);
+        INSERT INTO dbo.UsedAliases (UID, Alias) VALUES (@uid, @alias);
+    END
+
+    UPDATE dbo.AuthorizedTags
+    SET CurrentAlias = @alias, LastRotated = SYSUTCDATETIME()
+    WHERE UID = @uid AND Activa = 1;
+
+    -- cache desactualizado (la tarjeta se desactivó o se borró): se revierte todo
+    IF @@ROWCOUNT = 0
+    BEGIN
+        ROLLBACK;
+        SELECT 'DENIED' AS Result, 'NO_AUTORIZADO' AS Reason, CAST(NULL AS NVARCHAR(16)) AS Alias,
+               @idUsuario AS IdUsuario, CAST(0 AS BIT) AS Activa;
+        RETURN;
+    END
+COMMIT;
+
+SELECT 'OK' AS Result, CAST(NULL AS NVARCHAR(50)) AS Reason, @alias AS Alias,
+       @idUsuario AS IdUsuario, @activa AS Activa;
+"""
+
+# Versión set-based de VERIFY_OK_BATCH para /api/verify/batch: una fila por ítem en
+# @req (Pos, UID, Alias, Reservado). Los alias candidatos que ya existen (o se repiten
+# dentro del lote) se regeneran en el servidor; si un UID viene varias veces queda
+# como CurrentAlias el de la última posición.
+VERIFY_MANY_SQL = """
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+DECLARE @req TABLE (
+    Pos INT PRIMARY KEY, UID NVARCHAR(64) NOT NULL, Alias NVARCHAR(16) NOT NULL,
+    Reservado BIT NOT NULL, IdUsuario INT NULL, Activa BIT NULL, Asignado BIT NOT NULL DEFAULT 0
+);
+DECLARE @asignados TABLE (Alias NVARCHAR(16) PRIMARY KEY);
+
+INSERT INTO @req (Pos, UID, Alias, Reservado) VALUES {values};
+
+UPDATE r SET IdUsuario = t.IdUsuario, Activa = t.Activa
+FROM @req r JOIN dbo.AuthorizedTags t ON t.UID = r.UID;
+
+BEGIN TRAN;
+    UPDATE u SET UID = r.UID
+    OUTPUT INSERTED.Alias INTO @asignados
+    FROM dbo.UsedAliases u JOIN @req r ON u.Alias = r.Alias
+    WHERE r.Reservado = 1 AND r.Activa = 1 AND u.UID = N'';
+
+    UPDATE r SET Asignado = 1 FROM @req r JOIN @asignados a ON a.Alias = r.Alias;
+
+    WHILE EXISTS (
+        SELECT 1 FROM @req r
+        WHERE r.Activa = 1 AND r.Asignado = 0
+          AND (EXISTS (SELECT 1 FROM dbo.UsedAliases u WHERE u.Alias = r.Alias)
+               OR EXISTS (SELECT 1 FROM @req o WHERE o.Alias = r.Alias AND o.Pos < r.Pos))
+    )
+        UPDATE r SET Alias = CONVERT(NVARCHAR(16), CRYPT_GEN_RANDOM(8), 2)
+        FROM @req r
+        WHERE r.Activa = 1 AND r.Asignado = 0
+          AND (EXISTS (SELECT 1 FROM dbo.UsedAliases u WHERE u.Alias = r.Alias)
+               OR EXISTS (SELECT 1 FROM @req o WHERE o.Alias = r.Alias AND o.Pos < r.Pos));
+
+    INSERT INTO dbo.UsedAliases (UID, Alias)
+    SELECT UID, Alias FROM @req WHERE Activa = 1 AND Asignado = 0;
+
+    UPDATE t SET CurrentAlias = r.Alias, LastRotated = SYSUTCDATETIME()
+    FROM dbo.AuthorizedTags t
+    JOIN (
+        SELECT UID, Alias, ROW_NUMBER() OVER (PARTITION BY UID ORDER BY Pos DESC) AS rn
+        FROM @req WHERE Activa = 1
+    ) r ON r.UID = t.UID AND r.rn = 1
+    WHERE t.Activa = 1;
+COMMIT;
+
+SELECT Pos,
+       CASE WHEN Activa = 1 THEN 'OK' ELSE 'DENIED' END AS Result,
+       CASE WHEN Activa = 1 THEN NULL ELSE 'NO_AUTORIZADO' END AS Reason,
+       CASE WHEN Activa = 1 THEN Alias END AS Alias,
+       IdUsuario, Activa
+FROM @req
+ORDER BY Pos;
+"""
 
 # ================== APP ==================
-app = FastAPI(title="RFID Auth API (2s)")
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        db_pool.warm()
+    except Exception as e:
+        # la API arranca igual; el pool abre conexiones a demanda
+        print("No se pudo precalentar el pool:", e)
+    keepalive = None
+    if DB_KEEPALIVE_SECONDS > 0:
+        keepalive = Keepalive(db_pool, DB_KEEPALIVE_SECONDS)
+        keepalive.start()
+    if SESSION_STORE == "db" and SESSION_SWEEP_SECONDS > 0:
+        session_sweeper.start()
+    if INGEST_SWEEP_SECONDS > 0:
+        ingest_sweeper.start()
+    audit.start()
+    if ALIAS_POOL_HIGH > 0:
+        alias_pool.start()
+    yield
+    if keepalive:
+        keepalive.stop()
+    session_sweeper.stop()
+    ingest_sweeper.stop()
+    alias_pool.stop()
+    audit.stop()  # vacía la cola antes de cerrar el pool
+    tracer.flush_log()
+    with open_exports_lock:
+        for credits, stop in open_exports:
+            stop.set()
+            credits.release()
+    export_executor.shutdown()
+    db_executor.shutdown()
+    db_pool.close()
+
+app = FastAPI(title="RFID Auth API (2s)", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -106,16 +439,37 @@ app.add_middleware(
 @app.middleware("http")
 async def log_time(request, call_next):
     start = time.perf_counter()
-    response = await call_next(request)
+    if not tracer.enabled:
+        response = await call_next(request)
+        dur = time.perf_counter() - start
+        print(f"[{request.url.path}] {dur:.3f}s")
+        return response
+
+    # con SQL_TRACE: sentencias de la request en Server-Timing (y en SQL_TRACE_LOG)
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
     dur = time.perf_counter() - start
-    print(f"[{request.url.path}] {dur:.3f}s")
+    response.headers["Server-Timing"] = trace.server_timing(dur * 1000)
+    tracer.write_log(request.method, request.url.path, response.status_code, dur * 1000, trace)
+    print(f"[{request.url.path}] {dur:.3f}s ({len(trace.spans)} spans)")
     return response
 
+# --- Pool agotado o cola de BD llena -> 503 (el lector reintenta con backoff) ---
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(DBBusy)
+async def db_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 # ================== MODELOS ==================
 class VerifyReq(BaseModel):
     uid: str
     sessionId: str
     hmac: str
+    readerId: Optional[str] = None  # solo con desafíos pre-emitidos (/api/challenges)
 
 # ================== ENDPOINTS CORE ==================
 # Salud
@@ -124,107 +478,325 @@ def health():
     return {"ok": True, "time": datetime.utcnow().isoformat()}
 
 # 1) NONCE
-@app.get("/api/nonce")
-def api_nonce(uid: str = Query(..., description="UID en hex (ejemplo: C59B3706)")):
+async def _issue_nonce(uid: str):
+    """Crea y guarda la sesión de un UID -> (sessionId, nonce); compartido con /ws/reader"""
     try:
         _ = hex_to_bytes(uid)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"UID inválido: {e}")
 
-    session_id = str(uuid.uuid4())
     nonce = os.urandom(16)
     expire_at = datetime.utcnow() + timedelta(seconds=NONCE_TTL_SECONDS)
+    session_id = session_store.new_id(uid, nonce, expire_at)
 
-    conn = get_db()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            INSERT INTO RFID_Sessions (SessionId, UID, Nonce, CreatedAt, ExpireAt)
-            VALUES (?, ?, ?, SYSUTCDATETIME(), ?)
-        """, (session_id, uid, pyodbc.Binary(nonce), expire_at))
+        await session_store.put(session_id, uid, nonce, expire_at)
+    except (PoolTimeout, DBBusy):
+        raise
     except Exception as e:
         print("Error SQL /api/nonce:", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
 
-    return {"sessionId": session_id, "nonce": bytes_to_hex(nonce)}
+    publish_event("nonce", {"uid": uid, "createdAt": datetime.utcnow()})
+    return session_id, nonce
+
+@app.get("/api/nonce", response_class=FastJSONResponse)
+async def api_nonce(uid: str = Query(..., description="UID en hex (ejemplo: C59B3706)"),
+                    accept: Optional[str] = Header(None)):
+    session_id, nonce = await _issue_nonce(uid)
+    if wire.wants_binary(accept):
+        return Response(wire.encode_nonce(session_id, nonce), media_type=wire.MEDIA_TYPE)
+    return FastJSONResponse({"sessionId": session_id, "nonce": bytes_to_hex(nonce)})
+
+# 1b) NONCE por lotes: una sesión por UID, guardadas en una sola operación del store
+# (INSERT multi-fila en modo db). Un UID inválido da error solo en su ítem.
+@app.post("/api/nonce/batch", response_class=FastJSONResponse)
+async def api_nonce_batch(uids: List[str]):
+    if len(uids) > NONCE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {NONCE_BATCH_MAX} UIDs por lote")
+
+    results: List[Dict] = []
+    sessions = []
+    for uid in uids:
+        try:
+            _ = hex_to_bytes(uid)
+        except Exception as e:
+            results.append({"uid": uid, "error": f"UID inválido: {e}"})
+            continue
+        nonce = os.urandom(16)
+        expire_at = datetime.utcnow() + timedelta(seconds=NONCE_TTL_SECONDS)
+        session_id = session_store.new_id(uid, nonce, expire_at)
+        sessions.append((session_id, uid, nonce, expire_at))
+        results.append({"uid": uid, "sessionId": session_id, "nonce": bytes_to_hex(nonce)})
+
+    try:
+        await session_store.put_many(sessions)
+    except (PoolTimeout, DBBusy):
+        raise
+    except Exception as e:
+        print("Error SQL /api/nonce/batch:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    now = datetime.utcnow()
+    for _, uid, _, _ in sessions:
+        publish_event("nonce", {"uid": uid, "createdAt": now})
+    return FastJSONResponse(results)
+
+# 1c) DESAFÍOS PRE-EMITIDOS por lector: el lector pide varios por adelantado (sin UID)
+# y en el tap solo llama a /api/verify con readerId; se ahorra el GET /api/nonce.
+# Se guardan en el mismo session store ligados a "R:<readerId>" en lugar del UID, así
+# siguen siendo de un solo uso, vencen (CHALLENGE_TTL_SECONDS) y solo sirven para ese
+# lector. El HMAC del lector incluye el readerId: HMAC(SECRET_KEY, uid || nonce || readerId).
+READER_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+def reader_owner(reader_id: str) -> str:
+    return f"R:{reader_id}"
+
+def session_owner(req: VerifyReq) -> str:
+    """A quién está ligada la sesión: el UID (nonce normal) o el lector (desafío)"""
+    return reader_owner(req.readerId) if req.readerId else req.uid
+
+def publish_tap(uid: str):
+    """Con desafíos no hay /api/nonce: el tap se anuncia al verificar (registrar.html)"""
+    publish_event("nonce", {"uid": uid, "createdAt": datetime.utcnow()})
+
+async def _issue_challenges(readerId: str, n: int):
+    """Emite n desafíos para el lector -> [{sessionId, nonce}]; compartido con /ws/reader"""
+    if not READER_ID_RE.match(readerId):
+        raise HTTPException(status_code=400, detail="readerId inválido")
+    n = min(n, CHALLENGE_BATCH_MAX)
+
+    owner = reader_owner(readerId)
+    items, sessions = [], []
+    for _ in range(n):
+        nonce = os.urandom(16)
+        expire_at = datetime.utcnow() + timedelta(seconds=CHALLENGE_TTL_SECONDS)
+        session_id = session_store.new_id(owner, nonce, expire_at)
+        sessions.append((session_id, owner, nonce, expire_at))
+        items.append({"sessionId": session_id, "nonce": bytes_to_hex(nonce)})
+
+    try:
+        await session_store.put_many(sessions)
+    except (PoolTimeout, DBBusy):
+        raise
+    except Exception as e:
+        print("Error SQL /api/challenges:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return items
+
+@app.get("/api/challenges", response_class=FastJSONResponse)
+async def api_challenges(
+    readerId: str = Query(..., description="Identificador del lector (p. ej. PUERTA-1)"),
+    n: int = Query(4, ge=1),
+):
+    items = await _issue_challenges(readerId, n)
+    return FastJSONResponse({"readerId": readerId, "ttlSeconds": CHALLENGE_TTL_SECONDS, "items": items})
 
 # 2) VERIFY
-@app.post("/api/verify")
-def api_verify(req: VerifyReq):
-    conn = get_db()
+def _authorize_db(conn, uid, reserved_alias=None, id_usuario=None):
+    """Autorización + rotación de alias en un solo batch (la sesión ya fue consumida)"""
+    cur = conn.cursor()
+    try:
+        for attempt in range(3):
+            try:
+                if reserved_alias and attempt == 0:
+                    cur.execute(VERIFY_OK_BATCH, (uid, reserved_alias, 1, id_usuario))
+                else:
+                    cur.execute(VERIFY_OK_BATCH, (uid, gen_alias_hex(8), 0, id_usuario))
+                return cur.fetchone()
+            except pyodbc.Error as e:
+                # carrera en UNIQUE de UsedAliases: el batch se revirtió entero, se reintenta;
+                # cualquier otro error (permisos, FK, sintaxis) sale de una
+                if not is_unique_violation(e) or attempt == 2:
+                    raise
+    finally:
+        cur.close()
+
+def _authorize_many_db(conn, items):
+    """
+    Versión por lotes de _authorize_db: items = [(uid, alias_reservado o None), ...].
+    Un solo batch set-based (VERIFY_MANY_SQL); filas (Result, Reason, Alias, IdUsuario, Activa)
+    en el mismo orden que items.
+    """
+    sql = VERIFY_MANY_SQL.format(values=", ".join(["(?, ?, ?, ?)"] * len(items)))
     cur = conn.cursor()
     try:
-        uid_bin = hex_to_bytes(req.uid)
+        for attempt in range(3):
+            params = []
+            for pos, (uid, reserved) in enumerate(items):
+                params += [pos, uid, reserved or gen_alias_hex(8), 1 if reserved else 0]
+            try:
+                cur.execute(sql, params)
+                return [tuple(r[1:]) for r in cur.fetchall()]
+            except pyodbc.Error as e:
+                if not is_unique_violation(e) or attempt == 2:
+                    raise
+    finally:
+        cur.close()
+
+def _parse_hmac(value: str):
+    try:
+        return binascii.unhexlify(value)
+    except Exception:
+        return None
+
+def _precheck(req: VerifyReq, uid_bin: bytes, provided_hmac: bytes, sess):
+    """
+    Validaciones de verify que no tocan la BD, en el orden de siempre.
+    Devuelve (respuesta DENIED o None, tag del auth_cache o None).
+    """
+    # Sesión (ligada a UID, un solo uso)
+    if not sess:
+        return {"result": "DENIED", "reason": "SESSION_INVALIDA"}, None
+
+    nonce, expire_at = sess
+    if datetime.utcnow() > expire_at:
+        return {"result": "DENIED", "reason": "SESSION_EXPIRADA"}, None
+
+    # HMAC
+    msg = uid_bin + nonce + (req.readerId.encode() if req.readerId else b"")
+    hm_server = hmac.new(SECRET_KEY, msg, hashlib.sha256).digest()
+    if not hmac.compare_digest(hm_server, provided_hmac):
+        record_access(req.uid, "DENIED", "HMAC_INVALIDO")
+        return {"result": "DENIED", "reason": "HMAC_INVALIDO"}, None
+    # tap auténtico (sesión válida + HMAC): recién ahora va al feed / registrar.html,
+    # aunque el UID no esté autorizado
+    if req.readerId:
+        publish_tap(req.uid)
+
+    # UID desconocido o inactivo en cache: se niega sin ir a la BD
+    cached, tag = auth_cache.get(req.uid)
+    if cached and (tag is None or not tag[1]):
+        record_access(req.uid, "DENIED", "NO_AUTORIZADO")
+        return {"result": "DENIED", "reason": "NO_AUTORIZADO"}, None
+    return None, tag if cached else None
+
+def _finish(uid: str, reserved, row, cached: bool = False):
+    """
+    Aplica el resultado de la BD: cache, alias no usado, registros y respuesta.
+    cached=True: el batch usó el tag del auth_cache y no leyó AuthorizedTags; un OK solo
+    devuelve lo mismo y no renueva la entrada (así vence y se relee con el TTL).
+    """
+    result, reason, alias, id_usuario, activa = row
+    if not cached or result != "OK":
+        auth_cache.put(uid, (id_usuario, bool(activa)) if id_usuario is not None else None)
+    # la decisión ya está: los registros se escriben en segundo plano
+    if result != "OK":
+        if reserved:
+            alias_pool.give_back(reserved)
+        record_access(uid, "DENIED", reason)
+        return {"result": result, "reason": reason}
+    record_access(uid, "OK")
+    audit.used(uid, id_usuario, "Post-OK")
+    return {"result": "OK", "alias": alias}
+
+async def _verify(req: VerifyReq):
+    try:
+        # mismo resultado por ítem que /api/verify/batch (antes era un 500)
         try:
-            provided_hmac = binascii.unhexlify(req.hmac)
-        except Exception:
+            uid_bin = hex_to_bytes(req.uid)
+        except (binascii.Error, ValueError):
+            return {"result": "ERROR", "reason": "UID_INVALIDO"}
+        provided_hmac = _parse_hmac(req.hmac)
+        if provided_hmac is None:
             return {"result": "DENIED", "reason": "HMAC_MALFORMADO"}
 
-        # Sesión (ligada a UID)
-        cur.execute("""
-            SELECT Nonce, ExpireAt
-            FROM RFID_Sessions
-            WHERE SessionId = ? AND UID = ?
-        """, (req.sessionId, req.uid))
-        row = cur.fetchone()
-        if not row:
-            return {"result": "DENIED", "reason": "SESSION_INVALIDA"}
-
-        nonce, expire_at = bytes(row[0]), row[1]
-        if datetime.utcnow() > expire_at:
-            cur.execute("DELETE FROM RFID_Sessions WHERE SessionId = ?", (req.sessionId,))
-            conn.commit()
-            return {"result": "DENIED", "reason": "SESSION_EXPIRADA"}
-
-        # HMAC
-        hm_server = hmac.new(SECRET_KEY, uid_bin + nonce, hashlib.sha256).digest()
-        if not hmac.compare_digest(hm_server, provided_hmac):
-            cur.execute(
-                "INSERT INTO LogAccesos (UID, Resultado, Details) VALUES (?, 'DENIED', 'HMAC_INVALIDO')",
-                (req.uid,),
-            )
-            conn.commit()
-            return {"result": "DENIED", "reason": "HMAC_INVALIDO"}
-
-        # Validación de autorización
-        cur.execute("SELECT IdUsuario, Activa FROM AuthorizedTags WHERE UID = ?", (req.uid,))
-        tag = cur.fetchone()
-        if not tag or not tag[1]:
-            cur.execute(
-                "INSERT INTO LogAccesos (UID, Resultado, Details) VALUES (?, 'DENIED', 'NO_AUTORIZADO')",
-                (req.uid,),
-            )
-            conn.commit()
-            return {"result": "DENIED", "reason": "NO_AUTORIZADO"}
-
-        id_usuario = tag[0]
-
-        # Registrar OK y cerrar sesión
-        cur.execute("INSERT INTO LogAccesos (UID, Resultado) VALUES (?, 'OK')", (req.uid,))
-        cur.execute("DELETE FROM RFID_Sessions WHERE SessionId = ?", (req.sessionId,))
-        # (Opcional) registrar uso del UID
-        cur.execute(
-            "INSERT INTO UsedTags (UID, IdUsuario, Motivo) VALUES (?, ?, 'Post-OK')",
-            (req.uid, id_usuario),
-        )
-        conn.commit()
+        sess = await session_store.pop(req.sessionId, session_owner(req))
+        denied, tag = _precheck(req, uid_bin, provided_hmac, sess)
+        if denied:
+            return denied
 
-        # Rotación de alias
-        new_alias = rotate_alias(conn, req.uid)
-        return {"result": "OK", "alias": new_alias}
+        reserved = alias_pool.take()
+        row = await db_run(_authorize_db, req.uid, reserved, tag[0] if tag else None)
+        return _finish(req.uid, reserved, row, cached=tag is not None)
 
+    except (PoolTimeout, DBBusy):
+        raise
     except Exception as e:
         print("Error /api/verify:", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
+
+def _verify_req_from_wire(body: bytes) -> VerifyReq:
+    """
+    Cuerpo binario (wire.MEDIA_TYPE) -> VerifyReq con los mismos campos hex que JSON.
+    El UID queda en hex mayúscula (como lo manda el lector en /api/nonce).
+    """
+    try:
+        uid, session_id, provided_hmac, reader_id = wire.decode_verify(body)
+    except wire.WireError as e:
+        raise HTTPException(status_code=400, detail=f"Mensaje binario inválido: {e}")
+    return VerifyReq(uid=uid.hex().upper(), sessionId=session_id,
+                     hmac=provided_hmac.hex(), readerId=reader_id)
+
+@app.post(
+    "/api/verify",
+    response_class=FastJSONResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"$ref": "#/components/schemas/VerifyReq"}},
+        wire.MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}},
+)
+async def api_verify(request: Request):
+    # JSON (por defecto) o formato binario fijo del lector (Content-Type: wire.MEDIA_TYPE);
+    # la respuesta va en el mismo formato que el pedido
+    body = await request.body()
+    if wire.is_binary(request.headers.get("content-type")):
+        res = await _verify(_verify_req_from_wire(body))
+        return Response(wire.encode_verify_result(res), media_type=wire.MEDIA_TYPE)
+    try:
+        req = VerifyReq.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    # la respuesta se devuelve ya serializada (sin jsonable_encoder)
+    return FastJSONResponse(await _verify(req))
+
+# 2b) VERIFY por lotes (gateways con muchas puertas): mismas reglas que /api/verify
+# por ítem, pero sesiones y autorización/rotación van en una sentencia por lote.
+@app.post("/api/verify/batch", response_class=FastJSONResponse)
+async def api_verify_batch(reqs: List[VerifyReq]):
+    if len(reqs) > VERIFY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {VERIFY_BATCH_MAX} ítems por lote")
+    try:
+        results: List[Optional[Dict]] = [None] * len(reqs)
+        parsed = {}
+        for i, req in enumerate(reqs):
+            try:
+                uid_bin = hex_to_bytes(req.uid)
+            except Exception:
+                results[i] = {"result": "ERROR", "reason": "UID_INVALIDO"}
+                continue
+            provided_hmac = _parse_hmac(req.hmac)
+            if provided_hmac is None:
+                results[i] = {"result": "DENIED", "reason": "HMAC_MALFORMADO"}
+                continue
+            parsed[i] = (uid_bin, provided_hmac)
+
+        idx = list(parsed)
+        sessions = await session_store.pop_many([(reqs[i].sessionId, session_owner(reqs[i])) for i in idx])
+
+        to_db = []   # (índice, alias reservado)
+        for i, sess in zip(idx, sessions):
+            denied, _ = _precheck(reqs[i], *parsed[i], sess)
+            if denied:
+                results[i] = denied
+            else:
+                to_db.append((i, alias_pool.take()))
+
+        if to_db:
+            rows = await db_run(_authorize_many_db, [(reqs[i].uid, reserved) for i, reserved in to_db])
+            for (i, reserved), row in zip(to_db, rows):
+                results[i] = _finish(reqs[i].uid, reserved, row)
+
+        return FastJSONResponse(results)
+
+    except (PoolTimeout, DBBusy):
+        raise
+    except Exception as e:
+        print("Error /api/verify/batch:", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
 # 3) Registro de tarjeta
-@app.post("/agregar_tarjeta")
-def agregar_tarjeta(uid: str = Form(...), nombre: str = Form(...), correo: str = Form(...)):
-    conn = get_db()
+def _agregar_tarjeta_db(conn, uid, nombre, correo):
     cur = conn.cursor()
     try:
         cur.execute("SELECT IdUsuario FROM Usuarios WHERE Nombre = ?", (nombre,))
@@ -246,51 +818,365 @@ def agregar_tarjeta(uid: str = Form(...), nombre: str = Form(...), correo: str =
     finally:
         cur.close()
 
+@app.post("/agregar_tarjeta")
+async def agregar_tarjeta(uid: str = Form(...), nombre: str = Form(...), correo: str = Form(...)):
+    try:
+        return await db_run(_agregar_tarjeta_db, uid, nombre, correo)
+    finally:
+        auth_cache.invalidate(uid)  # la entrada negativa del UID ya no vale
+
+# 3b) Importación masiva de tarjetas: CSV con encabezado uid,nombre,correo (text/csv)
+# o JSON [{uid, nombre, correo}] (application/json). Por tanda de CARD_IMPORT_CHUNK filas:
+# staging + MERGE en una transacción (card_import.MERGE_SQL), en lugar de ~4 round trips
+# por tarjeta. Usuarios por Nombre como agregar_tarjeta; un UID ya registrado de otro
+# usuario es conflicto (fila en errors) salvo ?relink=true. Una tanda que la BD rechaza
+# se repite fila por fila para marcar la fila culpable.
+async def _import_chunk(chunk, relink: bool):
+    """
+    Una tanda -> ({UID: acción}, errores por fila). Si la BD rechaza la tanda se repite
+    fila por fila para decir cuál fue; un error de conexión / BD ocupada la revierte entera.
+    """
+    try:
+        return await db_run(import_chunk_db, chunk, relink), []
+    except Exception as e:
+        print("Error SQL /api/tarjetas/import:", e)
+        if len(chunk) == 1:
+            return {}, [{"row": chunk[0][0], "uid": chunk[0][1], "error": f"error de BD: {e}"}]
+        if isinstance(e, DBBusy) or is_transient_db_error(e):
+            return {}, [{"row": r[0], "uid": r[1], "error": f"tanda revertida: {e}"} for r in chunk]
+    actions, errors = {}, []
+    for r in chunk:
+        a, err = await _import_chunk([r], relink)
+        actions.update(a)
+        errors += err
+    return actions, errors
+
+@app.post("/api/tarjetas/import")
+async def api_tarjetas_import(
+    request: Request,
+    relink: bool = Query(False, description="Re-vincular UIDs que ya son de otro usuario"),
+):
+    body = await request.body()
+    if len(body) > CARD_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Máximo {CARD_IMPORT_MAX_BYTES} bytes por archivo")
+    try:
+        if "json" in request.headers.get("content-type", ""):
+            records = read_json(fast_loads(body))
+        else:
+            records = await asyncio.to_thread(read_csv, body)
+    except (CardImportError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Archivo inválido: {e}")
+
+    rows, errors = parse_rows(records)
+    created = updated = 0
+    for i in range(0, len(rows), CARD_IMPORT_CHUNK):
+        chunk = rows[i:i + CARD_IMPORT_CHUNK]
+        actions, chunk_errors = await _import_chunk(chunk, relink)
+        errors += chunk_errors
+        created += sum(1 for a in actions.values() if a == "INSERT")
+        updated += sum(1 for a in actions.values() if a == "UPDATE")
+        for r in chunk:
+            if actions.get(r[1]) == "CONFLICT":
+                errors.append({"row": r[0], "uid": r[1], "error": "UID vinculado a otro usuario (relink=true para moverlo)"})
+            elif r[1] in actions:
+                auth_cache.invalidate(r[1])   # entradas negativas / usuario anterior
+
+    errors.sort(key=lambda e: e["row"])
+    return FastJSONResponse({
+        "received": len(records),
+        "created": created,
+        "updated": updated,
+        "unchanged": len(records) - len(errors) - created - updated,
+        "errors": errors,
+    })
+
 # 4) Listado de logs mostrar
+# Paginación keyset sobre IX_LogAccesos_Fecha (Fecha DESC, IdLog DESC): cada página
+# busca desde la última (Fecha, IdLog) vista, sin OFFSET; cuesta lo mismo la página 1
+# que la 10.000. El cursor 'next' es opaco para el cliente.
+def encode_logs_cursor(fecha: datetime, idlog: int) -> str:
+    raw = f"{fecha.isoformat()}|{idlog}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_logs_cursor(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        fecha, idlog = raw.split("|")
+        return datetime.fromisoformat(fecha), int(idlog)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _utc_naive(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _logs_where(uid, resultado, since, until):
+    """Filtros comunes de /api/logs y /api/logs/export -> (condiciones, parámetros)"""
+    where, params = [], []
+    if uid:
+        where.append("UID = ?")
+        params.append(uid)
+    if resultado:
+        where.append("Resultado = ?")
+        params.append(resultado)
+    if since:
+        where.append("Fecha >= ?")
+        params.append(since)
+    if until:
+        where.append("Fecha < ?")
+        params.append(until)
+    return where, params
+
+def _logs_db(conn, uid, limit, after=None, resultado=None, since=None, until=None):
+    where, params = _logs_where(uid, resultado, since, until)
+    if after:
+        # (Fecha, IdLog) < (f, id) escrito para que el optimizador haga seek por Fecha
+        where.append("Fecha <= ? AND (Fecha < ? OR IdLog < ?)")
+        params.extend([after[0], after[0], after[1]])
+
+    cur = conn.cursor()
+    try:
+        # una fila extra para saber si hay página siguiente
+        cur.execute(f"""
+            SELECT TOP ({limit + 1}) IdLog, UID, Resultado, ISNULL(Details,''), Fecha
+            FROM dbo.LogAccesos
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY Fecha DESC, IdLog DESC
+        """, params)
+
+        rows = cur.fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_token = encode_logs_cursor(rows[-1][4], rows[-1][0]) if more else None
+        # filas tal cual: log_rows_page las serializa sin pasar por dicts/isoformat
+        return rows, next_token
+    finally:
+        cur.close()
+
+# ETag débil: cambia cuando cambia la fila más nueva de la página
+def _logs_etag(rows, next_token) -> str:
+    newest = rows[0][0] if rows else 0
+    return f'W/"logs-{newest}-{len(rows)}-{next_token or ""}"'
+
 @app.get("/api/logs")
-def api_logs(
-    response: Response,
+async def api_logs(
     uid: Optional[str] = Query(None, description="UID en hex opcional"),
     limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Valor 'next' de la página anterior"),
+    resultado: Optional[str] = Query(None, description="OK / DENIED"),
+    since: Optional[datetime] = Query(None, description="Desde (UTC, inclusive)"),
+    until: Optional[datetime] = Query(None, description="Hasta (UTC, exclusivo)"),
+    if_none_match: Optional[str] = Header(None),
 ):
-    # borra caache
-    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    response.headers["Pragma"] = "no-cache"
+    after = decode_logs_cursor(cursor) if cursor else None
+    since, until = _utc_naive(since), _utc_naive(until)
 
-    cur = get_db().cursor()
+    # el navegador revalida siempre (no-cache); si nada cambió recibe 304 sin cuerpo
+    headers = {"Cache-Control": "no-cache", "Pragma": "no-cache"}
+    key = (uid, limit, cursor, resultado, since, until)
+    cached = logs_cache.get(key)
+    if cached is None:
+        generation = logs_cache.generation
+        rows, next_token = await db_run(_logs_db, uid, limit, after, resultado, since, until, idempotent=True)
+        cached = (_logs_etag(rows, next_token), log_rows_page(rows, next_token))
+        logs_cache.put(key, generation, *cached)
+
+    etag, content = cached
+    headers["ETag"] = etag
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# 4a) Ingesta por lotes de eventos de acceso: lo que los lectores decidieron offline
+# (con la allowlist) o el spill del audit_writer. NDJSON (una línea por evento) o lote
+# binario (Content-Type wire.MEDIA_TYPE), opcionalmente con Content-Encoding: gzip.
+# Dedupe por eventId (con readerId: "<readerId>:<eventId>"); subir dos veces el mismo
+# lote no duplica filas. Una sola conexión por lote: staging con fast_executemany y un
+# batch set-based (event_ingest.MERGE_SQL).
+@app.post("/api/logs/ingest")
+async def api_logs_ingest(request: Request, readerId: Optional[str] = Query(None)):
+    if readerId is not None and not READER_ID_RE.match(readerId):
+        raise HTTPException(status_code=400, detail="readerId inválido")
+
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        dec = zlib.decompressobj(wbits=31)
+        try:
+            body = dec.decompress(body, INGEST_MAX_BYTES + 1)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="gzip inválido")
+    if len(body) > INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Máximo {INGEST_MAX_BYTES} bytes por lote")
+
+    parse = parse_binary if wire.is_binary(request.headers.get("content-type")) else parse_ndjson
     try:
-        if uid:
-            cur.execute(f"""
-                SELECT TOP ({limit}) IdLog, UID, Resultado, ISNULL(Details,''), Fecha
-                FROM dbo.LogAccesos
-                WHERE UID = ?
-                ORDER BY Fecha DESC, IdLog DESC
-            """, (uid,))
-        else:
-            cur.execute(f"""
-                SELECT TOP ({limit}) IdLog, UID, Resultado, ISNULL(Details,''), Fecha
-                FROM dbo.LogAccesos
-                ORDER BY Fecha DESC, IdLog DESC
-            """)
+        # 100k líneas de JSON no se parsean en el event loop
+        batch = await asyncio.to_thread(parse, body, readerId)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        rows = cur.fetchall()
-        data: List[Dict] = []
-        for r in rows:
-            data.append({
-                "id": r[0],
-                "uid": r[1],
-                "resultado": r[2],
-                "details": r[3],
-                "fecha": r[4].isoformat() if r[4] else None
-            })
-        return {"count": len(data), "items": data}
+    accepted = 0
+    if batch.rows:
+        try:
+            accepted = await db_run(ingest_db, batch.rows, INGEST_CHUNK, idempotent=True)  # dedupe por EventId
+        except (PoolTimeout, DBBusy):
+            raise
+        except Exception as e:
+            print("Error SQL /api/logs/ingest:", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        if accepted:
+            logs_cache.invalidate()
+
+    return FastJSONResponse({
+        "received": batch.received,
+        "accepted": accepted,
+        "duplicates": batch.received - batch.rejected - accepted,
+        "rejected": batch.rejected,
+        "errors": batch.errors,
+    })
+
+# 4b) Exportación completa de logs (auditoría): NDJSON o CSV, opcionalmente gzip.
+# Las filas se leen con fetchmany en lotes y se van enviando; la memoria no depende
+# de cuántas filas haya y la conexión del pool se usa solo mientras dura el stream.
+def _export_line_ndjson(r):
+    return fast_dumps({
+        "id": r[0], "uid": r[1], "resultado": r[2], "details": r[3], "fecha": r[4],
+    }) + b"\n"
+
+def _export_line_csv(r):
+    buf = io.StringIO()
+    csv.writer(buf).writerow([r[0], r[1], r[2], r[3], r[4].isoformat() if r[4] else ""])
+    return buf.getvalue().encode()
+
+def _export_db(where, params, push, credits, stop):
+    """
+    Toda la vida del cursor en un solo trabajo de export_executor (mismo hilo): SELECT,
+    push(True), un fetchmany por cada crédito que libera el stream y al final close +
+    devolver la conexión, nunca con un fetch en curso. Los lotes / el error van por push.
+    """
+    conn = get_db()
+    broken = False
+    cur = None
+    with open_exports_lock:
+        open_exports.add((credits, stop))
+    try:
+        cur = tracer.wrap(conn, "_export_logs").cursor()
+        cur.execute(f"""
+            SELECT IdLog, UID, Resultado, ISNULL(Details,''), Fecha
+            FROM dbo.LogAccesos
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY Fecha ASC, IdLog ASC
+        """, params)
+        push(True)
+        while not stop.is_set():
+            if not credits.acquire(timeout=EXPORT_IDLE_SECONDS):
+                push(TimeoutError("el cliente dejó de leer el export"))
+                break
+            if stop.is_set():
+                break
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            push(rows)
+            if not rows:
+                break
+    except Exception as e:
+        broken = is_disconnect(e)
+        push(e)
     finally:
-        cur.close()
+        with open_exports_lock:
+            open_exports.discard((credits, stop))
+        if cur is not None:
+            cur.close()
+        release_db(conn, discard=broken)
+
+async def _start_export(where, params):
+    """
+    Lanza _export_db y espera a que el SELECT se haya ejecutado: PoolTimeout, DBBusy o
+    un error de SQL salen acá, antes de mandar el 200. -> (cola de lotes, créditos, stop)
+    """
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue()
+    credits = threading.Semaphore(2)   # lotes leídos por adelantado
+    stop = threading.Event()
+    job = asyncio.ensure_future(export_executor.run(
+        _export_db, where, params, lambda item: loop.call_soon_threadsafe(q.put_nowait, item), credits, stop,
+    ))
+    first = asyncio.ensure_future(q.get())
+    try:
+        await asyncio.wait({job, first}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        stop.set()
+        credits.release()
+        first.cancel()
+        raise
+    if not first.done():
+        first.cancel()
+        job.result()   # no llegó a ejecutar: DBBusy / PoolTimeout
+    started = first.result()
+    if isinstance(started, Exception):
+        raise started
+    return q, credits, stop
+
+async def _export_logs(fmt, compress, q, credits, stop):
+    line = _export_line_csv if fmt == "csv" else _export_line_ndjson
+    gz = zlib.compressobj(wbits=31) if compress else None   # wbits=31 -> formato gzip
+
+    def out(data: bytes):
+        return gz.compress(data) if gz else data
+
+    try:
+        if fmt == "csv":
+            yield out(b"id,uid,resultado,details,fecha\r\n")
+        while True:
+            rows = await q.get()
+            if isinstance(rows, Exception):
+                print("Error /api/logs/export:", rows)
+                raise rows
+            if not rows:
+                break
+            credits.release()
+            chunk = out(b"".join(line(r) for r in rows))
+            if chunk:
+                yield chunk
+        if gz:
+            yield gz.flush()
+    finally:
+        # sin await (si el cliente se fue la tarea está cancelada): el hilo de
+        # _export_db termina el fetch en curso, cierra el cursor y devuelve la conexión
+        stop.set()
+        credits.release()
+
+@app.get("/api/logs/export")
+async def api_logs_export(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = Query(False, description="Comprimir con gzip (Content-Encoding)"),
+    uid: Optional[str] = Query(None, description="UID en hex opcional"),
+    resultado: Optional[str] = Query(None, description="OK / DENIED"),
+    since: Optional[datetime] = Query(None, description="Desde (UTC, inclusive)"),
+    until: Optional[datetime] = Query(None, description="Hasta (UTC, exclusivo)"),
+):
+    where, params = _logs_where(uid, resultado, _utc_naive(since), _utc_naive(until))
+    try:
+        q, credits, stop = await _start_export(where, params)
+    except (PoolTimeout, DBBusy):
+        raise
+    except Exception as e:
+        print("Error SQL /api/logs/export:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {
+        "Content-Disposition": f'attachment; filename="logs.{format}"',
+        "Cache-Control": "no-store",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    media = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(_export_logs(format, gzip, q, credits, stop), media_type=media, headers=headers)
 
 # 5) ultimo log compatibilidad
-@app.get("/api/logs/last")
-def api_logs_last(uid: Optional[str] = Query(None, description="UID en hex opcional")):
-    cur = get_db().cursor()
+# Se responde desde 'recent' (lo llena record_access); la BD solo se consulta si esta
+# API todavía no vio ningún evento de ese UID (p. ej. recién reiniciada).
+def _logs_last_db(conn, uid):
+    cur = conn.cursor()
     try:
         if uid:
             cur.execute("""
@@ -307,47 +1193,281 @@ def api_logs_last(uid: Optional[str] = Query(None, description="UID en hex opcio
             """)
         row = cur.fetchone()
         if not row:
-            return {"hasData": False}
+            return None
         idlog, ruid, resu, det, fecha = row
-        return {
-            "hasData": True,
-            "id": idlog,
-            "uid": ruid,
-            "resultado": resu,
-            "details": det,
-            "fecha": fecha.isoformat()
-        }
+        return {"id": idlog, "uid": ruid, "resultado": resu, "details": det, "fecha": fecha}
     finally:
         cur.close()
 
+@app.get("/api/logs/last")
+async def api_logs_last(
+    response: Response,
+    uid: Optional[str] = Query(None, description="UID en hex opcional"),
+    if_none_match: Optional[str] = Header(None),
+):
+    ev = recent.last("access", uid)
+    if ev is None:
+        ev = await db_run(_logs_last_db, uid, idempotent=True)
+        if ev is None:
+            return {"hasData": False}
+        recent.seed("access", ev, latest=uid is None)
+    elif ev["id"] is None:
+        # evento en vivo: IdLog lo asigna la BD al escribir el lote (write-behind). Se
+        # responde la fila de la BD (id entero, como siempre); si ya es la de este
+        # evento, queda en memoria con su IdLog y las próximas no van a la BD
+        row = await db_run(_logs_last_db, uid, idempotent=True)
+        if row is None:
+            return {"hasData": False}
+        if row["fecha"] >= ev["fecha"]:
+            recent.replace("access", ev, row)
+        ev = row
+
+    # ETag débil por evento
+    etag = f'W/"last-{ev["uid"]}-{ev["fecha"].timestamp():.6f}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return {
+        "hasData": True,
+        "id": ev["id"],
+        "uid": ev["uid"],
+        "resultado": ev["resultado"],
+        "details": ev["details"],
+        "fecha": ev["fecha"].isoformat()
+    }
+
 # 6) ultimo UID de sesiones recientes
 @app.get("/api/ultimo-uid")
-def ultimo_uid(seconds: int = 10):
+async def ultimo_uid(seconds: int = 10):
     """
-    Devuelve el último UID leído en RFID_Sessions.
+    Devuelve el último UID que pidió nonce (memoria; si no hay, el session store).
     'seconds' = ventana máxima de antigüedad (por defecto 10 s).
     Respuesta: { "found": true/false, "uid": "E2894106", "createdAt": "..." }
     """
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            SELECT TOP 1 UID, CreatedAt
-            FROM dbo.RFID_Sessions
-            ORDER BY CreatedAt DESC
-        """)
-        row = cur.fetchone()
-        if not row:
+    ev = recent.last("nonce")
+    if ev is None:
+        last = await session_store.latest()
+        # los desafíos pre-emitidos están ligados a un lector, no a una tarjeta
+        if not last or last[0].startswith("R:"):
             return {"found": False}
+        ev = {"uid": last[0], "createdAt": last[1]}
+        recent.seed("nonce", ev, latest=True)
 
-        uid, created_at = row
-        # created_at proviene de SYSUTCDATETIME() (UTC naive)
-        if (datetime.utcnow() - created_at).total_seconds() <= seconds:
-            return {"found": True, "uid": uid, "createdAt": created_at.isoformat()}
-        else:
-            return {"found": False, "createdAt": created_at.isoformat()}
+    uid, created_at = ev["uid"], ev["createdAt"]
+    # created_at es UTC naive (SYSUTCDATETIME() o datetime.utcnow())
+    if (datetime.utcnow() - created_at).total_seconds() <= seconds:
+        return {"found": True, "uid": uid, "createdAt": created_at.isoformat()}
+    else:
+        return {"found": False, "createdAt": created_at.isoformat()}
+
+# 7) Feed en vivo (SSE): 'access' por cada decisión de verify, 'nonce' por cada lectura.
+# Reemplaza el polling de mostrar.html / registrar.html (no toca la BD).
+async def _sse_stream(request: Request):
+    sub = events.subscribe()
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            try:
+                ev = await asyncio.wait_for(sub.get(), timeout=SSE_PING_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            if ev is None:
+                break  # suscriptor lento: se corta y el navegador se reconecta
+            seq, kind, data = ev
+            yield f"id: {seq}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
     finally:
-        cur.close()
+        events.unsubscribe(sub)
+
+@app.get("/api/events")
+async def api_events(request: Request):
+    headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    return StreamingResponse(_sse_stream(request), media_type="text/event-stream", headers=headers)
+
+# ================== ALLOWLIST OFFLINE ==================
+# Lista firmada de UIDs activos para que el lector decida solo si la API o la BD no
+# responden (y suba después los accesos guardados). Versión = AllowlistChanges.Version:
+#   GET /api/allowlist               -> {version, count, uids: [...ordenados]}
+#   GET /api/allowlist/delta?since=v -> {since, version, add: [...], remove: [...]}
+#                                       (410 si v ya no está en el historial: pedir snapshot)
+# Firma: X-Allowlist-Signature = HMAC-SHA256(SECRET_KEY, "allowlist:" || cuerpo), en hex.
+# Con Accept: wire.MEDIA_TYPE el cuerpo va en el formato binario de wire.py.
+# Las respuestas se arman una vez por versión (allowlist_cache) y llevan ETag.
+allowlist_cache = ResponseCache(ttl=3600, max_entries=64)
+allowlist = Allowlist(
+    run_db,
+    min_interval=ALLOWLIST_REFRESH_SECONDS,
+    history=ALLOWLIST_HISTORY,
+    on_change=allowlist_cache.invalidate,
+)
+
+def sign_allowlist(body: bytes) -> str:
+    return hmac.new(SECRET_KEY, b"allowlist:" + body, hashlib.sha256).hexdigest()
+
+async def _allowlist_response(key, binary: bool, build, if_none_match):
+    """build() -> (etag, cuerpo) o None; se llama solo si no está en cache"""
+    try:
+        await db_executor.run(allowlist.refresh_if_stale)
+    except (PoolTimeout, DBBusy):
+        raise
+    except Exception as e:
+        print("Error SQL /api/allowlist:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    generation = allowlist_cache.generation
+    cached = allowlist_cache.get(key)
+    if cached is None:
+        built = build()
+        if built is None:
+            raise HTTPException(status_code=410, detail="Versión fuera del historial: pedir /api/allowlist")
+        allowlist_cache.put(key, generation, *built)
+        cached = built
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    headers["X-Allowlist-Signature"] = sign_allowlist(body)
+    media_type = wire.MEDIA_TYPE if binary else "application/json"
+    return Response(body, media_type=media_type, headers=headers)
+
+@app.get("/api/allowlist")
+async def api_allowlist(accept: Optional[str] = Header(None),
+                        if_none_match: Optional[str] = Header(None)):
+    binary = wire.wants_binary(accept)
+
+    def build():
+        version, uids = allowlist.snapshot()
+        if binary:
+            body = wire.encode_allowlist(version, uids)
+        else:
+            body = fast_dumps({"version": version, "count": len(uids), "uids": uids})
+        return f'"al-{version}-{int(binary)}"', body
+
+    return await _allowlist_response(("snapshot", binary), binary, build, if_none_match)
+
+@app.get("/api/allowlist/delta")
+async def api_allowlist_delta(since: int = Query(..., ge=0),
+                              accept: Optional[str] = Header(None),
+                              if_none_match: Optional[str] = Header(None)):
+    binary = wire.wants_binary(accept)
+
+    def build():
+        delta = allowlist.delta(since)
+        if delta is None:
+            return None
+        version, added, removed = delta
+        if binary:
+            body = wire.encode_allowlist_delta(since, version, added, removed)
+        else:
+            body = fast_dumps({"since": since, "version": version, "add": added, "remove": removed})
+        return f'"ald-{since}-{version}-{int(binary)}"', body
+
+    return await _allowlist_response(("delta", since, binary), binary, build, if_none_match)
+
+# ================== CANAL DE LECTORES (WebSocket) ==================
+# El lector abre /ws/reader?readerId=... una vez y reutiliza la conexión en cada tap:
+#   {"id": 1, "op": "nonce", "uid": "C59B3706"}             -> {"id": 1, "sessionId", "nonce"}
+#   {"id": 2, "op": "verify", "uid", "sessionId", "hmac"}    -> {"id": 2, "result", ...}
+#   {"id": 3, "op": "challenges", "n": 4}                   -> {"id": 3, "ttlSeconds", "items"}
+# Mismas reglas que los endpoints HTTP; un error va como {"id", "error", "status"}.
+reader_hub = ReaderHub(max_inflight=READER_WS_INFLIGHT, max_frame=READER_WS_MAX_FRAME)
+
+async def _reader_op(msg: dict, reader_id: Optional[str]) -> dict:
+    op = msg.get("op")
+    try:
+        if op == "nonce":
+            session_id, nonce = await _issue_nonce(str(msg.get("uid", "")))
+            return {"sessionId": session_id, "nonce": bytes_to_hex(nonce)}
+        if op == "verify":
+            req = VerifyReq.model_validate({k: msg[k] for k in VerifyReq.model_fields if k in msg})
+            # un desafío solo se gasta desde la conexión del lector al que está ligado
+            if req.readerId is not None and req.readerId != reader_id:
+                return {"error": "readerId no coincide con la conexión", "status": 400}
+            return await _verify(req)
+        if op == "challenges":
+            if not reader_id:
+                return {"error": "readerId requerido", "status": 400}
+            items = await _issue_challenges(reader_id, max(1, int(msg.get("n", 4))))
+            return {"ttlSeconds": CHALLENGE_TTL_SECONDS, "items": items}
+        return {"error": "OP_DESCONOCIDA", "status": 400}
+    except (ValidationError, ValueError, TypeError):
+        return {"error": "REQUEST_INVALIDO", "status": 422}
+    except HTTPException as e:
+        return {"error": e.detail, "status": e.status_code}
+    except (PoolTimeout, DBBusy) as e:
+        return {"error": str(e), "status": 503}
+
+@app.websocket("/ws/reader")
+async def ws_reader(ws: WebSocket, readerId: Optional[str] = None):
+    if readerId is not None and not READER_ID_RE.match(readerId):
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    await reader_hub.serve(ws, readerId, _reader_op)
+
+# ================== ADMIN ==================
+# Métricas del pool: espera de checkout y conexiones en uso
+@app.get("/api/admin/pool")
+def admin_pool():
+    return {**db_pool.stats(), "executor": db_executor.stats(), "exportExecutor": export_executor.stats()}
+
+# Barridos en segundo plano (sesiones vencidas, dedupe de ingesta): filas borradas
+@app.get("/api/admin/sweeper")
+def admin_sweeper():
+    return {**session_sweeper.stats(), "ingest": ingest_sweeper.stats()}
+
+# Alias pre-reservados: disponibles, tomados, veces que el pool estaba vacío
+@app.get("/api/admin/alias-pool")
+def admin_alias_pool():
+    return alias_pool.stats()
+
+# Cache de autorización: hits / misses (el SELECT de AuthorizedTags fuera del camino caliente)
+@app.get("/api/admin/auth-cache")
+def admin_auth_cache():
+    return auth_cache.stats()
+
+# Vaciar el cache tras editar AuthorizedTags a mano
+@app.post("/api/admin/auth-cache/flush")
+def admin_auth_cache_flush():
+    return {"flushed": auth_cache.flush()}
+
+# Feed en vivo: suscriptores conectados y desconectados por lentos
+@app.get("/api/admin/events")
+def admin_events():
+    return events.stats()
+
+# Canal de lectores: conexiones abiertas, lectores, pedidos atendidos
+@app.get("/api/admin/readers")
+def admin_readers():
+    return reader_hub.stats()
+
+# Allowlist offline: versión, UIDs activos, historial de cambios
+@app.get("/api/admin/allowlist")
+def admin_allowlist():
+    return {**allowlist.stats(), "cache": allowlist_cache.stats()}
+
+# SQL por sentencia (función:verbo): cantidad, promedio, p50/p95, máx, filas (SQL_TRACE=1)
+@app.get("/api/admin/sql")
+def admin_sql():
+    return tracer.stats()
+
+@app.post("/api/admin/sql/reset")
+def admin_sql_reset():
+    tracer.reset()
+    return {"ok": True}
+
+# Cache de /api/logs: hits / misses / invalidaciones
+@app.get("/api/admin/logs-cache")
+def admin_logs_cache():
+    return logs_cache.stats()
+
+# Write-behind de auditoría: cola, lotes escritos, spill
+@app.get("/api/admin/audit")
+def admin_audit():
+    return audit.stats()
 
 # ================== VISTAS ==================
 @app.get("/", response_class=HTMLResponse)
@@ -0,0 +1,92 @@
+import asyncio, json
+from collections import Counter
+
+from fast_json import dumps
+
+
+class ReaderHub:
+    """
+    Canal persistente de los lectores (/ws/reader): el lector abre un WebSocket una vez
+    y manda pedidos {"id": n, "op": ...}; cada respuesta lleva el mismo "id".
+    - un lector inactivo es solo una corrutina esperando receive(): miles cuestan poco
+    - hasta 'max_inflight' pedidos por conexión se atienden en paralelo; con más, se deja
+      de leer el socket hasta que termine alguno (la contrapresión queda en TCP)
+    - los envíos de una conexión se serializan (las respuestas pueden salir en otro orden)
+    """
+
+    def __init__(self, max_inflight: int = 4, max_frame: int = 4096):
+        self.max_inflight = max_inflight
+        self.max_frame = max_frame
+        self._readers = Counter()    # readerId (o "") -> conexiones abiertas
+        self._requests = 0
+        self._errors = 0
+
+    async def serve(self, ws, reader_id, handler):
+        """Atiende la conexión hasta que se cierre; handler(msg, reader_id) -> dict"""
+        key = reader_id or ""
+        self._readers[key] += 1
+        send_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(self.max_inflight)
+        pending = set()
+
+        async def reply(req_id, data):
+            data["id"] = req_id
+            if "error" in data:
+                self._errors += 1
+            async with send_lock:
+                await ws.send_text(dumps(data).decode())
+
+        async def handle(msg):
+            try:
+                try:
+                    data = await handler(msg, reader_id)
+                except Exception as e:
+                    # el lector espera respuesta para ese id: nunca se deja sin contestar
+                    print("Error /ws/reader:", e)
+                    data = {"error": "INTERNO", "status": 500}
+                await reply(msg.get("id"), data)
+            except Exception as e:
+                print("Error /ws/reader (envío):", e)
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                text = await ws.receive_text()
+                self._requests += 1
+                await slots.acquire()
+                msg = self._parse(text)
+                if msg is None:
+                    slots.release()
+                    await reply(None, {"error": "MENSAJE_INVALIDO"})
+                    continue
+                task = asyncio.create_task(handle(msg))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except Exception:
+            pass  # desconexión (WebSocketDisconnect) o socket roto
+        finally:
+            # lo ya empezado termina (p. ej. una sesión consumida se registra igual)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            self._readers[key] -= 1
+            if self._readers[key] <= 0:
+                del self._readers[key]
+
+    def _parse(self, text: str):
+        if len(text) > self.max_frame:
+            return None
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return None
+        return msg if isinstance(msg, dict) else None
+
+    def stats(self) -> dict:
+        return {
+            "connections": sum(self._readers.values()),
+            "readers": sorted(k for k in self._readers if k),
+            "maxInflight": self.max_inflight,
+            "requests": self._requests,
+            "errors": self._errors,
+        }
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict, deque
+
+
+class RecentEvents:
+    """
+    Últimos eventos vistos por esta API, en memoria:
+    - anillo de tamaño fijo ('size') con los más recientes de cada tipo ('nonce', 'access')
+    - mapa UID -> último evento por tipo, acotado a 'max_uids' (LRU)
+    Lo llenan los endpoints que ya ven esos eventos (nonce / verify), así /api/ultimo-uid
+    y /api/logs/last responden sin ir a la BD. Tras un reinicio está vacío y esos
+    endpoints consultan la BD una vez (seed).
+    """
+
+    def __init__(self, size: int = 256, max_uids: int = 10000):
+        self.size = size
+        self.max_uids = max_uids
+        self._lock = threading.Lock()
+        self._ring = {}                  # tipo -> deque(maxlen=size)
+        self._by_uid = OrderedDict()     # (tipo, uid) -> evento
+
+    def _ring_for(self, kind):
+        ring = self._ring.get(kind)
+        if ring is None:
+            ring = self._ring[kind] = deque(maxlen=self.size)
+        return ring
+
+    def _remember(self, kind, event):
+        key = (kind, event["uid"])
+        self._by_uid[key] = event
+        self._by_uid.move_to_end(key)
+        while len(self._by_uid) > self.max_uids:
+            self._by_uid.popitem(last=False)
+
+    def add(self, kind: str, event: dict):
+        """event debe traer 'uid'; queda como el más reciente"""
+        with self._lock:
+            self._ring_for(kind).appendleft(event)
+            self._remember(kind, event)
+
+    def seed(self, kind: str, event: dict, latest: bool = False):
+        """
+        Carga un evento leído de la BD sin pisar uno más nuevo visto mientras tanto.
+        latest=True: es el último global (se pone en el anillo si está vacío).
+        """
+        with self._lock:
+            if latest:
+                ring = self._ring_for(kind)
+                if ring:
+                    return
+                ring.append(event)
+            if (kind, event["uid"]) not in self._by_uid:
+                self._remember(kind, event)
+
+    def replace(self, kind: str, old: dict, new: dict):
+        """Cambia 'old' por 'new' (p. ej. ya con IdLog de la BD) donde siga estando"""
+        with self._lock:
+            ring = self._ring.get(kind) or ()
+            for i, ev in enumerate(ring):
+                if ev is old:
+                    ring[i] = new
+            key = (kind, old["uid"])
+            if self._by_uid.get(key) is old:
+                self._by_uid[key] = new
+
+    def last(self, kind: str, uid: str = None):
+        with self._lock:
+            if uid is not None:
+                return self._by_uid.get((kind, uid))
+            ring = self._ring.get(kind)
+            return ring[0] if ring else None
+
+    def recent(self, kind: str, n: int = 50) -> list:
+        with self._lock:
+            ring = self._ring.get(kind) or ()
+            return [ev for _, ev in zip(range(n), ring)]
@@ -0,0 +1,82 @@
+import threading, time
+from collections import OrderedDict
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """Comparación débil de If-None-Match (puede traer varias etiquetas o '*')"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    for cand in if_none_match.split(","):
+        cand = cand.strip()
+        if cand.startswith("W/"):
+            cand = cand[2:]
+        if cand == tag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Cache corto de respuestas ya serializadas: clave -> (etag, cuerpo en bytes).
+    - cada entrada vive 'ttl' segundos; como máximo 'max_entries' (LRU)
+    - invalidate() sube la generación y descarta todo (se llama al escribir logs)
+    - put() recibe la generación leída antes de consultar la BD: si hubo
+      invalidación en el medio, el resultado ya viejo no se guarda
+    """
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()   # clave -> (etag, cuerpo, vence)
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[2] < now:
+                if item is not None:
+                    del self._data[key]
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return item[0], item[1]
+
+    def put(self, key, generation: int, etag: str, body: bytes):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = (etag, body, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "ttlSeconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,414 @@
+import base64, hashlib, hmac, math, struct, threading, time, uuid, zlib
+from datetime import datetime, timedelta
+
+import pyodbc
+
+
+class MemorySessionStore:
+    """
+    Sesiones nonce en memoria del proceso (default).
+    - dict repartido en 'shards' con su propio lock: poca contención entre requests
+    - cada shard purga con una rueda de tiempo (timing wheel): O(1) por sesión, sin hilos
+    - pop() es de un solo uso: la sesión se consume al verificarla, con o sin éxito
+    Las sesiones vencidas se conservan 'grace' segundos más para poder responder
+    SESSION_EXPIRADA en vez de SESSION_INVALIDA.
+    """
+
+    class _Shard:
+        __slots__ = ("lock", "items", "wheel", "cursor")
+
+        def __init__(self, slots: int, now_tick: int):
+            self.lock = threading.Lock()
+            self.items = {}                           # sid -> (uid, nonce, expire_at, created_at, purge_at)
+            self.wheel = [[] for _ in range(slots)]   # bucket -> [sid]
+            self.cursor = now_tick                    # último tick procesado
+
+    def __init__(self, ttl_seconds: float = 3, grace: float = 10.0,
+                 shards: int = 16, tick: float = 0.5):
+        self.tick = tick
+        self.grace = grace
+        horizon = ttl_seconds + grace
+        self._slots = int(math.ceil(horizon / tick)) + 2
+        now_tick = self._tick_of(time.monotonic())
+        self._shards = [self._Shard(self._slots, now_tick) for _ in range(shards)]
+        self._latest = None          # (uid, created_at) de la última sesión emitida
+        self._latest_lock = threading.Lock()
+
+    def _tick_of(self, t: float) -> int:
+        return int(t / self.tick)
+
+    def _shard(self, sid: str):
+        return self._shards[zlib.crc32(sid.encode()) % len(self._shards)]
+
+    def _advance(self, sh, now: float):
+        """Purga los buckets vencidos del shard (se llama con sh.lock tomado)"""
+        target = self._tick_of(now)
+        if target <= sh.cursor:
+            return
+        # si pasó más de una vuelta completa basta recorrer cada bucket una vez
+        start = max(sh.cursor + 1, target - self._slots + 1)
+        for t in range(start, target + 1):
+            bucket = sh.wheel[t % self._slots]
+            if not bucket:
+                continue
+            sh.wheel[t % self._slots] = []
+            for sid in bucket:
+                item = sh.items.get(sid)
+                if item is None:
+                    continue                      # ya consumida
+                if item[4] <= now:
+                    del sh.items[sid]
+                else:
+                    # todavía no vence (vuelta posterior de la rueda): se reprograma
+                    sh.wheel[(self._tick_of(item[4]) + 1) % self._slots].append(sid)
+        sh.cursor = target
+
+    def new_id(self, uid: str, nonce: bytes, expire_at: datetime) -> str:
+        return str(uuid.uuid4())
+
+    async def put(self, session_id: str, uid: str, nonce: bytes, expire_at: datetime):
+        self.put_nowait(session_id, uid, nonce, expire_at)
+
+    async def put_many(self, sessions):
+        """put() de varias (session_id, uid, nonce, expire_at)"""
+        for sess in sessions:
+            self.put_nowait(*sess)
+
+    def put_nowait(self, session_id: str, uid: str, nonce: bytes, expire_at: datetime):
+        now = time.monotonic()
+        created_at = datetime.utcnow()
+        purge_at = now + (expire_at - created_at).total_seconds() + self.grace
+        sh = self._shard(session_id)
+        with sh.lock:
+            self._advance(sh, now)
+            sh.items[session_id] = (uid, nonce, expire_at, created_at, purge_at)
+            # +1: el bucket de purge_at se procesa cuando el tick ya lo superó
+            sh.wheel[(self._tick_of(purge_at) + 1) % self._slots].append(session_id)
+        with self._latest_lock:
+            self._latest = (uid, created_at)
+
+    async def pop(self, session_id: str, uid: str):
+        return self.pop_nowait(session_id, uid)
+
+    async def pop_many(self, pairs):
+        """pop() de varias (session_id, uid); resultados en el mismo orden"""
+        return [self.pop_nowait(sid, uid) for sid, uid in pairs]
+
+    def pop_nowait(self, session_id: str, uid: str):
+        """Devuelve (nonce, expire_at) y consume la sesión; None si no existe o es de otro UID"""
+        now = time.monotonic()
+        sh = self._shard(session_id)
+        with sh.lock:
+            self._advance(sh, now)
+            item = sh.items.get(session_id)
+            if item is None or item[0] != uid:
+                return None
+            del sh.items[session_id]
+        return item[1], item[2]
+
+    async def latest(self):
+        """(uid, created_at) de la última sesión emitida, o None"""
+        with self._latest_lock:
+            return self._latest
+
+    def __len__(self):
+        now = time.monotonic()
+        total = 0
+        for sh in self._shards:
+            with sh.lock:
+                self._advance(sh, now)
+                total += len(sh.items)
+        return total
+
+
+class DBSessionStore:
+    """
+    Sesiones en la tabla RFID_Sessions (modo anterior; útil con varios nodos de API).
+    'run' es la función async que ejecuta fn(conn, ...) en el executor de BD.
+    """
+
+    def __init__(self, run):
+        self._run = run
+
+    def new_id(self, uid: str, nonce: bytes, expire_at: datetime) -> str:
+        return str(uuid.uuid4())
+
+    @staticmethod
+    def _put_db(conn, session_id, uid, nonce, expire_at):
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO RFID_Sessions (SessionId, UID, Nonce, CreatedAt, ExpireAt)
+                VALUES (?, ?, ?, SYSUTCDATETIME(), ?)
+            """, (session_id, uid, pyodbc.Binary(nonce), expire_at))
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _put_many_db(conn, sessions):
+        # un solo INSERT multi-fila para todo el lote
+        values = ", ".join(["(?, ?, ?, SYSUTCDATETIME(), ?)"] * len(sessions))
+        params = []
+        for session_id, uid, nonce, expire_at in sessions:
+            params += [session_id, uid, pyodbc.Binary(nonce), expire_at]
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                INSERT INTO RFID_Sessions (SessionId, UID, Nonce, CreatedAt, ExpireAt)
+                VALUES {values}
+            """, params)
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _pop_db(conn, session_id, uid):
+        # DELETE ... OUTPUT: lectura y consumo en un solo round trip (un solo uso)
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                DELETE FROM RFID_Sessions
+                OUTPUT DELETED.Nonce, DELETED.ExpireAt
+                WHERE SessionId = ? AND UID = ?
+            """, (session_id, uid))
+            row = cur.fetchone()
+            return (bytes(row[0]), row[1]) if row else None
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _pop_many_db(conn, pairs):
+        # un solo DELETE ... OUTPUT para todo el lote (JOIN contra VALUES)
+        values = ", ".join(["(?, ?)"] * len(pairs))
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                DELETE s
+                OUTPUT DELETED.SessionId, DELETED.Nonce, DELETED.ExpireAt
+                FROM RFID_Sessions s
+                JOIN (VALUES {values}) AS v(SessionId, UID)
+                  ON s.SessionId = v.SessionId AND s.UID = v.UID
+            """, [x for pair in pairs for x in pair])
+            found = {str(r[0]).lower(): (bytes(r[1]), r[2]) for r in cur.fetchall()}
+            # un SessionId repetido en el lote solo se consume una vez
+            out = []
+            for sid, _ in pairs:
+                out.append(found.pop(sid.lower(), None))
+            return out
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _latest_db(conn):
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT TOP 1 UID, CreatedAt
+                FROM dbo.RFID_Sessions
+                ORDER BY CreatedAt DESC
+            """)
+            row = cur.fetchone()
+            return (row[0], row[1]) if row else None
+        finally:
+            cur.close()
+
+    async def put(self, session_id: str, uid: str, nonce: bytes, expire_at: datetime):
+        await self._run(self._put_db, session_id, uid, nonce, expire_at)
+
+    async def pop(self, session_id: str, uid: str):
+        return await self._run(self._pop_db, session_id, uid)
+
+    async def put_many(self, sessions):
+        if sessions:
+            await self._run(self._put_many_db, sessions)
+
+    async def pop_many(self, pairs):
+        if not pairs:
+            return []
+        return await self._run(self._pop_many_db, pairs)
+
+    async def latest(self):
+        return await self._run(self._latest_db)
+
+
+class SessionSweeper(threading.Thread):
+    """
+    Borra en segundo plano las filas vencidas de RFID_Sessions (sesiones abandonadas:
+    lector que pidió nonce y nunca verificó). Lotes acotados DELETE TOP (n) con
+    READPAST, en autocommit: cada lote toma pocos locks (< escalamiento a tabla)
+    y salta las filas que un verify tenga bloqueadas.
+    'run' es la función sync que ejecuta fn(conn, ...) con una conexión del pool.
+    """
+
+    def __init__(self, run, interval: float = 60.0, batch_size: int = 500,
+                 max_batches: int = 100, pause: float = 0.05, name: str = "session-sweeper"):
+        super().__init__(name=name, daemon=True)
+        self._run = run
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause = pause
+        self._stop_evt = threading.Event()
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._total = 0
+        self._last_deleted = 0
+        self._last_run = None
+
+    @staticmethod
+    def _delete_batch_db(conn, batch_size):
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                DELETE TOP ({int(batch_size)}) FROM dbo.RFID_Sessions WITH (READPAST)
+                WHERE ExpireAt < SYSUTCDATETIME()
+            """)
+            return max(cur.rowcount, 0)
+        finally:
+            cur.close()
+
+    def sweep_once(self) -> int:
+        """Una pasada completa (hasta max_batches lotes). Devuelve filas borradas"""
+        deleted = 0
+        for _ in range(self.max_batches):
+            n = self._run(self._delete_batch_db, self.batch_size)
+            deleted += n
+            if n < self.batch_size or self._stop_evt.is_set():
+                break
+            time.sleep(self.pause)   # deja pasar a los verifies entre lotes
+        with self._lock:
+            self._runs += 1
+            self._total += deleted
+            self._last_deleted = deleted
+            self._last_run = datetime.utcnow()
+        return deleted
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            try:
+                n = self.sweep_once()
+                if n:
+                    print(f"[{self.name}] {n} filas vencidas borradas")
+            except Exception as e:
+                print(f"[{self.name}] error:", e)
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "intervalSeconds": self.interval,
+                "batchSize": self.batch_size,
+                "runs": self._runs,
+                "deletedTotal": self._total,
+                "deletedLastRun": self._last_deleted,
+                "lastRun": self._last_run.isoformat() if self._last_run else None,
+            }
+
+
+class _SeenSet:
+    """
+    Conjunto de nonces ya usados que solo cubre la ventana de validez.
+    Dos generaciones que rotan cada 'window' segundos: un nonce queda recordado
+    entre window y 2*window segundos, suficiente porque pasado el TTL el token
+    igual se rechaza por expiración.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._lock = threading.Lock()
+        self._cur, self._prev = set(), set()
+        self._rotate_at = time.monotonic() + window
+
+    def add_if_new(self, key: bytes) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._rotate_at:
+                # si pasó más de una ventana entera, ambas generaciones quedan viejas
+                self._prev = self._cur if now < self._rotate_at + self.window else set()
+                self._cur = set()
+                self._rotate_at = now + self.window
+            if key in self._cur or key in self._prev:
+                return False
+            self._cur.add(key)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cur) + len(self._prev)
+
+
+class SignedSessionStore:
+    """
+    Nonces sin estado: el sessionId es un token autenticado
+        base64url( ver(1) | expira_ms(8) | nonce(16) | MAC(16) )
+    con MAC = HMAC-SHA256(key, ver|expira|nonce|UID) truncado a 16 bytes.
+    /api/verify valida expiración y UID localmente, sin tabla ni dict de sesiones;
+    varios nodos de API comparten solo la clave. El anti-replay es un _SeenSet
+    local que cubre 'ttl_seconds' (por nodo: con varios nodos conviene enrutar cada
+    lector siempre al mismo); 'ttl_seconds' es el TTL del token más largo que se emita
+    y un token que vence más tarde se rechaza.
+    El JSON sigue siendo {"sessionId", "nonce"}: el token mide 55 caracteres.
+    """
+
+    VERSION = 1
+    _HEAD = struct.Struct(">BQ")
+    _MAC_LEN = 16
+
+    def __init__(self, key: bytes, ttl_seconds: float = 3, grace: float = 10.0):
+        self._key = key
+        self._max_ttl = timedelta(seconds=ttl_seconds)
+        self._seen = _SeenSet(ttl_seconds + grace)
+        self._latest = None
+        self._latest_lock = threading.Lock()
+
+    def _mac(self, payload: bytes, uid: str) -> bytes:
+        return hmac.new(self._key, payload + uid.encode(), hashlib.sha256).digest()[:self._MAC_LEN]
+
+    def new_id(self, uid: str, nonce: bytes, expire_at: datetime) -> str:
+        # expire_at es UTC naive: se pasa a epoch ms explícitamente como UTC
+        exp_ms = int((expire_at - datetime(1970, 1, 1)).total_seconds() * 1000)
+        payload = self._HEAD.pack(self.VERSION, exp_ms) + nonce
+        token = payload + self._mac(payload, uid)
+        return base64.urlsafe_b64encode(token).rstrip(b"=").decode()
+
+    async def put(self, session_id: str, uid: str, nonce: bytes, expire_at: datetime):
+        # nada que guardar: todo viaja en el token
+        with self._latest_lock:
+            self._latest = (uid, datetime.utcnow())
+
+    async def put_many(self, sessions):
+        if sessions:
+            with self._latest_lock:
+                self._latest = (sessions[-1][1], datetime.utcnow())
+
+    async def pop(self, session_id: str, uid: str):
+        return self.pop_nowait(session_id, uid)
+
+    async def pop_many(self, pairs):
+        """pop() de varias (session_id, uid); resultados en el mismo orden"""
+        return [self.pop_nowait(sid, uid) for sid, uid in pairs]
+
+    def pop_nowait(self, session_id: str, uid: str):
+        """(nonce, expire_at) si el token es auténtico para ese UID y no se usó antes"""
+        try:
+            raw = base64.urlsafe_b64decode(session_id + "=" * (-len(session_id) % 4))
+        except Exception:
+            return None
+        if len(raw) <= self._HEAD.size + self._MAC_LEN:
+            return None
+        payload, mac = raw[:-self._MAC_LEN], raw[-self._MAC_LEN:]
+        ver, exp_ms = self._HEAD.unpack_from(payload)
+        if ver != self.VERSION or not hmac.compare_digest(mac, self._mac(payload, uid)):
+            return None
+        expire_at = datetime(1970, 1, 1) + timedelta(milliseconds=exp_ms)
+        if expire_at > datetime.utcnow() + self._max_ttl:
+            return None   # vence después de lo que recuerda el _SeenSet: se podría repetir
+        nonce = payload[self._HEAD.size:]
+        if not self._seen.add_if_new(nonce):
+            return None   # replay
+        return nonce, expire_at
+
+    async def latest(self):
+        with self._latest_lock:
+            return self._latest
@@ -0,0 +1,241 @@
+import contextvars, json, queue, re, threading, time
+from collections import deque
+
+_VERB = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+# Traza de la request en curso y función de BD que se está ejecutando (run_db(fn, ...))
+current_trace = contextvars.ContextVar("sql_trace", default=None)
+current_scope = contextvars.ContextVar("sql_scope", default="sql")
+
+
+def statement_label(scope: str, sql: str) -> str:
+    """'_pop_db:DELETE': función que ejecuta + primer verbo DML del batch"""
+    m = _VERB.search(sql)
+    return f"{scope}:{m.group(1).upper() if m else 'EXEC'}"
+
+
+class RequestTrace:
+    """Sentencias de una request: (etiqueta, ms, filas); también espera de pool / cola"""
+
+    __slots__ = ("spans", "start")
+
+    def __init__(self):
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def add(self, label: str, ms: float, rows: int = -1):
+        self.spans.append([label, ms, rows])
+
+    def server_timing(self, total_ms: float, max_items: int = 10) -> str:
+        """Cabecera Server-Timing: total de BD, espera de pool/cola y las sentencias"""
+        sql = [s for s in self.spans if not s[0].startswith("db.")]
+        parts = [f'db;dur={sum(s[1] for s in sql):.1f};desc="{len(sql)} sql"']
+        for name in ("db.queue", "db.pool"):
+            waits = [s[1] for s in self.spans if s[0] == name]
+            if waits:
+                parts.append(f"{name.replace('.', '-')};dur={sum(waits):.1f}")
+        for i, (label, ms, _) in enumerate(sql[:max_items], 1):
+            parts.append(f'sql{i};dur={ms:.1f};desc="{label}"')
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+class TracedCursor:
+    """Cursor de pyodbc que mide execute/executemany y cuenta filas leídas"""
+
+    def __init__(self, cursor, tracer, trace, scope):
+        object.__setattr__(self, "_cur", cursor)
+        object.__setattr__(self, "_tracer", tracer)
+        object.__setattr__(self, "_trace", trace)
+        object.__setattr__(self, "_scope", scope)
+        object.__setattr__(self, "_span", None)
+        object.__setattr__(self, "_label", None)
+
+    def _timed(self, method, sql, *args):
+        label = statement_label(self._scope, sql)
+        t0 = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            rows = getattr(self._cur, "rowcount", -1)
+            object.__setattr__(self, "_label", label)
+            object.__setattr__(self, "_span", self._tracer.record(self._trace, label, ms, rows))
+
+    def execute(self, sql, *args):
+        self._timed(self._cur.execute, sql, *args)
+        return self
+
+    def executemany(self, sql, seq):
+        self._timed(self._cur.executemany, sql, seq)
+        return self
+
+    def _fetched(self, n):
+        # en un SELECT rowcount es -1: las filas se cuentan al leerlas
+        if self._label is None or not n:
+            return
+        self._tracer.add_rows(self._label, n)
+        if self._span is not None:
+            self._span[2] = max(self._span[2], 0) + n
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        self._fetched(1 if row is not None else 0)
+        return row
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def fetchmany(self, *args):
+        rows = self._cur.fetchmany(*args)
+        self._fetched(len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cur, name, value)   # p. ej. fast_executemany
+
+
+class TracedConnection:
+    def __init__(self, conn, tracer, trace, scope):
+        self._conn = conn
+        self._tracer = tracer
+        self._trace = trace
+        self._scope = scope
+
+    def cursor(self):
+        return TracedCursor(self._conn.cursor(), self._tracer, self._trace, self._scope)
+
+    @property
+    def autocommit(self):
+        return self._conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._conn.autocommit = value
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SqlTracer:
+    """
+    Instrumentación de las sentencias SQL (desactivada: wrap() devuelve la conexión tal cual).
+    - por request: RequestTrace en current_trace -> cabecera Server-Timing y, si hay
+      'log_path', una línea NDJSON por request (la escribe un hilo aparte: write_log
+      solo encola, no toca el disco desde el event loop; cola llena -> se descarta)
+    - agregado por etiqueta (función:verbo): cantidad, ms total / máx, filas y p50/p95
+      sobre las últimas 'sample' mediciones; incluye hilos de fondo (auditoría, sweeper...)
+    """
+
+    def __init__(self, enabled: bool = False, log_path: str = "", sample: int = 512,
+                 log_queue: int = 10000):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.sample = sample
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._log_q = queue.Queue(maxsize=log_queue)
+        self._log_thread = None
+        self._log_dropped = 0
+        self._stats = {}   # etiqueta -> [n, total_ms, max_ms, filas, deque(ms)]
+
+    def wrap(self, conn, scope: str = None):
+        if not self.enabled:
+            return conn
+        return TracedConnection(conn, self, current_trace.get(), scope or current_scope.get())
+
+    def record(self, trace, label: str, ms: float, rows: int = -1):
+        """Suma al agregado y a la traza de la request (si hay); devuelve el span"""
+        with self._lock:
+            st = self._stats.get(label)
+            if st is None:
+                st = self._stats[label] = [0, 0.0, 0.0, 0, deque(maxlen=self.sample)]
+            st[0] += 1
+            st[1] += ms
+            st[2] = max(st[2], ms)
+            st[3] += max(rows, 0)
+            st[4].append(ms)
+        if trace is None:
+            return None
+        span = [label, ms, rows]
+        trace.spans.append(span)
+        return span
+
+    def add_rows(self, label: str, n: int):
+        with self._lock:
+            st = self._stats.get(label)
+            if st is not None:
+                st[3] += n
+
+    def write_log(self, method: str, path: str, status: int, total_ms: float, trace: RequestTrace):
+        """Encola la línea de la request; el archivo lo escribe el hilo sql-trace-log"""
+        if not self.log_path:
+            return
+        with self._log_lock:
+            if self._log_thread is None:
+                self._log_thread = threading.Thread(target=self._log_loop, name="sql-trace-log", daemon=True)
+                self._log_thread.start()
+        try:
+            self._log_q.put_nowait((method, path, status, total_ms, list(trace.spans)))
+        except queue.Full:
+            with self._lock:
+                self._log_dropped += 1
+
+    @staticmethod
+    def _log_line(method, path, status, total_ms, spans) -> str:
+        return json.dumps({
+            "method": method, "path": path, "status": status, "ms": round(total_ms, 2),
+            "sql": [{"label": l, "ms": round(ms, 2), "rows": r} for l, ms, r in spans],
+        })
+
+    def _append(self, lines):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def _log_loop(self):
+        while True:
+            items = [self._log_q.get()]
+            while len(items) < 500:
+                try:
+                    items.append(self._log_q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._append([self._log_line(*it) for it in items])
+            except Exception as e:
+                print("[sql-trace-log] error:", e)
+            finally:
+                for _ in items:
+                    self._log_q.task_done()
+
+    def flush_log(self):
+        """Espera a que el hilo escriba lo encolado (apagado, tests)"""
+        if self._log_thread is not None:
+            self._log_q.join()
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self) -> dict:
+        def pct(values, p):
+            return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+        with self._lock:
+            items = [(label, st[0], st[1], st[2], st[3], sorted(st[4])) for label, st in self._stats.items()]
+        table = [
+            {
+                "label": label, "count": n, "avgMs": round(total / n, 2), "p50Ms": pct(s, 0.5),
+                "p95Ms": pct(s, 0.95), "maxMs": round(mx, 2), "rows": rows,
+            }
+            for label, n, total, mx, rows, s in items
+        ]
+        table.sort(key=lambda r: r["avgMs"] * r["count"], reverse=True)
+        with self._lock:
+            dropped = self._log_dropped
+        return {"enabled": self.enabled, "logDropped": dropped, "statements": table}
@@ -0,0 +1,47 @@
+# Costo de serializar una página de /api/logs (500 filas): camino anterior vs fast_json.
+# Uso: python test/bench_json_logs.py   (desde la raíz del proyecto)
+import json, os, sys, timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.encoders import jsonable_encoder
+import fast_json
+
+N_ROWS = 500
+REPEAT = 200
+
+def make_rows():
+    t0 = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    return [
+        (i, "C59B3706", "DENIED" if i % 3 else "OK", "HMAC_INVALIDO" if i % 3 else "", t0 - timedelta(seconds=i))
+        for i in range(N_ROWS, 0, -1)
+    ]
+
+def antes(rows):
+    # dicts por fila + isoformat + jsonable_encoder + json estándar (como FastAPI por defecto)
+    data = []
+    for r in rows:
+        data.append({
+            "id": r[0],
+            "uid": r[1],
+            "resultado": r[2],
+            "details": r[3],
+            "fecha": r[4].isoformat() if r[4] else None
+        })
+    body = jsonable_encoder({"count": len(data), "items": data, "next": None})
+    return json.dumps(body).encode()
+
+def despues(rows):
+    return fast_json.log_rows_page(rows, None)
+
+def main():
+    rows = make_rows()
+    assert json.loads(antes(rows)) == json.loads(despues(rows))
+    print(f"orjson: {'sí' if fast_json.orjson else 'no (json estándar)'} - {N_ROWS} filas por página")
+    for fn in (antes, despues):
+        t = min(timeit.repeat(lambda: fn(rows), number=REPEAT, repeat=5)) / REPEAT
+        print(f"{fn.__name__:8s} {t * 1000:8.3f} ms/página")
+
+if __name__ == "__main__":
+    main()
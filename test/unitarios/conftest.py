@@ -1,7 +1,8 @@
 # test/unitarios/conftest.py
 from pathlib import Path
+import binascii, hashlib, hmac, os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytest
 import importlib
 
@@ -12,6 +13,7 @@ ROOT = Path(__file__).resolve().parents[2]  # .../Tesis
 sys.path.insert(0, str(ROOT))
 
 from fastapi.testclient import TestClient
+from db_pool import ConnectionPool
 
 
 # ----------------------------------------------------------
@@ -23,6 +25,25 @@ class FakeCursor:
         self.last_exec = None
         self.rowcount = 0
         self._select_buffer = []
+        self.fast_executemany = False
+
+    def executemany(self, sql, seq):
+        # write-behind de auditoría: LogAccesos / UsedTags en lote
+        s = sql.lower()
+        rows = list(seq)
+        self.store.setdefault("executemany_calls", []).append(len(rows))
+        if "#import" in s:
+            self.store["import_stage"] = [tuple(r) for r in rows]
+            return self
+        if "#ingest" in s:
+            self.store["ingest_stage"].extend(tuple(r) for r in rows)
+            self.rowcount = len(rows)
+            return self
+        key = "logs" if "logacces" in s else "used"
+        for row in rows:
+            self.store.setdefault(key, []).append({"uid": row[0], "row": tuple(row), "at": datetime.utcnow()})
+        self.rowcount = len(rows)
+        return self
 
     def execute(self, sql, params=()):
         self.last_exec = (sql, params)
@@ -30,15 +51,115 @@ class FakeCursor:
         self.rowcount = 0
         self._select_buffer = []
 
+        # restaurar opciones de sesión tras un batch cortado (SET NOCOUNT / XACT_ABORT)
+        if s.startswith("set nocount off"):
+            self.store["session_resets"] = self.store.get("session_resets", 0) + 1
+            return self
+
+        # --- Importación masiva de tarjetas (staging #import + MERGE) ---
+        if "create table #import" in s:
+            self.store["import_stage"] = []
+            return self
+        if "merge dbo.authorizedtags" in s:
+            stage = self.store["import_stage"]
+            if any(r[2] == "FALLA" for r in stage):
+                raise Exception("FK violation")   # la tanda entera se revierte
+            relink = params[0]
+            # los tags iniciales de la BD simulada son de otro usuario
+            owners = self.store.setdefault("tag_owner", {})
+            for _, uid, nombre, _ in stage:
+                if uid not in self.store["tags"]:
+                    self.store["tags"].append(uid)
+                    self._select_buffer.append((uid, "INSERT"))
+                elif owners.get(uid, "otro") != nombre:
+                    if not relink:
+                        self._select_buffer.append((uid, "CONFLICT"))
+                        continue
+                    self._select_buffer.append((uid, "UPDATE"))
+                owners[uid] = nombre
+            return self
+
+        # --- Ingesta por lotes (staging #ingest + dedupe en IngestedEvents) ---
+        if "create table #ingest" in s:
+            self.store["ingest_stage"] = []
+            return self
+        if "insert into dbo.ingestedevents" in s:
+            new = set()
+            for row in self.store["ingest_stage"]:
+                eid = row[0]
+                if eid in self.store["ingested"] and eid not in new:
+                    continue
+                self.store["ingested"][eid] = datetime.utcnow()
+                new.add(eid)
+                key = "logs" if row[1] == "L" else "used"
+                self.store.setdefault(key, []).append({"uid": row[2], "row": row, "at": datetime.utcnow()})
+            self._select_buffer = [(len(new),)]
+            return self
+
+        # --- Allowlist offline (snapshot + cambios) ---
+        if "allowlistchanges" in s and "max(version)" in s:
+            changes = self.store["allowlist_changes"]
+            self._select_buffer = [(changes[-1][0] if changes else 0,)]
+            return self
+        if "allowlistchanges" in s and "version >" in s:
+            self._select_buffer = [c for c in self.store["allowlist_changes"] if c[0] > params[0]]
+            return self
+        if "from dbo.authorizedtags where activa = 1" in s:
+            self._select_buffer = [(u,) for u in self.store["tags"]]
+            return self
+
+        # --- Batch set-based de /api/verify/batch ---
+        if "declare @req table" in s:
+            out = []
+            for i in range(0, len(params), 4):
+                pos, uid, alias, reservado = params[i:i + 4]
+                if uid not in ["C59B3706", "A1B2C3D4"]:
+                    out.append((pos, "DENIED", "NO_AUTORIZADO", None, None, None))
+                    continue
+                if not (reservado and self.store["reserved"].pop(alias, None) is not None):
+                    while alias in self.store["aliases"]:
+                        alias = os.urandom(8).hex().upper()
+                    self.store["aliases"].add(alias)
+                out.append((pos, "OK", None, alias, 1, True))
+            self._select_buffer = out
+            return self
+
+        # --- Batch de /api/verify (autorización + alias en un round trip) ---
+        if "declare" in s and "authorizedtags" in s and "usedaliases" in s:
+            uid, alias, reservado, _id_usuario = params
+            self.store.setdefault("verify_batches", []).append(uid)
+            if uid not in ["C59B3706", "A1B2C3D4"]:
+                self._select_buffer = [("DENIED", "NO_AUTORIZADO", None, None, None)]
+                return self
+            if reservado and self.store["reserved"].pop(alias, None) is not None:
+                self._select_buffer = [("OK", None, alias, 1, True)]
+                return self
+            while alias in self.store["aliases"]:
+                alias = os.urandom(8).hex().upper()
+            self.store["aliases"].add(alias)
+            self._select_buffer = [("OK", None, alias, 1, True)]
+            return self
+
+        # --- Reserva de alias (alias_pool) ---
+        if "insert into" in s and "usedaliases" in s and "output inserted.alias" in s:
+            marker, candidates = params[0], params[1:]
+            for a in candidates:
+                if a not in self.store["aliases"]:
+                    self.store["aliases"].add(a)
+                    self.store["reserved"][a] = marker
+                    self._select_buffer.append((a,))
+            return self
+
         # --- RFID_Sessions ---
         if "insert into" in s and "rfid_session" in s:
-            sid, uid, nonce, expire = params
-            self.store["sessions"][sid] = {
-                "uid": uid,
-                "nonce": nonce,
-                "expire_at": expire
-            }
-            self.rowcount = 1
+            for i in range(0, len(params), 4):
+                sid, uid, nonce, expire = params[i:i + 4]
+                self.store["sessions"][sid] = {
+                    "uid": uid,
+                    "nonce": nonce,
+                    "expire_at": expire
+                }
+            self.rowcount = len(params) // 4
 
         elif "select" in s and "rfid_session" in s and "sessionid" in s:
             sid = params[0]
@@ -48,6 +169,37 @@ class FakeCursor:
             else:
                 self._select_buffer = []
 
+        elif "delete top" in s and "rfid_session" in s and "expireat" in s:
+            n = int(s.split("top (")[1].split(")")[0])
+            now = datetime.utcnow()
+            expired = [k for k, v in self.store["sessions"].items() if v["expire_at"] < now][:n]
+            for k in expired:
+                self.store["sessions"].pop(k)
+            self.rowcount = len(expired)
+
+        elif "delete top" in s and "ingestedevents" in s:
+            n = int(s.split("top (")[1].split(")")[0])
+            limit = datetime.utcnow() - timedelta(seconds=params[0])
+            old = [k for k, at in self.store["ingested"].items() if at < limit][:n]
+            for k in old:
+                self.store["ingested"].pop(k)
+            self.rowcount = len(old)
+
+        elif "delete s" in s and "rfid_session" in s and "values" in s:
+            for sid, uid in zip(params[0::2], params[1::2]):
+                data = self.store["sessions"].get(sid)
+                if data and data["uid"] == uid:
+                    self.store["sessions"].pop(sid)
+                    self._select_buffer.append((sid, data["nonce"], data["expire_at"]))
+
+        elif "delete" in s and "rfid_session" in s and "output" in s:
+            sid, uid = params[0], params[1]
+            data = self.store["sessions"].get(sid)
+            if data and data["uid"] == uid:
+                self.store["sessions"].pop(sid)
+                self._select_buffer = [(data["nonce"], data["expire_at"])]
+                self.rowcount = 1
+
         elif "delete" in s and "rfid_session" in s and "sessionid" in s:
             sid = params[0]
             self.store["sessions"].pop(sid, None)
@@ -94,11 +246,18 @@ class FakeCursor:
         self._select_buffer.clear()
         return out
 
+    def fetchmany(self, size=1):
+        out = self._select_buffer[:size]
+        del self._select_buffer[:size]
+        return out
+
     def close(self):
         pass
 
 
 class FakeConn:
+    autocommit = True
+
     def __init__(self, store):
         self.store = store
 
@@ -108,13 +267,18 @@ class FakeConn:
     def commit(self):
         pass
 
+    def rollback(self):
+        pass
+
     def close(self):
         pass
 
 
 def make_fake_get_db():
     """Crea una base de datos simulada nueva por prueba"""
-    store = {"sessions": {}, "logs": [], "aliases": set()}
+    store = {"sessions": {}, "logs": [], "aliases": set(), "reserved": {},
+             "tags": ["C59B3706", "A1B2C3D4"], "allowlist_changes": [],
+             "ingest_stage": [], "ingested": {}}
 
     def _get_db():
         return FakeConn(store)
@@ -122,6 +286,20 @@ def make_fake_get_db():
     return _get_db
 
 
+class FakePool:
+    """db_pool falso: acquire() da conexiones de la BD simulada; connection() es el real"""
+    connection = ConnectionPool.connection
+
+    def __init__(self, get_db):
+        self.acquire = get_db
+
+    def release(self, conn, discard=False):
+        pass
+
+    def stats(self):
+        return {}
+
+
 # ----------------------------------------------------------
 # 3  Fixture 'client' accesible desde todos los tests
 # ----------------------------------------------------------
@@ -142,7 +320,28 @@ def client():
         )
 
     # Reemplaza el acceso real a BD por la fake
-    appmod.get_db = make_fake_get_db()
+    appmod.db_pool = FakePool(make_fake_get_db())
 
     # Devuelve el cliente de prueba
     return TestClient(appmod.app)
+
+
+# ----------------------------------------------------------
+# 4  Firma del lector: nonce -> HMAC -> verify
+# ----------------------------------------------------------
+def firmar(uid, nonce_hex, reader=b"", key=None):
+    """HMAC-SHA256(uid || nonce || readerId) en hex, como lo calcula el lector"""
+    import main
+    msg = binascii.unhexlify(uid) + binascii.unhexlify(nonce_hex) + reader
+    return hmac.new(key or main.SECRET_KEY, msg, hashlib.sha256).hexdigest()
+
+
+def cuerpo_verify(client, uid, key=None):
+    """Pide un nonce para 'uid' y arma el cuerpo de /api/verify ya firmado"""
+    data = client.get("/api/nonce", params={"uid": uid}).json()
+    return {"uid": uid, "sessionId": data["sessionId"], "hmac": firmar(uid, data["nonce"], key=key)}
+
+
+def verify_ok(client, uid="C59B3706"):
+    """nonce + verify con la firma correcta; devuelve la respuesta de /api/verify"""
+    return client.post("/api/verify", json=cuerpo_verify(client, uid))
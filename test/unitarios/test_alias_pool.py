@@ -0,0 +1,36 @@
+# test/unitarios/test_alias_pool.py
+from alias_pool import AliasPool
+from conftest import verify_ok
+
+
+def _run_db(get_db):
+    return lambda fn, *args: fn(get_db(), *args)
+
+
+def test_rellena_hasta_high_y_avisa_en_low(client):
+    import main
+    pool = AliasPool(_run_db(main.get_db), low=3, high=10, batch_size=4)
+    assert pool.refill() == 10 and len(pool) == 10
+    for _ in range(6):
+        assert len(pool.take()) == 16
+    assert not pool._wake.is_set()
+    pool.take()   # quedan 3 = low
+    assert pool._wake.is_set()
+    assert pool.stats()["taken"] == 7
+
+
+def test_verify_usa_alias_reservado(client):
+    import main
+    store = main.get_db().store
+    main.alias_pool.refill()
+    reservado = main.alias_pool._aliases[0]
+
+    j = verify_ok(client).json()
+    assert j == {"result": "OK", "alias": reservado}
+    assert reservado not in store["reserved"]
+
+
+def test_pool_vacio_genera_alias(client):
+    import main
+    pool = AliasPool(_run_db(main.get_db), low=0, high=0)
+    assert pool.take() is None and pool.stats()["empty"] == 1
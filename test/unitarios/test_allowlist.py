@@ -0,0 +1,55 @@
+# test/unitarios/test_allowlist.py
+import hmac, hashlib
+import wire
+from allowlist import Allowlist
+
+
+def _firma(body):
+    from main import SECRET_KEY
+    return hmac.new(SECRET_KEY, b"allowlist:" + body, hashlib.sha256).hexdigest()
+
+
+def _store():
+    import main
+    return main.get_db().store
+
+
+def test_snapshot_firmado_y_etag(client):
+    r = client.get("/api/allowlist")
+    assert r.json() == {"version": 0, "count": 2, "uids": ["A1B2C3D4", "C59B3706"]}
+    assert r.headers["x-allowlist-signature"] == _firma(r.content)
+    assert client.get("/api/allowlist", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+
+def test_delta_desde_version(client):
+    import main
+    client.get("/api/allowlist")
+    _store()["allowlist_changes"] += [(1, "DEADBEEF", True), (2, "C59B3706", False), (3, "DEADBEEF", False),
+                                      (4, "DEADBEEF", True)]
+    main.allowlist.min_interval = 0
+
+    d = client.get("/api/allowlist/delta", params={"since": 0}).json()
+    assert d == {"since": 0, "version": 4, "add": ["DEADBEEF"], "remove": ["C59B3706"]}
+    assert client.get("/api/allowlist/delta", params={"since": 2}).json()["remove"] == []
+    assert client.get("/api/allowlist").json()["uids"] == ["A1B2C3D4", "DEADBEEF"]
+    # versión que el servidor no conoce: pedir snapshot
+    assert client.get("/api/allowlist/delta", params={"since": 9}).status_code == 410
+
+
+def test_allowlist_binaria(client):
+    r = client.get("/api/allowlist", headers={"Accept": wire.MEDIA_TYPE})
+    assert r.headers["content-type"] == wire.MEDIA_TYPE
+    assert r.headers["x-allowlist-signature"] == _firma(r.content)
+    _, version, count = wire._ALLOWLIST.unpack_from(r.content)
+    uids, end = wire.decode_uid_list(r.content, count, wire._ALLOWLIST.size)
+    assert (version, uids, end) == (0, ["A1B2C3D4", "C59B3706"], len(r.content))
+
+
+def test_historial_acotado():
+    changes = [(v, "AA%02d" % v, True) for v in range(1, 6)]
+    al = Allowlist(lambda fn, *a: (0, set()) if fn is Allowlist._load_full_db else changes, history=2)
+    al.refresh()
+    al.refresh()
+    assert al.snapshot()[0] == 5 and len(al.snapshot()[1]) == 5
+    assert al.delta(2) is None
+    assert al.delta(3) == (5, ["AA04", "AA05"], [])
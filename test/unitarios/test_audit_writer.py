@@ -0,0 +1,117 @@
+# test/unitarios/test_audit_writer.py
+import os
+from datetime import datetime
+from audit_writer import AuditWriter
+from conftest import verify_ok
+
+
+class _BD:
+    """run_db falso: guarda los lotes o falla si 'caida'"""
+    def __init__(self):
+        self.lotes = []
+        self.caida = False
+
+    def __call__(self, fn, events):
+        if self.caida:
+            raise ConnectionError("BD caída")
+        self.lotes.append(list(events))
+
+
+def test_flush_por_lote_al_apagar():
+    bd = _BD()
+    w = AuditWriter(bd, batch_size=3, flush_interval=60)
+    w.start()
+    for i in range(7):
+        w.log(f"UID{i}", "OK")
+    w.stop()
+    assert [len(l) for l in bd.lotes] == [3, 3, 1]
+    assert w.stats()["written"] == 7 and w.stats()["queued"] == 0
+
+
+def test_spill_y_replay(tmp_path):
+    bd = _BD()
+    spill = str(tmp_path / "audit.ndjson")
+    w = AuditWriter(bd, batch_size=10, spill_path=spill)
+    bd.caida = True
+    assert not w.flush([("log", "C59B3706", "DENIED", "HMAC_INVALIDO", datetime.utcnow())])
+    w.used("C59B3706", 1)
+    assert w.flush(w._drain(10)) is False
+    assert os.path.getsize(spill) > 0
+    assert w.stats()["spilled"] == 2
+
+    bd.caida = False
+    assert w.replay_spill() == 2
+    assert not os.path.exists(spill)
+    kinds = [ev[0] for ev in bd.lotes[0]]
+    assert kinds == ["log", "used"]
+
+
+def test_verify_encola_auditoria(client):
+    import main
+    uid = "C59B3706"
+    assert verify_ok(client, uid).json()["result"] == "OK"
+
+    events = main.audit._drain(10)
+    assert [(e[0], e[1], e[2]) for e in events] == [("log", uid, "OK"), ("used", uid, 1)]
+    main.audit.flush(events)
+    store = main.get_db().store
+    assert len(store["logs"]) == 1 and len(store["used"]) == 1
+
+
+class _Conn:
+    """Conexión falsa: UsedTags falla (FK) después de insertar LogAccesos"""
+    def __init__(self):
+        self.autocommit = True
+        self.estados = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        conn = self
+
+        class _Cur:
+            def executemany(self, sql, rows):
+                conn.estados.append(conn.autocommit)
+                if "UsedTags" in sql:
+                    raise ValueError("FK violation")
+
+            def close(self):
+                pass
+        return _Cur()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_lote_en_una_transaccion():
+    conn = _Conn()
+    ahora = datetime.utcnow()
+    try:
+        AuditWriter._insert_db(conn, [("log", "C59B3706", "OK", None, ahora), ("used", "C59B3706", 1, "Post-OK", ahora)])
+    except ValueError:
+        pass
+    assert conn.estados == [False, False]   # ambos inserts dentro de la transacción
+    assert conn.rollbacks == 1 and conn.autocommit is True
+
+
+def test_replay_manda_evento_malo_a_cuarentena(tmp_path):
+    lotes = []
+
+    def run_db(fn, events):
+        if any(ev[1] == "MALO" for ev in events):
+            raise ValueError("FK violation")
+        lotes.append(list(events))
+
+    spill = str(tmp_path / "audit.ndjson")
+    w = AuditWriter(run_db, batch_size=10, spill_path=spill,
+                    is_transient=lambda e: isinstance(e, ConnectionError))
+    ahora = datetime.utcnow()
+    w._spill([("log", "A1", "OK", None, ahora), ("log", "MALO", "OK", None, ahora), ("log", "A2", "OK", None, ahora)])
+
+    assert w.replay_spill() == 2
+    assert [ev[1] for l in lotes for ev in l] == ["A1", "A2"]
+    assert not os.path.exists(spill)   # no se reintenta en el próximo flush
+    assert [ev[1] for ev in AuditWriter.read_spill(spill + ".quarantine")] == ["MALO"]
+    assert w.stats()["quarantined"] == 1
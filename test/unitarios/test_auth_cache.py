@@ -0,0 +1,48 @@
+# test/unitarios/test_auth_cache.py
+from auth_cache import AuthCache
+from conftest import verify_ok
+
+
+def test_lru_y_ttl(monkeypatch):
+    c = AuthCache(max_size=2, ttl=60, negative_ttl=1)
+    c.put("A", (1, True))
+    c.put("B", None)
+    assert c.get("A") == (True, (1, True))
+    c.put("C", (3, True))           # desaloja B (el menos usado)
+    assert c.get("B") == (False, None)
+
+    t = [1000.0]
+    monkeypatch.setattr("auth_cache.time.monotonic", lambda: t[0])
+    c.put("D", None)
+    t[0] += 2                        # vence la entrada negativa
+    assert c.get("D") == (False, None)
+    assert c.stats()["evictions"] == 2
+
+
+def test_uid_desconocido_no_vuelve_a_la_bd(client):
+    import main
+    store = main.get_db().store
+    for _ in range(3):
+        assert verify_ok(client, "DEADBEEF").json()["reason"] == "NO_AUTORIZADO"
+    assert store["verify_batches"] == ["DEADBEEF"]
+    assert client.get("/api/admin/auth-cache").json()["negativeHits"] == 2
+
+
+def test_agregar_tarjeta_invalida(client):
+    import main
+    verify_ok(client, "DEADBEEF").json()
+    assert main.auth_cache.get("DEADBEEF")[0]
+    client.post("/agregar_tarjeta", data={"uid": "DEADBEEF", "nombre": "Ana", "correo": "a@b.c"})
+    assert main.auth_cache.get("DEADBEEF") == (False, None)
+    assert client.post("/api/admin/auth-cache/flush").json() == {"flushed": 0}
+
+
+def test_verify_desde_cache_no_renueva_ttl(client, monkeypatch):
+    import main
+    t = [1000.0]
+    monkeypatch.setattr("auth_cache.time.monotonic", lambda: t[0])
+    assert verify_ok(client, "C59B3706").json()["result"] == "OK"   # lee AuthorizedTags y cachea
+    t[0] += main.AUTH_CACHE_TTL - 1
+    assert verify_ok(client, "C59B3706").json()["result"] == "OK"   # usa el cache
+    t[0] += 2
+    assert main.auth_cache.get("C59B3706") == (False, None)
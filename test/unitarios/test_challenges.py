@@ -0,0 +1,49 @@
+# test/unitarios/test_challenges.py
+import time
+import pytest
+from conftest import firmar
+
+
+@pytest.mark.parametrize("store", ["memory", "db", "signed"])
+def test_desafio_ligado_al_lector(store, monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", store)
+    client = request.getfixturevalue("client")
+    j = client.get("/api/challenges", params={"readerId": "PUERTA-1", "n": 3}).json()
+    assert j["readerId"] == "PUERTA-1" and len(j["items"]) == 3
+    c1, c2, c3 = j["items"]
+
+    # en el tap: solo verify, con el readerId dentro del HMAC
+    body = {"uid": "C59B3706", "sessionId": c1["sessionId"], "readerId": "PUERTA-1",
+            "hmac": firmar("C59B3706", c1["nonce"], b"PUERTA-1")}
+    assert client.post("/api/verify", json=body).json()["result"] == "OK"
+    # un solo uso, también pasada la ventana del nonce corto (el desafío sigue vigente)
+    assert client.post("/api/verify", json=body).json()["reason"] == "SESSION_INVALIDA"
+    import session_store
+    ahora = time.monotonic() + 30
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: ahora)
+    assert client.post("/api/verify", json=body).json()["reason"] == "SESSION_INVALIDA"
+
+    # otro lector no puede usar el desafío
+    otro = {"uid": "C59B3706", "sessionId": c2["sessionId"], "readerId": "PUERTA-2",
+            "hmac": firmar("C59B3706", c2["nonce"], b"PUERTA-2")}
+    assert client.post("/api/verify", json=otro).json()["reason"] == "SESSION_INVALIDA"
+
+    # sin readerId en el HMAC no valida
+    sin = {"uid": "C59B3706", "sessionId": c3["sessionId"], "readerId": "PUERTA-1",
+           "hmac": firmar("C59B3706", c3["nonce"])}
+    assert client.post("/api/verify", json=sin).json()["reason"] == "HMAC_INVALIDO"
+    assert client.get("/api/ultimo-uid").json()["uid"] == "C59B3706"
+
+
+def test_reader_id_invalido(client):
+    assert client.get("/api/challenges", params={"readerId": "a b"}).status_code == 400
+
+
+def test_tap_sin_autenticar_no_llega_al_feed(client):
+    c = client.get("/api/challenges", params={"readerId": "PUERTA-1", "n": 1}).json()["items"][0]
+    falso = {"uid": "DEADBEEF", "sessionId": "x", "readerId": "PUERTA-1", "hmac": "00" * 32}
+    assert client.post("/api/verify", json=falso).json()["reason"] == "SESSION_INVALIDA"
+    falso["sessionId"] = c["sessionId"]   # desafío válido pero HMAC falso
+    assert client.post("/api/verify", json=falso).json()["reason"] == "HMAC_INVALIDO"
+    assert client.post("/api/verify/batch", json=[falso]).json()[0]["reason"] == "SESSION_INVALIDA"
+    assert client.get("/api/ultimo-uid").json().get("uid") != "DEADBEEF"
@@ -0,0 +1,31 @@
+# test/unitarios/test_db_async.py
+import asyncio, threading
+import pytest
+from db_async import DBBusy, DBExecutor
+
+
+def test_executor_corre_en_hilo_propio():
+    ex = DBExecutor(workers=2, max_queue=0)
+    name = asyncio.run(ex.run(lambda: threading.current_thread().name))
+    assert name.startswith("db")
+    assert ex.stats()["done"] == 1
+    ex.shutdown()
+
+
+def test_executor_rechaza_con_cola_llena():
+    ex = DBExecutor(workers=1, max_queue=1)
+    gate = threading.Event()
+
+    async def main():
+        t1 = asyncio.ensure_future(ex.run(gate.wait))
+        t2 = asyncio.ensure_future(ex.run(gate.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(DBBusy):
+            await ex.run(gate.wait)
+        gate.set()
+        await asyncio.gather(t1, t2)
+
+    asyncio.run(main())
+    st = ex.stats()
+    assert st["rejected"] == 1 and st["done"] == 2
+    ex.shutdown()
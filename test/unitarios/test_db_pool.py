@@ -0,0 +1,114 @@
+# test/unitarios/test_db_pool.py
+import threading, time
+import pytest
+from db_pool import ConnectionPool, PoolTimeout, is_disconnect
+
+
+class DummyConn:
+    def __init__(self):
+        self.closed = False
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reutiliza_y_respeta_max():
+    pool = ConnectionPool(DummyConn, min_size=0, max_size=2, timeout=0.05)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(a)
+    assert pool.acquire() is a
+    st = pool.stats()
+    assert st["size"] == 2 and st["inUse"] == 2 and st["timeouts"] == 1
+
+
+def test_pool_espera_devolucion_de_otro_hilo():
+    pool = ConnectionPool(DummyConn, min_size=0, max_size=1, timeout=2)
+    a = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(a,)).start()
+    assert pool.acquire() is a
+    assert pool.stats()["waits"] == 1
+
+
+def test_pool_recicla_por_max_lifetime():
+    pool = ConnectionPool(DummyConn, min_size=0, max_size=1, max_lifetime=0.01)
+    a = pool.acquire()
+    time.sleep(0.02)
+    pool.release(a)
+    assert a.closed
+    b = pool.acquire()
+    assert b is not a
+    assert pool.stats()["recycled"] == 1
+
+
+def test_context_manager_descarta_conexion_caida():
+    pool = ConnectionPool(DummyConn, min_size=0, max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            raise RuntimeError("08S01", "Communication link failure")
+    assert conn.closed
+    assert is_disconnect(RuntimeError("08S01", "x"))
+    st = pool.stats()
+    assert st["inUse"] == 0 and st["size"] == 0 and st["discarded"] == 1
+
+
+class PingConn(DummyConn):
+    def __init__(self, alive=True):
+        super().__init__()
+        self.alive = alive
+    def cursor(self):
+        return self
+    def execute(self, sql, params=()):
+        if not self.alive:
+            raise RuntimeError("08S01", "Communication link failure")
+        return self
+
+
+def test_checkout_no_hace_ping_y_keepalive_descarta_caidas():
+    conns = []
+    def connect():
+        conns.append(PingConn())
+        return conns[-1]
+    pool = ConnectionPool(connect, min_size=1, max_size=2)
+    pool.warm()
+    conns[0].alive = False
+    # el checkout entrega la conexión sin validarla
+    c = pool.acquire()
+    assert c is conns[0]
+    pool.release(c)
+    # el validador en segundo plano la detecta y repone min_size
+    assert pool.validate_idle() == 1
+    assert conns[0].closed
+    st = pool.stats()
+    assert st["size"] == 1 and st["idle"] == 1 and st["discarded"] == 1
+
+
+def test_run_db_idempotente_reintenta_si_la_conexion_cayo(monkeypatch):
+    import main
+    conns = [PingConn(alive=False), PingConn()]
+    released = []
+    monkeypatch.setattr(main.db_pool, "acquire", lambda: conns.pop(0))
+    monkeypatch.setattr(main.db_pool, "release", lambda conn, discard=False: released.append(discard))
+
+    def work(conn):
+        conn.execute("SELECT 1")
+        return "ok"
+
+    assert main.run_db(work, idempotent=True) == "ok"
+    assert released == [True, False]
+
+
+def test_run_db_no_reintenta_escrituras(monkeypatch):
+    import main
+    conns = [PingConn(alive=False), PingConn()]
+    monkeypatch.setattr(main.db_pool, "acquire", lambda: conns.pop(0))
+    monkeypatch.setattr(main.db_pool, "release", lambda conn, discard=False: None)
+
+    def work(conn):
+        conn.execute("DELETE ...")
+
+    with pytest.raises(Exception):
+        main.run_db(work)
+    assert len(conns) == 1   # no se usó una segunda conexión
@@ -0,0 +1,41 @@
+# test/unitarios/test_event_bus.py
+import asyncio
+from event_bus import EventBus
+from conftest import verify_ok
+
+
+def test_publica_a_suscriptores():
+    async def run():
+        bus = EventBus(max_queue=4)
+        a, b = bus.subscribe(), bus.subscribe()
+        bus.publish("access", {"uid": "C59B3706"})
+        ev_a, ev_b = await a.get(), await b.get()
+        assert ev_a == ev_b == (1, "access", {"uid": "C59B3706"})
+        bus.unsubscribe(b)
+        bus.publish("nonce", {"uid": "X"})
+        assert a.queue.qsize() == 1 and b.queue.empty()
+    asyncio.run(run())
+
+
+def test_suscriptor_lento_se_desconecta():
+    async def run():
+        bus = EventBus(max_queue=2)
+        lento = bus.subscribe()
+        for i in range(3):
+            bus.publish("access", {"i": i})
+        assert lento.dropped and await lento.get() is None
+        assert bus.stats() == {"subscribers": 0, "maxQueue": 2, "published": 3, "dropped": 1}
+    asyncio.run(run())
+
+
+def test_nonce_y_verify_publican(client):
+    import main
+    sub = main.events.subscribe()
+    uid = "C59B3706"
+    verify_ok(client, uid)
+
+    kinds = []
+    while not sub.queue.empty():
+        _, kind, payload = sub.queue.get_nowait()
+        kinds.append((kind, payload["uid"], payload.get("resultado")))
+    assert kinds == [("nonce", uid, None), ("access", uid, "OK")]
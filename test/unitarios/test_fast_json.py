@@ -0,0 +1,21 @@
+# test/unitarios/test_fast_json.py
+import json
+from datetime import datetime
+import fast_json
+
+
+def test_pagina_igual_a_isoformat():
+    f = datetime(2025, 1, 1, 12, 0, 0, 123456)
+    rows = [(2, "C59B3706", "OK", "", f), (1, "A1B2C3D4", "DENIED", "HMAC_INVALIDO", None)]
+    j = json.loads(fast_json.log_rows_page(rows, "abc"))
+    assert j["count"] == 2 and j["next"] == "abc"
+    assert j["items"][0] == {"id": 2, "uid": "C59B3706", "resultado": "OK", "details": "", "fecha": f.isoformat()}
+    assert j["items"][1]["fecha"] is None
+
+
+def test_nonce_y_verify_con_respuesta_rapida(client):
+    r = client.get("/api/nonce", params={"uid": "C59B3706"})
+    assert r.headers["content-type"] == "application/json"
+    assert set(r.json()) == {"sessionId", "nonce"}
+    r = client.post("/api/verify", json={"uid": "C59B3706", "sessionId": "x", "hmac": "00"})
+    assert r.json() == {"result": "DENIED", "reason": "SESSION_INVALIDA"}
@@ -0,0 +1,34 @@
+# test/unitarios/test_logs_cache.py
+from response_cache import ResponseCache, etag_matches
+
+
+def test_etag_debil():
+    assert etag_matches('W/"logs-1"', 'W/"logs-1"')
+    assert etag_matches('"x", "logs-1"', 'W/"logs-1"')
+    assert not etag_matches('W/"logs-2"', 'W/"logs-1"')
+    assert not etag_matches(None, 'W/"logs-1"')
+
+
+def test_invalidacion_descarta_resultado_viejo():
+    c = ResponseCache(ttl=60)
+    gen = c.generation
+    c.invalidate()                 # se escribió un log mientras se consultaba
+    c.put("k", gen, "e", b"{}")
+    assert c.get("k") is None
+    c.put("k", c.generation, "e", b"{}")
+    assert c.get("k") == ("e", b"{}")
+
+
+def test_304_sin_consultar_bd(client):
+    import main
+    r = client.get("/api/logs", params={"limit": 5})
+    etag = r.headers["etag"]
+    assert r.status_code == 200 and etag.startswith('W/"logs-')
+
+    main.db_pool.acquire = lambda: (_ for _ in ()).throw(AssertionError("no debe ir a la BD"))
+    r2 = client.get("/api/logs", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert r2.status_code == 304 and r2.content == b""
+
+    # al escribirse un lote de logs el cache se invalida
+    main.audit._notify([("log",)])
+    assert main.logs_cache.get((None, 5, None, None, None, None)) is None
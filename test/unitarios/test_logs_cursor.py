@@ -0,0 +1,56 @@
+# test/unitarios/test_logs_cursor.py
+from datetime import datetime, timedelta
+
+
+class _Cur:
+    """Cursor que ordena y filtra una lista de filas como lo haría el SELECT keyset"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.sql = None
+
+    def execute(self, sql, params):
+        self.sql = sql
+        top = int(sql.split("TOP (")[1].split(")")[0])
+        rows = sorted(self.rows, key=lambda r: (r[4], r[0]), reverse=True)
+        if "IdLog < ?" in sql:
+            f, id_ = params[-3], params[-1]
+            rows = [r for r in rows if (r[4], r[0]) < (f, id_)]
+        self._out = rows[:top]
+
+    def fetchall(self):
+        return self._out
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    def __init__(self, rows):
+        self.cur = _Cur(rows)
+
+    def cursor(self):
+        return self.cur
+
+
+def test_recorre_todas_las_paginas(client):
+    import main
+    t0 = datetime(2025, 1, 1)
+    # dos filas con la misma Fecha: el desempate es IdLog
+    rows = [(i, "C59B3706", "OK", "", t0 + timedelta(seconds=i // 2)) for i in range(1, 12)]
+    conn = _Conn(rows)
+
+    seen, after = [], None
+    while True:
+        rows, next_token = main._logs_db(conn, None, 4, after)
+        seen += [r[0] for r in rows]
+        if not next_token:
+            break
+        after = main.decode_logs_cursor(next_token)
+    assert seen == list(range(11, 0, -1))
+    assert "OFFSET" not in conn.cur.sql
+
+
+def test_cursor_invalido(client):
+    assert client.get("/api/logs", params={"cursor": "xx"}).status_code == 400
+    j = client.get("/api/logs", params={"resultado": "DENIED", "since": "2025-01-01T00:00:00Z"}).json()
+    assert j["next"] is None
@@ -0,0 +1,100 @@
+# test/unitarios/test_logs_export.py
+import json
+
+
+def test_export_ndjson(client):
+    r = client.get("/api/logs/export", params={"uid": "C59B3706"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(l) for l in r.text.splitlines()]
+    assert lines and lines[0]["uid"] == "C59B3706"
+
+
+def test_export_csv_gzip(client):
+    r = client.get("/api/logs/export", params={"format": "csv", "gzip": "true"})
+    assert r.headers["content-encoding"] == "gzip"
+    rows = r.text.splitlines()   # httpx descomprime: el gzip es válido
+    assert rows[0] == "id,uid,resultado,details,fecha" and len(rows) == 2
+
+
+def test_export_formato_invalido(client):
+    assert client.get("/api/logs/export", params={"format": "xml"}).status_code == 422
+
+
+def test_export_error_antes_del_200(client, monkeypatch):
+    import main
+    from db_pool import PoolTimeout
+
+    class _Conn:
+        def cursor(self):
+            class _Cur:
+                def execute(self, *a):
+                    raise RuntimeError("sintaxis")
+
+                def close(self):
+                    pass
+            return _Cur()
+
+    liberadas = []
+    monkeypatch.setattr(main, "release_db", lambda conn, discard=False: liberadas.append(conn))
+    monkeypatch.setattr(main, "get_db", _Conn)
+    assert client.get("/api/logs/export").status_code == 500
+    assert len(liberadas) == 1
+
+    def sin_conexion():
+        raise PoolTimeout("pool agotado")
+    monkeypatch.setattr(main, "get_db", sin_conexion)
+    assert client.get("/api/logs/export").status_code == 503
+
+
+def test_export_cortado_devuelve_la_conexion(client, monkeypatch):
+    import asyncio, threading
+    import main
+    orden = []
+    liberada = threading.Event()
+
+    class _Conn:
+        def cursor(self):
+            class _Cur:
+                filas = [(i, "C59B3706", "OK", "", None) for i in range(50)]
+
+                def execute(self, *a):
+                    pass
+
+                def fetchmany(self, n):
+                    orden.append("fetch")
+                    out, self.filas = self.filas[:n], self.filas[n:]
+                    return out
+
+                def close(self):
+                    orden.append("close")
+            return _Cur()
+
+    def release(conn, discard=False):
+        orden.append("release")
+        liberada.set()
+
+    monkeypatch.setattr(main, "get_db", _Conn)
+    monkeypatch.setattr(main, "release_db", release)
+    monkeypatch.setattr(main, "EXPORT_FETCH_ROWS", 1)
+
+    async def cortar():
+        q, credits, stop = await main._start_export([], [])
+        gen = main._export_logs("ndjson", False, q, credits, stop)
+        await gen.__anext__()
+        await gen.aclose()   # el cliente se fue a mitad del stream
+
+    asyncio.run(cortar())
+    assert liberada.wait(2)
+    assert orden[-2:] == ["close", "release"] and orden.count("fetch") < 50
+
+
+def test_exports_no_usan_los_hilos_de_verify(client, monkeypatch):
+    import threading
+    import main
+    assert main.export_executor.workers < main.DB_POOL_MAX
+    hilos = []
+    real = main.get_db
+    monkeypatch.setattr(main, "get_db", lambda: hilos.append(threading.current_thread().name) or real())
+    assert client.get("/api/logs/export").status_code == 200
+    assert hilos and all(h.startswith("db-export") for h in hilos)
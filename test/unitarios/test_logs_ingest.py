@@ -0,0 +1,110 @@
+# test/unitarios/test_logs_ingest.py
+import json, zlib
+import wire
+import event_ingest
+from event_ingest import encode_binary, parse_ndjson
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def _store():
+    import main
+    return main.get_db().store
+
+
+def _lineas(eventos):
+    return "\n".join(json.dumps(e) for e in eventos).encode()
+
+
+def test_ingesta_ndjson_con_dedupe(client):
+    eventos = [
+        {"eventId": "1", "uid": "C59B3706", "resultado": "OK", "fecha": "2025-01-01T10:00:00Z"},
+        {"eventId": "2", "uid": "DEADBEEF", "resultado": "DENIED", "details": "NO_AUTORIZADO"},
+        {"eventId": "2", "uid": "DEADBEEF", "resultado": "DENIED"},   # repetido en el lote
+        {"eventId": "3", "uid": "ZZ", "resultado": "OK"},               # UID inválido
+    ]
+    r = client.post("/api/logs/ingest?readerId=PUERTA-1", content=_lineas(eventos) + b"\nno json", headers=NDJSON)
+    j = r.json()
+    assert (j["received"], j["accepted"], j["duplicates"], j["rejected"]) == (5, 2, 1, 2)
+    assert [e["at"] for e in j["errors"]] == [4, 5]
+    store = _store()
+    assert [l["row"][3] for l in store["logs"]] == ["OK", "DENIED"]
+    assert store["used"][0]["row"][3] == "Offline"
+    assert store["logs"][0]["row"][6].isoformat() == "2025-01-01T10:00:00"
+
+    # re-subir el mismo lote no duplica
+    j = client.post("/api/logs/ingest?readerId=PUERTA-1", content=_lineas(eventos[:2]), headers=NDJSON).json()
+    assert (j["accepted"], j["duplicates"]) == (0, 2)
+    assert len(store["logs"]) == 2
+
+
+def test_ingesta_binaria_gzip(client):
+    body = encode_binary([("a1", bytes.fromhex("C59B3706"), "OK", None, 1735725600000),
+                          ("a2", bytes.fromhex("C59B3706"), "DENIED", "HMAC_INVALIDO", 1735725601000)])
+    headers = {"Content-Type": wire.MEDIA_TYPE, "Content-Encoding": "gzip"}
+    gz = zlib.compressobj(wbits=31)
+    r = client.post("/api/logs/ingest?readerId=PUERTA-1", content=gz.compress(body) + gz.flush(), headers=headers)
+    assert r.json()["accepted"] == 2
+    assert _store()["logs"][1]["row"][4] == "HMAC_INVALIDO"
+    assert client.post("/api/logs/ingest", content=body[:-3], headers={"Content-Type": wire.MEDIA_TYPE}).status_code == 400
+
+
+def test_spill_del_audit_writer(client):
+    linea = json.dumps({"t": "used", "uid": "C59B3706", "a": 1, "b": "Post-OK", "fecha": "2025-01-01T10:00:00"})
+    assert client.post("/api/logs/ingest", content=linea.encode(), headers=NDJSON).json()["accepted"] == 1
+    assert client.post("/api/logs/ingest", content=linea.encode(), headers=NDJSON).json()["duplicates"] == 1
+    assert _store()["used"][0]["row"][3:6] == ("Post-OK", None, 1)
+
+
+def test_sweeper_olvida_event_ids_viejos(client):
+    import main
+    from datetime import datetime, timedelta
+    client.post("/api/logs/ingest?readerId=P3", content=_lineas(
+        [{"eventId": str(i), "uid": "C59B3706", "resultado": "DENIED"} for i in range(5)]), headers=NDJSON)
+    ingested = _store()["ingested"]
+    for k in list(ingested)[:3]:
+        ingested[k] = datetime.utcnow() - timedelta(days=31)
+
+    sw = event_ingest.IngestSweeper(main.run_db, 30, batch_size=2, pause=0)
+    assert sw.sweep_once() == 3
+    assert len(ingested) == 2
+    assert sw.stats()["retentionDays"] == 30
+    assert client.get("/api/admin/sweeper").json()["ingest"]["retentionDays"] == main.INGEST_DEDUPE_DAYS
+
+
+def test_lote_grande_en_tandas(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "INGEST_CHUNK", 1000)
+    eventos = [{"eventId": str(i), "uid": "A1B2C3D4", "resultado": "DENIED"} for i in range(5000)]
+    assert len(parse_ndjson(_lineas(eventos)).rows) == 5000
+    j = client.post("/api/logs/ingest?readerId=P2", content=_lineas(eventos), headers=NDJSON).json()
+    assert j["accepted"] == 5000
+    assert _store()["executemany_calls"] == [1000] * 5
+
+
+def test_batch_cortado_restaura_opciones():
+    ejecutadas = []
+
+    class _Cur:
+        def execute(self, sql, *a):
+            ejecutadas.append(sql)
+            if sql is event_ingest.MERGE_SQL:
+                raise RuntimeError("deadlock")
+
+        def executemany(self, sql, rows):
+            pass
+
+        def close(self):
+            pass
+
+    class _Conn:
+        def cursor(self):
+            return _Cur()
+
+    filas = parse_ndjson(b'{"eventId": "e1", "uid": "C59B3706", "resultado": "DENIED"}').rows
+    try:
+        event_ingest.ingest_db(_Conn(), filas)
+    except RuntimeError:
+        pass
+    assert ejecutadas[-1] == event_ingest.RESET_SQL
+    assert event_ingest.MERGE_SQL.index("SET NOCOUNT OFF") < event_ingest.MERGE_SQL.index("SELECT COUNT(*)")
@@ -0,0 +1,25 @@
+# test/unitarios/test_nonce_batch.py
+import pytest
+from conftest import firmar
+
+
+@pytest.mark.parametrize("store", ["memory", "db", "signed"])
+def test_lote_y_verify(store, monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", store)
+    client = request.getfixturevalue("client")
+    import main
+
+    calls = []
+    put = main.session_store.put
+    monkeypatch.setattr(main.session_store, "put", lambda *a: calls.append(a) or put(*a))
+
+    j = client.post("/api/nonce/batch", json=["C59B3706", "ZZ", "A1B2C3D4"]).json()
+    assert calls == []   # una sola operación del store, no N put()
+    assert j[1]["uid"] == "ZZ" and j[1]["error"].startswith("UID inválido")
+
+    for it in (j[0], j[2]):
+        uid = it["uid"]
+        r = client.post("/api/verify", json={"uid": uid, "sessionId": it["sessionId"],
+                                             "hmac": firmar(uid, it["nonce"])}).json()
+        assert r["result"] == "OK"
+    assert client.get("/api/ultimo-uid").json()["uid"] == "A1B2C3D4"
@@ -0,0 +1,63 @@
+# test/unitarios/test_reader_ws.py
+from conftest import firmar
+
+
+def test_nonce_y_verify_por_websocket(client):
+    with client.websocket_connect("/ws/reader?readerId=PUERTA-1") as ws:
+        ws.send_json({"id": 1, "op": "nonce", "uid": "C59B3706"})
+        n = ws.receive_json()
+        assert n["id"] == 1 and len(n["nonce"]) == 32
+
+        body = {"id": 2, "op": "verify", "uid": "C59B3706", "sessionId": n["sessionId"],
+                "hmac": firmar("C59B3706", n["nonce"])}
+        ws.send_json(body)
+        r = ws.receive_json()
+        assert r["id"] == 2 and r["result"] == "OK"
+        body["id"] = 3
+        ws.send_json(body)
+        assert ws.receive_json() == {"id": 3, "result": "DENIED", "reason": "SESSION_INVALIDA"}
+        assert client.get("/api/admin/readers").json()["readers"] == ["PUERTA-1"]
+    assert client.get("/api/admin/readers").json()["connections"] == 0
+
+
+def test_desafios_por_websocket(client):
+    with client.websocket_connect("/ws/reader?readerId=PUERTA-1") as ws:
+        ws.send_json({"id": 7, "op": "challenges", "n": 2})
+        c = ws.receive_json()["items"][0]
+        ws.send_json({"id": 8, "op": "verify", "uid": "C59B3706", "sessionId": c["sessionId"],
+                      "readerId": "PUERTA-1", "hmac": firmar("C59B3706", c["nonce"], b"PUERTA-1")})
+        assert ws.receive_json()["result"] == "OK"
+
+    # desde la conexión de otro lector (o sin readerId) no se pueden gastar
+    for url in ("/ws/reader?readerId=PUERTA-2", "/ws/reader"):
+        with client.websocket_connect(url) as ws:
+            c = client.get("/api/challenges", params={"readerId": "PUERTA-1", "n": 1}).json()["items"][0]
+            ws.send_json({"id": 9, "op": "verify", "uid": "C59B3706", "sessionId": c["sessionId"],
+                          "readerId": "PUERTA-1", "hmac": firmar("C59B3706", c["nonce"], b"PUERTA-1")})
+            assert ws.receive_json()["status"] == 400
+
+
+def test_errores_por_item(client):
+    with client.websocket_connect("/ws/reader") as ws:
+        ws.send_text("no es json")
+        assert ws.receive_json()["error"] == "MENSAJE_INVALIDO"
+        ws.send_json({"id": 1, "op": "nonce", "uid": "ZZ"})
+        assert ws.receive_json()["status"] == 400
+        ws.send_json({"id": 2, "op": "verify", "uid": "C59B3706"})
+        assert ws.receive_json() == {"id": 2, "error": "REQUEST_INVALIDO", "status": 422}
+        ws.send_json({"id": 3, "op": "challenges"})
+        assert ws.receive_json()["status"] == 400
+        # la conexión sigue viva
+        ws.send_json({"id": 4, "op": "nonce", "uid": "C59B3706"})
+        assert ws.receive_json()["id"] == 4
+
+
+def test_error_inesperado_responde_interno(client, monkeypatch):
+    import main
+
+    async def falla(uid):
+        raise RuntimeError("bug")
+    monkeypatch.setattr(main, "_issue_nonce", falla)
+    with client.websocket_connect("/ws/reader") as ws:
+        ws.send_json({"id": 5, "op": "nonce", "uid": "C59B3706"})
+        assert ws.receive_json() == {"id": 5, "error": "INTERNO", "status": 500}
@@ -0,0 +1,34 @@
+# test/unitarios/test_recent_events.py
+from recent_events import RecentEvents
+from conftest import verify_ok
+
+
+def test_anillo_y_mapa_por_uid():
+    r = RecentEvents(size=2, max_uids=2)
+    for uid in ("A", "B", "C"):
+        r.add("access", {"uid": uid})
+    assert [e["uid"] for e in r.recent("access")] == ["C", "B"]
+    assert r.last("access")["uid"] == "C"
+    assert r.last("access", "A") is None          # salió del mapa (LRU)
+    r.seed("access", {"uid": "B", "viejo": True})  # no pisa el más nuevo
+    assert "viejo" not in r.last("access", "B")
+
+
+def test_logs_last_id_entero_y_luego_sin_bd(client):
+    import main
+    uid = "C59B3706"
+    verify_ok(client, uid)
+    assert client.get("/api/ultimo-uid").json()["uid"] == uid
+
+    # el evento en vivo no tiene IdLog: se lee la fila de la BD una vez (id entero)
+    j = client.get("/api/logs/last", params={"uid": uid}).json()
+    assert j["hasData"] and isinstance(j["id"], int)
+    main.db_pool.acquire = lambda: (_ for _ in ()).throw(AssertionError("no debe ir a la BD"))
+    assert client.get("/api/logs/last", params={"uid": uid}).json()["id"] == j["id"]
+
+
+def test_logs_last_reinicio_consulta_bd_una_vez(client):
+    j = client.get("/api/logs/last").json()   # fila de la BD simulada
+    assert j["hasData"] and j["id"] == 1
+    import main
+    assert main.recent.last("access")["uid"] == "C59B3706"
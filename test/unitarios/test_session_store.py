@@ -0,0 +1,83 @@
+# test/unitarios/test_session_store.py
+import asyncio, time
+from datetime import datetime, timedelta
+from session_store import MemorySessionStore
+from conftest import cuerpo_verify, firmar
+
+
+def test_memoria_pop_un_solo_uso_y_ligado_a_uid():
+    st = MemorySessionStore(ttl_seconds=3)
+    exp = datetime.utcnow() + timedelta(seconds=3)
+    st.put_nowait("s1", "C59B3706", b"n" * 16, exp)
+    assert st.pop_nowait("s1", "DEADBEEF") is None
+    assert st.pop_nowait("s1", "C59B3706") == (b"n" * 16, exp)
+    assert st.pop_nowait("s1", "C59B3706") is None
+    uid, _ = asyncio.run(st.latest())
+    assert uid == "C59B3706"
+
+
+def test_memoria_rueda_purga_sesiones_abandonadas():
+    st = MemorySessionStore(ttl_seconds=0.05, grace=0.05, tick=0.01, shards=2)
+    for i in range(50):
+        st.put_nowait(f"s{i}", "C59B3706", b"n", datetime.utcnow() + timedelta(seconds=0.05))
+    assert len(st) == 50
+    time.sleep(0.15)
+    assert len(st) == 0
+
+
+def test_verify_con_store_en_bd(monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", "db")
+    client = request.getfixturevalue("client")
+    import main
+
+    uid = "C59B3706"
+    body = cuerpo_verify(client, uid)
+    monkeypatch.setattr("main.gen_alias_hex", lambda n=8: "DEADBEEFCAFEBABE")
+
+    assert client.post("/api/verify", json=body).json()["result"] == "OK"
+    # la sesión se consumió con DELETE ... OUTPUT
+    assert client.post("/api/verify", json=body).json()["reason"] == "SESSION_INVALIDA"
+
+
+def test_token_firmado_valida_uid_y_evita_replay():
+    from session_store import SignedSessionStore
+    st = SignedSessionStore(b"k" * 32, ttl_seconds=3)
+    exp = datetime.utcnow() + timedelta(seconds=3)
+    tok = st.new_id("C59B3706", b"n" * 16, exp)
+    assert len(tok) == 55
+    assert st.pop_nowait(tok, "DEADBEEF") is None          # ligado al UID
+    assert st.pop_nowait(tok[:-2] + "AA", "C59B3706") is None
+    nonce, exp2 = st.pop_nowait(tok, "C59B3706")
+    assert nonce == b"n" * 16 and abs((exp2 - exp).total_seconds()) < 0.002
+    assert st.pop_nowait(tok, "C59B3706") is None           # replay
+
+
+def test_verify_con_nonce_firmado(monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", "signed")
+    client = request.getfixturevalue("client")
+    import main
+
+    uid = "C59B3706"
+    data = client.get("/api/nonce", params={"uid": uid}).json()
+    assert set(data) == {"sessionId", "nonce"}
+    body = {"uid": uid, "sessionId": data["sessionId"], "hmac": firmar(uid, data["nonce"])}
+    assert client.post("/api/verify", json=body).json()["result"] == "OK"
+    assert client.post("/api/verify", json=body).json()["reason"] == "SESSION_INVALIDA"
+
+
+def test_sweeper_borra_vencidas_en_lotes(monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", "db")
+    client = request.getfixturevalue("client")
+    import main
+
+    for _ in range(7):
+        client.get("/api/nonce", params={"uid": "C59B3706"})
+    sessions = main.get_db().store["sessions"]
+    for v in list(sessions.values())[:5]:
+        v["expire_at"] = datetime.utcnow() - timedelta(seconds=1)
+
+    sw = main.SessionSweeper(main.run_db, batch_size=2, pause=0)
+    assert sw.sweep_once() == 5
+    assert len(sessions) == 2
+    st = sw.stats()
+    assert st["deletedTotal"] == 5 and st["runs"] == 1
@@ -0,0 +1,64 @@
+# test/unitarios/test_sql_trace.py
+import json, threading
+from sql_trace import SqlTracer, statement_label
+from conftest import verify_ok
+
+
+def test_etiquetas():
+    assert statement_label("_pop_db", "SET NOCOUNT ON; DELETE s OUTPUT ...") == "_pop_db:DELETE"
+    assert statement_label("x", "EXEC dbo.algo") == "x:EXEC"
+
+
+def test_desactivado_no_envuelve(client):
+    import main
+    conn = object()
+    assert main.tracer.wrap(conn) is conn
+    assert "server-timing" not in verify_ok(client).headers
+
+
+def test_server_timing_y_log(monkeypatch, request, tmp_path):
+    log = tmp_path / "trace.ndjson"
+    monkeypatch.setenv("SQL_TRACE", "1")
+    monkeypatch.setenv("SQL_TRACE_LOG", str(log))
+    monkeypatch.setenv("SESSION_STORE", "db")
+    client = request.getfixturevalue("client")
+
+    r = verify_ok(client)
+    assert r.json()["result"] == "OK"
+    timing = r.headers["server-timing"]
+    assert 'desc="_pop_db:DELETE"' in timing and 'desc="_authorize_db:SELECT"' in timing
+    assert "db-pool;dur=" in timing and "db-queue;dur=" in timing and "total;dur=" in timing
+
+    import main
+    main.tracer.flush_log()
+    lineas = [json.loads(l) for l in log.read_text().splitlines()]
+    assert lineas[-1]["path"] == "/api/verify"
+    assert [s["label"] for s in lineas[-1]["sql"] if not s["label"].startswith("db.")] == \
+        ["_pop_db:DELETE", "_authorize_db:SELECT"]
+
+    tabla = {s["label"]: s for s in client.get("/api/admin/sql").json()["statements"]}
+    assert tabla["_put_db:INSERT"]["count"] == 1 and tabla["_authorize_db:SELECT"]["rows"] == 1
+    client.post("/api/admin/sql/reset")
+    assert client.get("/api/admin/sql").json()["statements"] == []
+
+
+def test_log_se_escribe_fuera_del_hilo_de_la_request(tmp_path):
+    from sql_trace import RequestTrace
+    t = SqlTracer(enabled=True, log_path=str(tmp_path / "t.ndjson"))
+    hilos = []
+    escribir = t._append
+    t._append = lambda lines: (hilos.append(threading.current_thread().name), escribir(lines))
+    trace = RequestTrace()
+    trace.add("f:SELECT", 1.5, 1)
+    t.write_log("GET", "/x", 200, 3.0, trace)
+    t.flush_log()
+    assert hilos == ["sql-trace-log"]
+    assert json.loads((tmp_path / "t.ndjson").read_text())["sql"][0]["label"] == "f:SELECT"
+
+
+def test_agregado_percentiles():
+    t = SqlTracer(enabled=True)
+    for ms in range(1, 101):
+        t.record(None, "f:SELECT", float(ms), 2)
+    fila = t.stats()["statements"][0]
+    assert (fila["count"], fila["p50Ms"], fila["p95Ms"], fila["maxMs"], fila["rows"]) == (100, 51.0, 96.0, 100.0, 200)
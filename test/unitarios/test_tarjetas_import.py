@@ -0,0 +1,51 @@
+# test/unitarios/test_tarjetas_import.py
+import card_import, main
+
+
+def _store():
+    return main.get_db().store
+
+
+def test_import_csv_con_errores_por_fila(client):
+    csv = (
+        "﻿UID;Nombre;Correo\n"
+        "de ad be ef;Ana;ana@x.com\n"
+        "C59B3706;Beto;beto@x.com\n"
+        "ZZ;Carla;carla@x.com\n"
+        "DEADBEEF;Dani;dani@x.com\n"
+        "0x0102;Eva;\n"
+    ).encode()
+    j = client.post("/api/tarjetas/import", content=csv, headers={"Content-Type": "text/csv"}).json()
+    assert (j["received"], j["created"], j["updated"], j["unchanged"]) == (5, 1, 0, 0)
+    assert [(e["row"], e["error"]) for e in j["errors"]] == [
+        (3, "UID vinculado a otro usuario (relink=true para moverlo)"),
+        (4, "uid no es hex"),
+        (5, "UID repetido (fila 2)"),
+        (6, "falta correo"),
+    ]
+    assert "DEADBEEF" in _store()["tags"]
+
+    # re-importar lo mismo no cambia nada; con relink=true la tarjeta de otro se mueve
+    j = client.post("/api/tarjetas/import", content=csv, headers={"Content-Type": "text/csv"}).json()
+    assert (j["created"], j["updated"], j["unchanged"]) == (0, 0, 1)
+    j = client.post("/api/tarjetas/import", params={"relink": "true"}, content=csv,
+                    headers={"Content-Type": "text/csv"}).json()
+    assert (j["created"], j["updated"], j["unchanged"], len(j["errors"])) == (0, 1, 1, 3)
+
+
+def test_import_json_en_tandas(client, monkeypatch):
+    monkeypatch.setattr(main, "CARD_IMPORT_CHUNK", 2)
+    items = [{"uid": "%08X" % i, "nombre": f"U{i}", "correo": "u@x.com"} for i in range(5)]
+    items[3]["nombre"] = "FALLA"   # su tanda (filas 3 y 4) falla y se repite fila por fila
+    j = client.post("/api/tarjetas/import", json=items).json()
+    assert j["created"] == 4
+    assert [(e["row"], e["error"]) for e in j["errors"]] == [(4, "error de BD: FK violation")]
+    # la tanda cortada no deja NOCOUNT / XACT_ABORT en la conexión del pool
+    assert _store()["session_resets"] == 2
+    assert card_import.MERGE_SQL.index("SET NOCOUNT OFF") < card_import.MERGE_SQL.index("SELECT UID, Accion")
+
+
+def test_import_archivo_invalido(client):
+    r = client.post("/api/tarjetas/import", content=b"uid,nombre\nAA,x\n", headers={"Content-Type": "text/csv"})
+    assert r.status_code == 400
+    assert client.post("/api/tarjetas/import", json={"uid": "AA"}).status_code == 400
@@ -0,0 +1,49 @@
+# test/unitarios/test_verify_batch.py
+from conftest import cuerpo_verify
+
+
+def _item(client, uid, hmac_ok=True):
+    return cuerpo_verify(client, uid, key=None if hmac_ok else b"otra")
+
+
+def _lote(client):
+    ok = _item(client, "C59B3706")
+    return [
+        ok,
+        _item(client, "A1B2C3D4", hmac_ok=False),
+        _item(client, "DEADBEEF"),
+        {"uid": "C59B3706", "sessionId": "no-existe", "hmac": "00"},
+        {**_item(client, "A1B2C3D4"), "hmac": "zz"},
+        ok,   # misma sesión otra vez: ya se consumió
+        _item(client, "A1B2C3D4"),
+    ]
+
+
+def _check(j):
+    assert [x["result"] for x in j] == ["OK", "DENIED", "DENIED", "DENIED", "DENIED", "DENIED", "OK"]
+    assert [x.get("reason") for x in j[1:6]] == [
+        "HMAC_INVALIDO", "NO_AUTORIZADO", "SESSION_INVALIDA", "HMAC_MALFORMADO", "SESSION_INVALIDA"]
+    assert len(j[0]["alias"]) == 16 and j[0]["alias"] != j[6]["alias"]
+
+
+def test_lote_mismo_resultado_que_verify(client):
+    _check(client.post("/api/verify/batch", json=_lote(client)).json())
+
+
+def test_lote_con_sesiones_en_bd(monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", "db")
+    client = request.getfixturevalue("client")
+    _check(client.post("/api/verify/batch", json=_lote(client)).json())
+
+
+def test_lote_demasiado_grande(client, monkeypatch):
+    monkeypatch.setattr("main.VERIFY_BATCH_MAX", 1)
+    assert client.post("/api/verify/batch", json=[{"uid": "A", "sessionId": "x", "hmac": "00"}] * 2).status_code == 400
+
+
+def test_uid_invalido_igual_en_lote_y_en_verify(client):
+    malo = {"uid": "ZZ", "sessionId": "x", "hmac": "00" * 32}
+    esperado = {"result": "ERROR", "reason": "UID_INVALIDO"}
+    assert client.post("/api/verify/batch", json=[malo]).json() == [esperado]
+    r = client.post("/api/verify", json=malo)
+    assert r.status_code == 200 and r.json() == esperado
@@ -0,0 +1,16 @@
+# test/unitarios/test_verify_no_autorizado.py
+from conftest import verify_ok
+
+
+def test_verify_uid_no_autorizado(client):
+    j = verify_ok(client, "DEADBEEF").json()
+    assert j == {"result": "DENIED", "reason": "NO_AUTORIZADO"}
+
+
+def test_verify_alias_repetido_se_regenera(client, monkeypatch):
+    import main
+    main.get_db().store["aliases"].add("DEADBEEFCAFEBABE")
+    monkeypatch.setattr("main.gen_alias_hex", lambda n=8: "DEADBEEFCAFEBABE")
+    j = verify_ok(client, "C59B3706").json()
+    assert j["result"] == "OK"
+    assert len(j["alias"]) == 16 and j["alias"] != "DEADBEEFCAFEBABE"
@@ -21,3 +21,38 @@ def test_verify_ok_and_alias_rotation(client, monkeypatch):
     j = r2.json()
     assert j["result"] == "OK"
     assert j["alias"] == "DEADBEEFCAFEBABE"
+
+
+def test_authorize_solo_reintenta_colision_de_alias():
+    import main, pytest
+
+    def conn_que_falla(*errores):
+        intentos = []
+
+        class _Cur:
+            def execute(self, sql, params):
+                intentos.append(params)
+                if len(intentos) <= len(errores):
+                    raise errores[len(intentos) - 1]
+
+            def fetchone(self):
+                return ("OK", None, "A" * 16, 1, True)
+
+            def close(self):
+                pass
+
+        class _Conn:
+            def cursor(self):
+                return _Cur()
+        return _Conn(), intentos
+
+    dup = main.pyodbc.Error("23000", "[23000] Violation of UNIQUE KEY constraint (2627)")
+    conn, intentos = conn_que_falla(dup)
+    assert main._authorize_db(conn, "C59B3706")[0] == "OK" and len(intentos) == 2
+
+    for err in (main.pyodbc.Error("23000", "[23000] FOREIGN KEY constraint (547)"),
+                main.pyodbc.Error("42000", "[42000] permission denied (229)")):
+        conn, intentos = conn_que_falla(err)
+        with pytest.raises(main.pyodbc.Error):
+            main._authorize_db(conn, "C59B3706")
+        assert len(intentos) == 1
@@ -0,0 +1,47 @@
+# test/unitarios/test_wire.py
+import pytest
+import wire
+from conftest import firmar
+
+BIN = {"Accept": wire.MEDIA_TYPE}
+UID = bytes.fromhex("C59B3706")
+
+
+def test_roundtrip_verify():
+    data = wire.encode_verify(UID, "abc", b"\x01" * 32, "PUERTA-1")
+    assert wire.decode_verify(data) == (UID, "abc", b"\x01" * 32, "PUERTA-1")
+    assert wire.decode_verify(wire.encode_verify(UID, "abc", b"\x01" * 32))[3] is None
+    with pytest.raises(wire.WireError):
+        wire.decode_verify(data[:-3])
+    with pytest.raises(wire.WireError):
+        wire.decode_verify(data + b"\x00")
+
+
+@pytest.mark.parametrize("store", ["memory", "db", "signed"])
+def test_nonce_y_verify_binarios(store, monkeypatch, request):
+    monkeypatch.setenv("SESSION_STORE", store)
+    client = request.getfixturevalue("client")
+    r = client.get("/api/nonce", params={"uid": "C59B3706"}, headers=BIN)
+    assert r.headers["content-type"] == wire.MEDIA_TYPE
+    sid, nonce = wire.decode_nonce(r.content)
+    assert len(nonce) == 16
+
+    hm = bytes.fromhex(firmar(UID.hex(), nonce.hex()))
+    body = wire.encode_verify(UID, sid, hm)
+    r = client.post("/api/verify", content=body, headers={"Content-Type": wire.MEDIA_TYPE})
+    assert r.headers["content-type"] == wire.MEDIA_TYPE
+    res = wire.decode_verify_result(r.content)
+    assert res["result"] == "OK" and len(res["alias"]) == 16
+    # un solo uso
+    r = client.post("/api/verify", content=body, headers={"Content-Type": wire.MEDIA_TYPE})
+    assert wire.decode_verify_result(r.content) == {"result": "DENIED", "reason": "SESSION_INVALIDA"}
+
+
+def test_verify_binario_mal_formado(client):
+    r = client.post("/api/verify", content=b"\x01\x09", headers={"Content-Type": wire.MEDIA_TYPE})
+    assert r.status_code == 400
+
+
+def test_json_sigue_por_defecto(client):
+    assert "nonce" in client.get("/api/nonce", params={"uid": "C59B3706"}).json()
+    assert client.post("/api/verify", json={"uid": "C59B3706"}).status_code == 422
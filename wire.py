@@ -0,0 +1,125 @@
+import struct
+
+# Formato binario fijo lector <-> servidor (alternativa a JSON con hex).
+# Se negocia por cabeceras: Content-Type / Accept = MEDIA_TYPE.
+#
+#   nonce (respuesta): ver(1) | len(1) | sessionId(ascii) | nonce(16)
+#   verify (request):  ver(1) | len(1) | uid | len(1) | sessionId(ascii) | hmac(32) | len(1) | readerId
+#   verify (respuesta): ver(1) | result(1) | reason(1) | alias(8, solo si OK)
+#   allowlist:          ver(1) | version(8) | count(4) | (len(1) | uid)*   (UIDs ordenados)
+#   allowlist delta:    ver(1) | desde(8) | version(8) | altas(4) | bajas(4) | (len(1) | uid)*
+MEDIA_TYPE = "application/x-rfid-bin"
+VERSION = 1
+HMAC_LEN = 32
+
+RESULTS = {"OK": 0, "DENIED": 1, "ERROR": 2}
+REASONS = {
+    None: 0,
+    "HMAC_MALFORMADO": 1,
+    "SESSION_INVALIDA": 2,
+    "SESSION_EXPIRADA": 3,
+    "HMAC_INVALIDO": 4,
+    "NO_AUTORIZADO": 5,
+    "UID_INVALIDO": 6,
+}
+
+_RESULT = struct.Struct(">BBB")  # versión, resultado, motivo
+_ALLOWLIST = struct.Struct(">BQI")
+_DELTA = struct.Struct(">BQQII")
+
+
+class WireError(ValueError):
+    """Mensaje binario mal formado (se responde 400)"""
+
+
+def wants_binary(accept) -> bool:
+    return bool(accept) and MEDIA_TYPE in accept
+
+
+def is_binary(content_type) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == MEDIA_TYPE
+
+
+def _lp(value: bytes) -> bytes:
+    """Campo con prefijo de largo (1 byte)"""
+    if len(value) > 255:
+        raise WireError("Campo demasiado largo")
+    return bytes([len(value)]) + value
+
+
+def encode_nonce(session_id: str, nonce: bytes) -> bytes:
+    return bytes([VERSION]) + _lp(session_id.encode()) + nonce
+
+
+def decode_nonce(data: bytes):
+    if len(data) < 2 or data[0] != VERSION:
+        raise WireError("Versión desconocida")
+    n = data[1]
+    return data[2:2 + n].decode(), data[2 + n:]
+
+
+def encode_verify(uid: bytes, session_id: str, hmac_bytes: bytes, reader_id: str = "") -> bytes:
+    return (bytes([VERSION]) + _lp(uid) + _lp(session_id.encode()) + hmac_bytes
+            + _lp(reader_id.encode()))
+
+
+def decode_verify(data: bytes):
+    """-> (uid, sessionId, hmac, readerId o None)"""
+    try:
+        if data[0] != VERSION:
+            raise WireError("Versión desconocida")
+        pos = 1
+        fields = []
+        for size in (None, None, HMAC_LEN, None):
+            if size is None:
+                size = data[pos]
+                pos += 1
+            if pos + size > len(data):
+                raise WireError("Mensaje truncado")
+            fields.append(data[pos:pos + size])
+            pos += size
+    except IndexError:
+        raise WireError("Mensaje truncado")
+    if pos != len(data):
+        raise WireError("Bytes de más al final")
+    uid, sid, hm, reader = fields
+    return uid, sid.decode("ascii", "replace"), hm, (reader.decode("ascii", "replace") or None)
+
+
+def encode_verify_result(res: dict) -> bytes:
+    out = _RESULT.pack(VERSION, RESULTS.get(res["result"], RESULTS["ERROR"]),
+                       REASONS.get(res.get("reason"), 0))
+    if res["result"] == "OK":
+        out += bytes.fromhex(res["alias"])
+    return out
+
+
+def decode_verify_result(data: bytes) -> dict:
+    result = {v: k for k, v in RESULTS.items()}[data[1]]
+    reason = {v: k for k, v in REASONS.items()}.get(data[2])
+    if result == "OK":
+        return {"result": "OK", "alias": data[3:11].hex().upper()}
+    return {"result": result, "reason": reason}
+
+
+def _uid_list(uids) -> bytes:
+    return b"".join(_lp(bytes.fromhex(u)) for u in uids)
+
+
+def encode_allowlist(version: int, uids) -> bytes:
+    return _ALLOWLIST.pack(VERSION, version, len(uids)) + _uid_list(uids)
+
+
+def encode_allowlist_delta(since: int, version: int, added, removed) -> bytes:
+    head = _DELTA.pack(VERSION, since, version, len(added), len(removed))
+    return head + _uid_list(added) + _uid_list(removed)
+
+
+def decode_uid_list(data: bytes, count: int, pos: int = 0):
+    """-> (UIDs en hex mayúscula, posición siguiente)"""
+    out = []
+    for _ in range(count):
+        n = data[pos]
+        out.append(data[pos + 1:pos + 1 + n].hex().upper())
+        pos += 1 + n
+    return out, pos